@@ -23,8 +23,17 @@ from .statistics import *
 from .modeling import *
 from .tools import *
 from .fitting import *
+from .objectives import *
+from .multistart import *
+from .batch import *
+from .cache import *
 from .tpf import *
 from .imaging import *
 from .photometry import *
 from .mcmc import *
+from .chains import *
+from .convergence import *
+from .summaries import *
+from .joint import *
+from .noise import *
 from .utilities import *
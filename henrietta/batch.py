@@ -0,0 +1,274 @@
+'''
+This module contains tools to fit the same model to lots and lots of
+light curves, spread out over a pool of processes, writing the results
+into a table as it goes (so an interrupted run can pick up where it left off).
+'''
+
+from .imports import *
+from .multistart import _model_recipe, _rebuild_model
+from .objectives import compiled_fit, Objective
+
+import csv
+import multiprocessing
+from astropy.table import Table
+
+# each worker process keeps its own copy of the template model
+_template = None
+
+def _initialize_worker(recipe):
+    '''
+    Rebuild the template model, once per worker process.
+    '''
+    global _template
+    _template = _rebuild_model(recipe)
+
+def _fit_one(name, time, flux, flux_err, bounds, baseline_order, method, cache=None):
+    '''
+    Fit the template model to one light curve.
+    (This runs inside a worker process.)
+
+    Returns
+    -------
+    row : dict
+        The fitted parameters and some diagnostics, or (if something
+        went wrong) the error message.
+    '''
+    row = dict(name=name, status='ok', error='')
+    try:
+        # set up this target's copy of the model
+        model = _template.copy()
+        for k, b in (bounds or {}).items():
+            if len(np.atleast_1d(b)) == 2:
+                model.fixed[k] = False
+                model.bounds[k] = b
+            else:
+                model.fixed[k] = True
+            setattr(model, k, np.mean(b))
+
+        # ignore any bad data points
+        ok = np.isfinite(time) & np.isfinite(flux) & np.isfinite(flux_err)
+        time, flux, weights = time[ok], flux[ok], 1/flux_err[ok]
+
+        # fit the model (or pull the fit out of the cache)
+        if cache is None:
+            fitted = compiled_fit(model, time, flux, weights=weights, method=method, baseline_order=baseline_order)
+        else:
+            fitted = cache.fit(compiled_fit, model, time, flux, weights=weights, method=method, baseline_order=baseline_order)
+
+        # record the parameters and some diagnostics
+        for k, v in zip(fitted.param_names, fitted.parameters):
+            row[k] = v
+        # (including the polynomial baseline, if that was solved for)
+        objective = Objective(fitted, time, flux, weights=weights, baseline_order=baseline_order)
+        row['chisq'] = objective(objective.compiled.initial)
+        row['npoints'] = len(time)
+    except Exception as e:
+        row['status'] = 'failed'
+        row['error'] = '{}: {}'.format(type(e).__name__, e)
+    return row
+
+def _name_and_lightcurve(item, i):
+    '''
+    Pull a (name, LightCurve) pair out of one item in the stream.
+    '''
+    if isinstance(item, tuple):
+        return item
+    name = getattr(item, 'targetid', None)
+    if name is None:
+        name = getattr(item, 'meta', {}).get('name', None)
+    if name is None:
+        name = i
+    return '{}'.format(name), item
+
+def read_batch_results(filename):
+    '''
+    Read the results of a (finished or interrupted) batch fit.
+
+    Parameters
+    ----------
+    filename : str
+        The results file written by `batch_fit`.
+
+    Returns
+    -------
+    results : astropy.table.Table
+        A table with one row per target (the latest attempt for each).
+    '''
+    with open(filename, 'r') as f:
+        rows = list(csv.DictReader(f))
+
+    # keep only the latest row for each target
+    latest = {}
+    for row in rows:
+        latest[row['name']] = row
+    rows = list(latest.values())
+    if len(rows) == 0:
+        return Table()
+
+    # convert numbers back into numbers
+    results = Table(rows=[[row[k] for k in rows[0].keys()] for row in rows], names=list(rows[0].keys()))
+    for k in results.colnames:
+        if k not in ['name', 'status', 'error']:
+            results[k] = np.array([np.nan if v == '' else float(v) for v in results[k]])
+    return results
+
+def batch_fit(lightcurves, model,
+              filename='batch-fit-results.csv',
+              bounds={},
+              processes=None,
+              maxpending=None,
+              retries=1,
+              baseline_order=None,
+              method='Nelder-Mead',
+              cache=None,
+              table_filename=None):
+    '''
+    This function fits the same template model to lots of light curves,
+    using a pool of processes. Results are appended to a table file
+    as soon as each fit finishes, so if the run gets interrupted,
+    rerunning it will skip all the targets that were already fit.
+
+    (That running file is a CSV, because it has to grow one row at a
+    time; columnar formats like ECSV or FITS can only be written all
+    at once. For a columnar copy of the final results, with proper
+    column types, give a `table_filename`.)
+
+    Parameters
+    ----------
+    lightcurves : iterable
+        A list (or generator) of `LightCurve` objects, or of
+        (name, LightCurve) pairs. Light curves without explicit names
+        are named by their `targetid`, `meta['name']`, or position.
+
+    model : astropy.model
+        The template model to fit (for example, one made with
+        `setup_transit_model`).
+
+    filename : str
+        The results file, which will be created or appended to.
+
+    bounds : dict
+        A dictionary of {name:{parameter:bounds}}, to change the
+        template model for particular targets. As in `setup_transit_model`,
+        single values are held fixed and two-element lists are varied.
+
+    processes : int
+        How many processes should run at once? (None = one per CPU,
+        1 = don't bother with multiprocessing at all)
+
+    maxpending : int
+        At most this many light curves will be waiting in memory to be
+        fit at once. (None = twice the number of processes)
+
+    retries : int
+        How many times should we retry a fit that fails?
+
+    baseline_order : int
+        If not None, solve for a polynomial baseline exactly
+        (see `compiled_fit`).
+
+    method : str
+        Which `scipy.optimize.minimize` method should we use?
+
+    cache : FitCache
+        If not None, look up (and save) each fit in this cache.
+
+    table_filename : str
+        If not None, the final results (one row per target) also get
+        written to this file, in whatever format `astropy.table` picks
+        from its extension (like '.ecsv' or '.fits').
+
+    Returns
+    -------
+    results : astropy.table.Table
+        A table with one row per target (see `read_batch_results`).
+    '''
+
+    # figure out which targets have already been fit
+    done = set()
+    if os.path.exists(filename):
+        previous = read_batch_results(filename)
+        if len(previous) > 0:
+            done = set(previous['name'][previous['status'] == 'ok'])
+
+    # set up the columns of the results file
+    columns = ['name', 'status', 'attempts'] + list(model.param_names) + ['chisq', 'npoints', 'error']
+    new = not os.path.exists(filename) or os.path.getsize(filename) == 0
+    f = open(filename, 'a', newline='')
+    writer = csv.DictWriter(f, fieldnames=columns, extrasaction='ignore')
+    if new:
+        writer.writeheader()
+        f.flush()
+
+    # set up the processes (or just do it all here)
+    recipe = _model_recipe(model)
+    if processes == 1:
+        pool = None
+        _initialize_worker(recipe)
+    else:
+        pool = multiprocessing.Pool(processes, initializer=_initialize_worker, initargs=(recipe,))
+    if maxpending is None:
+        maxpending = 2*(processes or multiprocessing.cpu_count())
+
+    # keep track of the fits that are running, and how many tries each has had
+    pending = []
+    attempts = {}
+    stream = iter(enumerate(lightcurves))
+
+    def submit(task):
+        if pool is None:
+            return task, _fit_one(*task)
+        else:
+            return task, pool.apply_async(_fit_one, task)
+
+    def collect(job):
+        task, result = job
+        return task, (result if pool is None else result.get())
+
+    try:
+        exhausted = False
+        while (not exhausted) or (len(pending) > 0):
+
+            # fill up the queue, without reading too many light curves at once
+            while (not exhausted) and (len(pending) < maxpending):
+                try:
+                    i, item = next(stream)
+                except StopIteration:
+                    exhausted = True
+                    break
+                name, lc = _name_and_lightcurve(item, i)
+                if name in done:
+                    continue
+                task = (name,
+                        np.asarray(lc.time, dtype=float),
+                        np.asarray(lc.flux, dtype=float),
+                        np.asarray(lc.flux_err, dtype=float),
+                        bounds.get(name, {}), baseline_order, method, cache)
+                attempts[name] = 0
+                pending.append(submit(task))
+
+            if len(pending) == 0:
+                break
+
+            # wait for the oldest fit to finish
+            task, row = collect(pending.pop(0))
+            name = row['name']
+            attempts[name] += 1
+
+            # retry failures, or record the result
+            if (row['status'] == 'failed') and (attempts[name] <= retries):
+                pending.append(submit(task))
+            else:
+                row['attempts'] = attempts.pop(name)
+                writer.writerow(row)
+                f.flush()
+    finally:
+        f.close()
+        if pool is not None:
+            pool.terminate()
+
+    # write a columnar copy of the final results (if we're supposed to)
+    results = read_batch_results(filename)
+    if table_filename is not None:
+        results.write(table_filename, overwrite=True)
+    return results
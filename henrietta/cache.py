@@ -0,0 +1,278 @@
+'''
+This module contains a cache for fit results, so that refitting the
+same data with the same model and the same fitter (for example, when
+rerunning a notebook) just reads the answer back off the disk.
+'''
+
+from .imports import *
+from .objectives import hold_baseline, evaluate_baseline
+
+import json
+import time
+import hashlib
+
+class FitCache:
+    '''
+    A directory of saved fit results, each one keyed by a hash of the
+    data, the model setup, and the fitter settings.
+    '''
+
+    def __init__(self, directory='fit-cache', maxsize=100e6):
+        '''
+        Initialize a fit cache.
+
+        Parameters
+        ----------
+        directory : str
+            The directory in which cached fits will be stored.
+
+        maxsize : float
+            The maximum total size of the cache, in bytes. When it gets
+            bigger than this, the least recently used fits get deleted.
+        '''
+        self.directory = directory
+        self.maxsize = maxsize
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, model, x, y, weights=None, fitter=None, **settings):
+        '''
+        Create a hash that uniquely identifies a fit.
+
+        Parameters
+        ----------
+        model : astropy.model
+            The model to be fit (its parameters, which ones are fixed,
+            and their bounds all go into the hash).
+
+        x, y, weights : numpy.ndarray
+            The data to be fit.
+
+        fitter : object
+            The fitter (or fitting function) to be used.
+
+        **settings : dict
+            Any other settings that would change the fit result.
+
+        Returns
+        -------
+        key : str
+            A hexadecimal hash.
+        '''
+        h = hashlib.sha1()
+
+        # hash the data
+        for a in [x, y, weights]:
+            if a is None:
+                h.update(b'None')
+            else:
+                h.update(np.ascontiguousarray(a, dtype=float).tobytes())
+
+        # hash the model setup
+        description = dict(model=type(model).__name__,
+                           param_names=list(model.param_names),
+                           parameters=[repr(float(p)) for p in model.parameters],
+                           fixed={k:bool(v) for k, v in model.fixed.items()},
+                           bounds={k:repr(v) for k, v in model.bounds.items()})
+
+        # hash the fitter and its settings
+        if fitter is not None:
+            description['fitter'] = getattr(fitter, '__qualname__', type(fitter).__name__)
+        description['settings'] = {k:repr(v) for k, v in settings.items()}
+        h.update(json.dumps(description, sort_keys=True).encode())
+
+        return h.hexdigest()
+
+    def _path(self, key):
+        '''
+        Where is a particular cached fit stored?
+        '''
+        return os.path.join(self.directory, '{}.json'.format(key))
+
+    def get(self, key):
+        '''
+        Read a cached fit (or None, if it hasn't been cached).
+
+        Parameters
+        ----------
+        key : str
+            The hash that identifies the fit.
+
+        Returns
+        -------
+        entry : dict
+            A dictionary with the 'param_names', 'parameters',
+            and 'diagnostics' of the fit (and its 'baseline_coefficients',
+            if the fitter solved for a polynomial baseline).
+        '''
+        path = self._path(key)
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except (IOError, ValueError):
+            return None
+
+        # mark this fit as recently used (unless another
+        # process has just evicted it, which is fine)
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return entry
+
+    def put(self, key, entry):
+        '''
+        Store a fit in the cache.
+
+        Parameters
+        ----------
+        key : str
+            The hash that identifies the fit.
+
+        entry : dict
+            A (JSON-serializable) dictionary describing the fit.
+        '''
+
+        # write to a temporary file first, so nobody reads a half-written fit
+        path = self._path(key)
+        temporary = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temporary, 'w') as f:
+            json.dump(entry, f)
+        os.replace(temporary, path)
+
+        # make sure the cache doesn't get too big
+        self.evict()
+
+    def invalidate(self, key):
+        '''
+        Remove one fit from the cache.
+
+        Parameters
+        ----------
+        key : str
+            The hash that identifies the fit.
+        '''
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        '''
+        Remove all the fits from the cache.
+        '''
+        for key in self.keys():
+            self.invalidate(key)
+
+    def keys(self):
+        '''
+        List the keys of all the fits in the cache.
+        '''
+        return [f[:-5] for f in os.listdir(self.directory) if f.endswith('.json')]
+
+    def size(self):
+        '''
+        How big is the cache, in bytes?
+        '''
+        return np.sum([os.path.getsize(self._path(k)) for k in self.keys()])
+
+    def evict(self):
+        '''
+        Delete the least recently used fits, until the cache is small enough.
+        '''
+
+        # (other processes might be evicting at the same time, so
+        # skip any files that disappear out from under us)
+        files = []
+        for k in self.keys():
+            p = self._path(k)
+            try:
+                files.append((os.path.getmtime(p), os.path.getsize(p), p))
+            except OSError:
+                pass
+        files.sort()
+
+        total = np.sum([s for _, s, _ in files])
+        for _, s, p in files:
+            if total <= self.maxsize:
+                break
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+            total -= s
+
+    def fit(self, fitter, model, x, y, weights=None, **kw):
+        '''
+        Fit a model to data, or read the result from the cache
+        if exactly this fit has been done before.
+
+        Parameters
+        ----------
+        fitter : astropy.modeling.fitting.Fitter, or function
+            Either an astropy fitter object (like `SimplexLSQFitter()`),
+            or a function with the same inputs (like `compiled_fit`).
+
+        model : astropy.model
+            The model to fit.
+
+        x, y, weights : numpy.ndarray
+            The data to fit.
+
+        **kw : dict
+            Any extra keywords are passed to the fitter
+            (and are included in the hash).
+
+        Returns
+        -------
+        fitted : astropy.model
+            A copy of the model, with the best-fit parameters (and its
+            `.baseline_coefficients`, if the fitter solved for a baseline).
+            Its `.cache_diagnostics` describe the (original) fit.
+        '''
+
+        key = self.key(model, x, y, weights=weights, fitter=fitter, **kw)
+        entry = self.get(key)
+
+        if entry is None:
+            # do the fit, and time how long it takes
+            start = time.time()
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                fitted = fitter(model, x, y, weights=weights, **kw)
+            elapsed = time.time() - start
+
+            # calculate a weighted chi-squared for the best fit
+            # (including its polynomial baseline, if the fitter solved for one)
+            coefficients = getattr(fitted, 'baseline_coefficients', None)
+            if coefficients is None:
+                residuals = fitted(x) - y
+            else:
+                residuals = hold_baseline(fitted)(x)*evaluate_baseline(coefficients, x, x) - y
+            if weights is not None:
+                residuals = weights*residuals
+
+            entry = dict(param_names=list(fitted.param_names),
+                         parameters=[float(p) for p in fitted.parameters],
+                         diagnostics=dict(chisq=float(np.sum(residuals**2)),
+                                          npoints=len(y),
+                                          seconds=elapsed,
+                                          created=time.strftime('%Y-%m-%d %H:%M:%S')))
+            if coefficients is not None:
+                entry['baseline_coefficients'] = [float(c) for c in coefficients]
+            self.put(key, entry)
+        else:
+            # rebuild the fitted model from the cache
+            fitted = model.copy()
+            fitted.parameters = entry['parameters']
+            if 'baseline_coefficients' in entry:
+                fitted.baseline_coefficients = np.array(entry['baseline_coefficients'])
+
+        fitted.cache_diagnostics = entry['diagnostics']
+        return fitted
+
+def cached_fit(fitter, model, x, y, weights=None, directory='fit-cache', **kw):
+    '''
+    Fit a model to data, using a `FitCache` in the given directory.
+    (see `FitCache.fit`)
+    '''
+    return FitCache(directory).fit(fitter, model, x, y, weights=weights, **kw)
@@ -0,0 +1,277 @@
+'''
+This module contains a way to store MCMC chains on disk, instead of in
+memory, so really long chains don't fill up the computer's memory and
+can be picked back up if a run gets interrupted.
+'''
+
+from .imports import *
+
+import json
+from .summaries import summarize_chain
+
+class ChainBackend:
+    '''
+    An on-disk MCMC chain. Steps are appended to a binary file, in blocks,
+    as they're sampled (optionally keeping only every `thin`-th step).
+    Each saved step holds the parameters and the log probability for every
+    walker, so the file is an array with shape (nsaved, nwalkers, ndim+1).
+    A small JSON file alongside it records the shape and parameter names.
+    '''
+
+    def __init__(self, filename, nwalkers=None, ndim=None, names=None, thin=None):
+        '''
+        Create a new chain file, or open an existing one.
+
+        Parameters
+        ----------
+        filename : str
+            The file in which to store the chain (the metadata
+            will go into the same filename + '.json').
+
+        nwalkers : int
+            The number of walkers. (Needed only for a new chain.)
+
+        ndim : int
+            The number of parameters. (Needed only for a new chain.)
+
+        names : list of str
+            The names of the parameters.
+
+        thin : int
+            Only every `thin`-th step will be saved. (None = 1 for
+            a new chain, or whatever an existing chain was using.)
+        '''
+
+        self.filename = filename
+        self.metafilename = filename + '.json'
+        self.dtype = np.float64
+
+        if os.path.exists(self.metafilename):
+            # open an existing chain, and make sure it matches
+            with open(self.metafilename, 'r') as f:
+                self.meta = json.load(f)
+            for k, v in dict(nwalkers=nwalkers, ndim=ndim, thin=thin).items():
+                if (v is not None) and (v != self.meta[k]):
+                    raise ValueError('{} has {}={}, not {}.'.format(filename, k, self.meta[k], v))
+        else:
+            # start a new chain
+            if (nwalkers is None) or (ndim is None):
+                raise ValueError('A new chain needs `nwalkers` and `ndim`.')
+            self.meta = dict(nwalkers=int(nwalkers),
+                             ndim=int(ndim),
+                             names=list(names or ['p{}'.format(i) for i in range(ndim)]),
+                             thin=int(thin or 1))
+            with open(self.metafilename, 'w') as f:
+                json.dump(self.meta, f)
+            open(self.filename, 'wb').close()
+
+        self.nwalkers = self.meta['nwalkers']
+        self.ndim = self.meta['ndim']
+        self.names = self.meta['names']
+        self.thin = self.meta['thin']
+
+        # throw away any partially-written step (from a crash)
+        self.stepbytes = self.nwalkers*(self.ndim + 1)*np.dtype(self.dtype).itemsize
+        size = os.path.getsize(self.filename)
+        if size % self.stepbytes != 0:
+            with open(self.filename, 'r+b') as f:
+                f.truncate(size - size % self.stepbytes)
+
+    @property
+    def nsaved(self):
+        '''
+        How many (thinned) steps have been saved?
+        '''
+        return os.path.getsize(self.filename)//self.stepbytes
+
+    @property
+    def nsteps(self):
+        '''
+        How many steps have been sampled (including the thinned-out ones)?
+        '''
+        return self.nsaved*self.thin
+
+    def append(self, coords, lnprob):
+        '''
+        Append a block of steps to the end of the chain.
+
+        Parameters
+        ----------
+        coords : array
+            The walker positions, with shape (nsteps, nwalkers, ndim).
+
+        lnprob : array
+            The log probabilities, with shape (nsteps, nwalkers).
+        '''
+        block = np.concatenate([np.asarray(coords, dtype=self.dtype),
+                                np.asarray(lnprob, dtype=self.dtype)[:, :, np.newaxis]], axis=2)
+        with open(self.filename, 'ab') as f:
+            f.write(block.tobytes())
+
+    def memmap(self):
+        '''
+        Map the whole chain file as an (nsaved, nwalkers, ndim+1) array,
+        without reading it into memory.
+        '''
+        if self.nsaved == 0:
+            return np.zeros((0, self.nwalkers, self.ndim + 1))
+        return np.memmap(self.filename, dtype=self.dtype, mode='r',
+                         shape=(self.nsaved, self.nwalkers, self.ndim + 1))
+
+    def chunks(self, discard=0, chunksize=1000):
+        '''
+        Loop through the chain, a chunk of steps at a time.
+
+        Parameters
+        ----------
+        discard : int
+            How many (unthinned) steps to skip at the start, for burn-in.
+
+        chunksize : int
+            How many saved steps to read at once.
+
+        Yields
+        ------
+        coords : array
+            A chunk of walker positions, with shape (n, nwalkers, ndim).
+
+        lnprob : array
+            A chunk of log probabilities, with shape (n, nwalkers).
+        '''
+        mapped = self.memmap()
+        for i in range(int(np.ceil(discard/self.thin)), len(mapped), chunksize):
+            chunk = np.array(mapped[i:i + chunksize])
+            yield chunk[:, :, :-1], chunk[:, :, -1]
+
+    def last(self):
+        '''
+        The most recently saved walker positions and log probabilities
+        (for example, to resume sampling).
+        '''
+        mapped = self.memmap()
+        return np.array(mapped[-1, :, :-1]), np.array(mapped[-1, :, -1])
+
+    def get_chain(self, discard=0):
+        '''
+        The chain, as an (nwalkers, nsaved, ndim) array, like `sampler.chain`.
+        (This is a view of the file, so it's only read when it's used.)
+        '''
+        return self.memmap()[int(np.ceil(discard/self.thin)):, :, :-1].transpose(1, 0, 2)
+
+    def get_lnprob(self, discard=0):
+        '''
+        The log probabilities, as an (nwalkers, nsaved) array.
+        '''
+        return self.memmap()[int(np.ceil(discard/self.thin)):, :, -1].T
+
+    def best(self, chunksize=1000):
+        '''
+        Find the highest-probability parameters, a chunk at a time.
+
+        Returns
+        -------
+        best : array
+            The parameters with the highest log probability.
+
+        lnprob : float
+            That log probability.
+        '''
+        best, highest = None, -np.inf
+        for coords, lnprob in self.chunks(chunksize=chunksize):
+            i = np.unravel_index(np.argmax(lnprob), lnprob.shape)
+            if lnprob[i] > highest:
+                best, highest = coords[i], lnprob[i]
+        return best, highest
+
+    def summarize(self, discard=0, chunksize=1000, **kw):
+        '''
+        Summarize the chain (quantiles, most probable sample,
+        covariance, effective sample size) in one chunked pass.
+        (see `summarize_chain` for the options)
+        '''
+        mapped = self.memmap()
+        return summarize_chain(mapped[:, :, :-1], lnprob=mapped[:, :, -1], names=self.names,
+                               discard=discard, thin=self.thin, chunksize=chunksize, **kw)
+
+    def percentiles(self, q=[16., 50., 84.], discard=0, chunksize=1000, nbins=100000):
+        '''
+        Calculate percentiles of each parameter, a chunk at a time.
+
+        Parameters
+        ----------
+        q : list
+            The percentiles to calculate.
+
+        discard : int
+            How many (unthinned) steps to skip at the start, for burn-in.
+
+        chunksize : int
+            How many saved steps to read at once.
+
+        nbins : int
+            How many histogram bins to use for each parameter.
+
+        Returns
+        -------
+        percentiles : dict
+            A dictionary of {name:array of percentiles}.
+        '''
+        return self.summarize(q=q, discard=discard, chunksize=chunksize, nbins=nbins)['quantiles']
+
+def sample_to_backend(sampler, p0, nsteps, backend, blocksize=100, monitor=None):
+    '''
+    Run an emcee sampler, streaming the (thinned) chain into an
+    on-disk backend in fixed-size blocks, instead of keeping it in memory.
+    If the backend already has some steps in it, pick up where it left off.
+
+    Parameters
+    ----------
+    sampler : emcee.EnsembleSampler
+        The sampler to run.
+
+    p0 : array
+        The initial walker positions, with shape (nwalkers, ndim).
+        (Ignored, if we're resuming.)
+
+    nsteps : int
+        The total number of steps the chain should have.
+
+    backend : ChainBackend
+        The on-disk chain to write into.
+
+    blocksize : int
+        How many saved steps to hold in memory before writing them.
+
+    monitor : ConvergenceMonitor
+        If not None, check for convergence whenever a block is written,
+        and stop early once the chain has converged.
+    '''
+
+    # resume from the end of the existing chain, if there is one
+    if backend.nsaved > 0:
+        p0, _ = backend.last()
+    remaining = nsteps - backend.nsteps
+    if remaining <= 0:
+        return
+
+    coords, lnprob = [], []
+    for i, state in enumerate(sampler.sample(p0, iterations=remaining, store=False)):
+
+        # keep only every thin-th step
+        if (i + 1) % backend.thin == 0:
+            coords.append(np.array(state.coords))
+            lnprob.append(np.array(state.log_prob))
+
+        # write a block to disk, whenever it fills up
+        if len(coords) == blocksize:
+            backend.append(coords, lnprob)
+            coords, lnprob = [], []
+
+            # stop early, if the chain has converged
+            if (monitor is not None) and monitor.due(backend.nsteps):
+                if monitor.update(backend.memmap()[:, :, :-1], thin=backend.thin):
+                    return
+
+    # write whatever's left over
+    if len(coords) > 0:
+        backend.append(coords, lnprob)
@@ -0,0 +1,171 @@
+'''
+This module contains a way to watch an MCMC chain as it runs, and to
+decide when it has run long enough, from the autocorrelation time of
+each parameter (how many steps it takes a walker to "forget" where it was).
+'''
+
+from .imports import *
+from emcee.autocorr import integrated_time
+from astropy.table import Table
+
+class ConvergenceMonitor:
+    '''
+    Keep track of the autocorrelation time of a growing chain, and
+    say it has converged once the chain is many autocorrelation times
+    long and the estimate of the autocorrelation time has stopped changing.
+    '''
+
+    def __init__(self, check_every=100, ntau=50, tolerance=0.01, burnfactor=2, minsteps=0):
+        '''
+        Set up a convergence monitor.
+
+        Parameters
+        ----------
+        check_every : int
+            How many steps to wait between checks. (The autocorrelation
+            time is calculated from the whole chain, so checking much
+            more often than this just wastes time.)
+
+        ntau : float
+            The chain must be at least this many autocorrelation
+            times long, for every parameter.
+
+        tolerance : float
+            The autocorrelation times must have changed by less than this
+            fraction since the last check.
+
+        burnfactor : float
+            Once converged, discard this many (of the largest)
+            autocorrelation times at the start of the chain as burn-in.
+
+        minsteps : int
+            Never stop before this many steps.
+        '''
+        self.check_every = check_every
+        self.ntau = ntau
+        self.tolerance = tolerance
+        self.burnfactor = burnfactor
+        self.minsteps = minsteps
+
+        self.converged = False
+        self.tau = None
+        self.iterations = []
+        self.taus = []
+        self.lastcheck = 0
+
+    def due(self, iteration):
+        '''
+        Is it time for another check?
+
+        Parameters
+        ----------
+        iteration : int
+            How many steps the chain has now.
+        '''
+        return (iteration - self.lastcheck) >= self.check_every
+
+    def update(self, chain, thin=1):
+        '''
+        Estimate the autocorrelation times from the chain so far,
+        and decide whether it has converged.
+
+        Parameters
+        ----------
+        chain : array
+            The chain, with shape (nsaved, nwalkers, ndim),
+            like `sampler.get_chain()`.
+
+        thin : int
+            Only every `thin`-th step was saved in the chain.
+
+        Returns
+        -------
+        converged : bool
+            Has the chain converged?
+        '''
+
+        iteration = len(chain)*thin
+        self.lastcheck = iteration
+
+        # estimate the autocorrelation time of each parameter (in steps)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            tau = integrated_time(np.asarray(chain), tol=0, quiet=True)*thin
+
+        # has it run long enough, and has the estimate settled down?
+        long_enough = np.all(iteration > self.ntau*tau) and (iteration >= self.minsteps)
+        if self.tau is None:
+            stable = False
+        else:
+            stable = np.all(np.abs(self.tau - tau)/tau < self.tolerance)
+
+        self.iterations.append(iteration)
+        self.taus.append(tau)
+        self.tau = tau
+        self.converged = bool(long_enough and stable)
+        return self.converged
+
+    def burnin(self, nsteps):
+        '''
+        How many steps should be thrown away as burn-in? If the chain
+        converged, that's a few autocorrelation times; if not, we fall
+        back to the first 20% of the chain.
+
+        Parameters
+        ----------
+        nsteps : int
+            How many steps the chain has.
+        '''
+        if self.converged:
+            return int(np.minimum(self.burnfactor*np.max(self.tau), nsteps - 1))
+        else:
+            return int(0.2*nsteps)
+
+    def history(self, names=None):
+        '''
+        A table of the autocorrelation time estimates from every check.
+
+        Parameters
+        ----------
+        names : list of str
+            The names of the parameters.
+
+        Returns
+        -------
+        history : astropy.table.Table
+            A table with one row per check, with the number of
+            steps so far and the autocorrelation time of each parameter.
+        '''
+        history = Table()
+        history['iteration'] = np.array(self.iterations, dtype=int)
+        if len(self.taus) > 0:
+            taus = np.array(self.taus)
+            names = names or ['p{}'.format(i) for i in range(taus.shape[1])]
+            for i, name in enumerate(names):
+                history['tau_{}'.format(name)] = taus[:, i]
+        return history
+
+    def plot(self, names=None, filename=None):
+        '''
+        Plot how the autocorrelation time estimates changed as the chain grew,
+        along with the chain length / `ntau` (which they need to fall below).
+
+        Parameters
+        ----------
+        names : list of str
+            The names of the parameters.
+
+        filename : str
+            If not None, save the plot to this file.
+        '''
+        history = self.history(names=names)
+        plt.figure()
+        for k in history.colnames[1:]:
+            plt.plot(history['iteration'], history[k], marker='o', label=k[4:])
+        plt.plot(history['iteration'], history['iteration']/self.ntau, linestyle='--', color='gray',
+                 label='N/{}'.format(self.ntau))
+        plt.xlabel('Number of steps')
+        plt.ylabel(r'Autocorrelation time ($\tau$)')
+        plt.legend()
+        if filename is not None:
+            plt.savefig(filename)
@@ -6,7 +6,7 @@ try:
 except NameError:
     pass
 
-def sumofsquares(residuals):
+def sumofsquares(residuals, axis=None):
     '''
     This calculates a goodness-of-fit from an array of residuals.
     (a lower value implies a better fit)
@@ -16,15 +16,19 @@ def sumofsquares(residuals):
     residuals : `~numpy.ndarray`
         Array of values for (data-model)/sigma
 
+    axis : int
+        If not None, calculate one goodness-of-fit along this axis
+        (like for each row of a batch of residuals).
+
     Returns
     -------
     gof : float
         A single goodness-of-fit metric
         (in this case, sum of squares)
     '''
-    return np.sum(residuals**2)
+    return np.sum(residuals**2, axis=axis)
 
-def mean(residuals):
+def mean(residuals, axis=None):
     '''
     This is a goodness-of-fit function. It calculate the mean
     of the residuals.
@@ -34,15 +38,19 @@ def mean(residuals):
     residuals : array
         Array of residuals = (data - model)/sigma
 
+    axis : int
+        If not None, calculate one goodness-of-fit along this axis
+        (like for each row of a batch of residuals).
+
     Returns
     -------
     mean : float
         The mean of the residuals.
     '''
 
-    return np.mean(residuals)
+    return np.mean(residuals, axis=axis)
 
-def chisq(residuals):
+def chisq(residuals, axis=None):
     '''
     This is a goodness-of-fit function. It calculates the sum of the squares
     of the residuals. This is commonly called "chi squared".
@@ -52,13 +60,17 @@ def chisq(residuals):
     residuals : array
         Array of residuals = (data - model)/sigma
 
+    axis : int
+        If not None, calculate one goodness-of-fit along this axis
+        (like for each row of a batch of residuals).
+
     Returns
     -------
     chisq : float
         The sum of the squared residuals.
     '''
 
-    return np.sum(residuals**2)
+    return np.sum(residuals**2, axis=axis)
 
 def votes(residuals=None):
     '''
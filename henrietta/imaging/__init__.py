@@ -1,3 +1,5 @@
+from .registration import *
+
 try:
     from .simulations import *
 except ImportError:
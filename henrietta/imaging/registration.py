@@ -0,0 +1,185 @@
+'''
+Tools to measure how much each image in a sequence has shifted
+(from pointing jitter or drift), relative to a reference image.
+
+The shifts come from "phase correlation": the Fourier transform of
+a shifted image is the transform of the original, times a phase that
+depends only on the shift. So, dividing one by the other (and keeping
+only the phase) gives a sharp spike at the shift, after transforming
+back. This takes one FFT per image, no matter how many stars there are.
+
+Keeping *only* the phase gives every spatial frequency equal weight,
+including the noisiest ones, so by default we only partly flatten
+the spectrum (see `whitening` in `register_images`).
+'''
+
+from ..imports import *
+from scipy import fft
+from scipy.signal.windows import tukey
+from concurrent.futures import ThreadPoolExecutor
+
+def downsample_images(images, factor=2):
+    '''
+    Shrink images by averaging together blocks of pixels.
+
+    Parameters
+    ----------
+    images : array
+        The images, with shape (..., ny, nx).
+
+    factor : int
+        The size of the (factor x factor) blocks to average.
+        (Any leftover rows and columns at the edges get dropped.)
+
+    Returns
+    -------
+    smaller : array
+        The shrunken images, with shape (..., ny//factor, nx//factor).
+    '''
+    images = np.asarray(images, dtype=float)
+    if factor == 1:
+        return images
+    ny, nx = np.array(images.shape[-2:])//factor
+    cropped = images[..., :ny*factor, :nx*factor]
+    blocks = cropped.reshape(images.shape[:-2] + (ny, factor, nx, factor))
+    return blocks.mean(axis=(-3, -1))
+
+def _prepare(images):
+    '''
+    Get images ready for Fourier transforming, by subtracting each
+    one's median and tapering the edges down to zero (so the edges
+    of the image don't look like a big feature that never moves).
+    '''
+    ny, nx = images.shape[-2:]
+    window = tukey(ny, 0.5)[:, np.newaxis]*tukey(nx, 0.5)[np.newaxis, :]
+    median = np.median(images, axis=(-2, -1), keepdims=True)
+    return np.nan_to_num(images - median)*window
+
+def _refine_peaks(crosspower, peaks, upsample=20):
+    '''
+    Zoom in on the cross-correlation peaks, by calculating the
+    inverse Fourier transform on a finer grid of shifts (just
+    near each peak), with a matrix multiplication.
+
+    Parameters
+    ----------
+    crosspower : array
+        The normalized cross-power spectra, with shape (nframes, ny, nx).
+
+    peaks : array
+        The (y, x) shifts of the coarse peaks, with shape (nframes, 2).
+
+    upsample : int
+        Refine the shifts to 1/upsample of a pixel.
+
+    Returns
+    -------
+    shifts : array
+        The refined (y, x) shifts, with shape (nframes, 2).
+    '''
+    ny, nx = crosspower.shape[-2:]
+    size = int(np.ceil(1.5*upsample))
+    grid = (np.arange(size) - size//2)/upsample
+
+    # the inverse transform, evaluated just at shifts near each peak
+    y = peaks[:, 0, np.newaxis] + grid
+    x = peaks[:, 1, np.newaxis] + grid
+    Ey = np.exp(2j*np.pi*y[:, :, np.newaxis]*fft.fftfreq(ny)[np.newaxis, np.newaxis, :])
+    Ex = np.exp(2j*np.pi*x[:, :, np.newaxis]*fft.fftfreq(nx)[np.newaxis, np.newaxis, :])
+    zoomed = np.abs(Ey @ crosspower @ np.swapaxes(Ex, 1, 2))
+
+    # pick the biggest point in each zoomed-in grid
+    best = np.argmax(zoomed.reshape(len(zoomed), -1), axis=1)
+    j, m = np.unravel_index(best, (size, size))
+    return np.stack([y[np.arange(len(y)), j], x[np.arange(len(x)), m]], -1)
+
+def _register_chunk(images, reference_fft, upsample=20, whitening=0.5):
+    '''
+    Measure the shifts of a chunk of (prepared) images, relative
+    to the Fourier transform of a (prepared) reference image.
+    Returns the (y, x) shifts, with shape (nframes, 2).
+    '''
+    ny, nx = images.shape[-2:]
+
+    # the (flattened) cross-power spectrum, for every image at once
+    crosspower = fft.fft2(images, axes=(-2, -1))*np.conj(reference_fft)
+    crosspower /= np.maximum(np.abs(crosspower), 1e-30)**whitening
+
+    # find the (whole pixel) peak of the cross-correlation
+    correlation = np.abs(fft.ifft2(crosspower, axes=(-2, -1)))
+    best = np.argmax(correlation.reshape(len(images), -1), axis=1)
+    peaks = np.stack(np.unravel_index(best, (ny, nx)), -1).astype(float)
+
+    # (shifts bigger than half the image wrap around to negative)
+    peaks = np.where(peaks > np.array([ny, nx])//2, peaks - np.array([ny, nx]), peaks)
+
+    if upsample > 1:
+        return _refine_peaks(crosspower, peaks, upsample=upsample)
+    else:
+        return peaks
+
+def register_images(cube, reference=0, upsample=20, downsample=1, whitening=0.5,
+                    chunksize=10, threads=None):
+    '''
+    Measure the (x, y) shift of every image in a stack,
+    relative to a reference image, by phase correlation.
+
+    Parameters
+    ----------
+    cube : array
+        The images, with shape (nframes, ny, nx).
+
+    reference : int or array
+        Either the index of the image to use as the reference,
+        or a reference image itself, with shape (ny, nx).
+
+    upsample : int
+        Measure the shifts to 1/upsample of a pixel.
+        (1 = whole pixels only.)
+
+    downsample : int
+        Shrink the images by this factor before comparing them, which is
+        faster (and can be less noisy), but less precise.
+
+    whitening : float
+        How much to flatten the cross-power spectrum, as the power of its
+        amplitude to divide by. 1 = pure phase correlation (sharpest peaks),
+        0 = plain cross-correlation. In between (the default, 0.5) gives the
+        most precise shifts for noisy images of stars.
+
+    chunksize : int
+        How many images to Fourier transform at a time.
+
+    threads : int
+        How many chunks to work on at once? (None = one per CPU,
+        1 = just do one chunk at a time.)
+
+    Returns
+    -------
+    offsets : array
+        The (x, y) shift of each image, with shape (nframes, 2), in pixels.
+        A star at (x, y) in the reference image will be at roughly
+        (x + dx, y + dy) in each image, so these can go straight into
+        `extract_photometry(..., offsets=offsets)`.
+    '''
+    cube = np.asarray(cube)
+    if np.ndim(reference) == 0:
+        reference = cube[reference]
+
+    # transform the reference just once
+    reference_fft = fft.fft2(_prepare(downsample_images(reference, downsample)))
+
+    def measure(start):
+        images = _prepare(downsample_images(cube[start:start + chunksize], downsample))
+        return _register_chunk(images, reference_fft, upsample=upsample, whitening=whitening)
+
+    # measure the chunks of images (spread out over some threads)
+    starts = range(0, len(cube), chunksize)
+    if threads == 1:
+        shifts = [measure(start) for start in starts]
+    else:
+        with ThreadPoolExecutor(threads or os.cpu_count()) as pool:
+            shifts = list(pool.map(measure, starts))
+
+    # switch from (y, x) to (x, y), in the original pixels
+    return np.concatenate(shifts)[:, ::-1]*downsample
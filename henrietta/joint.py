@@ -0,0 +1,289 @@
+'''
+This module contains tools to fit several light curves of the same planet
+at once (for example, Kepler long cadence, Kepler short cadence, and TESS),
+with some parameters (like the radius) shared between all of them, and
+others (like the baseline or the limb darkening) different for each.
+'''
+
+from .imports import *
+from .mcmc import TransitLikelihood, find_mode, _run_sampler
+from .multistart import _model_recipe, _rebuild_model
+from .objectives import hold_baseline
+from .summaries import summarize_chain
+
+class JointLikelihood:
+    '''
+    The combined log probability of several light curves. Each dataset
+    gets its own `TransitLikelihood` (with its model compiled once, for
+    its own times and exposure length), and a map of which of the joint
+    parameters go into that dataset's model.
+
+    Like `TransitLikelihood`, calling it with an (nwalkers, ndim) array
+    scores all the walkers at once, one batch per dataset.
+    '''
+
+    def __init__(self, datasets, shared=['period', 't0', 'radius', 'a', 'b'], baseline_order=None, gp=False):
+        '''
+        Set up a joint likelihood.
+
+        Parameters
+        ----------
+        datasets : dict
+            A dictionary of {name:(model, lc)}, or of
+            {name:dict(model=model, lc=lc, supersample=..., exptime=...)},
+            with one astropy model (see `setup_transit_model`) and one
+            LightCurve for each dataset. Long-cadence data should be
+            given a `supersample` (like 30) and an `exptime` (in days).
+
+        shared : list of str
+            The names of the parameters that are the same for every dataset.
+            Any other free parameter is separate for each dataset, and
+            will be called "{parameter}_{name}" (like "ld1_tess").
+
+        baseline_order : int
+            If not None, marginalize over a polynomial baseline of this
+            order for each dataset (see `TransitLikelihood`).
+
+        gp : bool
+            If True, model correlated noise in every dataset with a
+            Gaussian process (see `TransitLikelihood`). Each dataset gets
+            its own noise parameters (like "gp_log_sigma_tess"), unless
+            they're listed in `shared`. (A dataset given as a dict can
+            also turn this on or off just for itself, with `gp=...`.)
+        '''
+
+        self.names = list(datasets.keys())
+        self.shared = list(shared)
+        self.baseline_order = baseline_order
+
+        self.likelihoods = {}
+        self.recipes = {}
+        self.maps = {}
+        self.free_names = []
+        bounds = []
+        for name in self.names:
+
+            # set up this dataset's likelihood (and compiled model)
+            d = datasets[name]
+            if isinstance(d, dict):
+                d = dict(d)
+                model, lc = d.pop('model'), d.pop('lc')
+            else:
+                (model, lc), d = d, {}
+            d.setdefault('gp', gp)
+            likelihood = TransitLikelihood(model, lc, baseline_order=baseline_order, **d)
+            self.likelihoods[name] = likelihood
+
+            # (keep a picklable recipe for the model, so this can go to other processes)
+            if baseline_order is not None:
+                model = hold_baseline(model)
+            self.recipes[name] = _model_recipe(model)
+
+            # figure out where each of its free parameters sits in the joint parameters
+            indices = []
+            for k, (lower, upper) in zip(likelihood.free_names, likelihood.bounds):
+                joint_name = k if k in self.shared else '{}_{}'.format(k, name)
+                if joint_name in self.free_names:
+                    # (shared parameters must be within everyone's bounds)
+                    j = self.free_names.index(joint_name)
+                    bounds[j] = [np.maximum(bounds[j][0], lower), np.minimum(bounds[j][1], upper)]
+                else:
+                    self.free_names.append(joint_name)
+                    bounds.append([lower, upper])
+                indices.append(self.free_names.index(joint_name))
+            self.maps[name] = np.array(indices, dtype=int)
+
+        self.bounds = np.array(bounds, dtype=float).reshape(-1, 2)
+        self.ndim = len(self.free_names)
+
+    def split(self, theta):
+        '''
+        Split one set of joint parameters into the free
+        parameters of each dataset's model.
+
+        Parameters
+        ----------
+        theta : array
+            The joint parameters.
+
+        Returns
+        -------
+        thetas : dict
+            A dictionary of {name:free parameters for that dataset}.
+        '''
+        return {name:np.asarray(theta)[..., self.maps[name]] for name in self.names}
+
+    def models(self, theta):
+        '''
+        Make astropy models for every dataset, from one set of joint parameters.
+
+        Parameters
+        ----------
+        theta : array
+            The joint parameters.
+
+        Returns
+        -------
+        models : dict
+            A dictionary of {name:astropy model}. (If the baseline was
+            marginalized over, these have `baseline` fixed at 1.)
+        '''
+        models = {}
+        for name, t in self.split(theta).items():
+            likelihood = self.likelihoods[name]
+            models[name] = likelihood.compiled.update(_rebuild_model(self.recipes[name]), t[:likelihood.nmodel])
+        return models
+
+    def __call__(self, theta):
+        '''
+        Calculate the joint log probability for one set of parameters
+        (ndim,), or for a whole ensemble of walkers (nwalkers, ndim).
+        '''
+        single = np.ndim(theta) == 1
+        thetas = np.atleast_2d(theta)
+
+        # add up the datasets (skipping walkers that are already impossible)
+        lnp = np.zeros(len(thetas))
+        for name in self.names:
+            ok = np.isfinite(lnp)
+            if not np.any(ok):
+                break
+            lnp[ok] += self.likelihoods[name](thetas[ok][:, self.maps[name]])
+
+        if single:
+            return lnp[0]
+        else:
+            return lnp
+
+def joint_fit(joint, nguesses=1000, maxiter=5000):
+    '''
+    Find the best joint parameters for several light curves at once
+    (checking lots of guesses, and then polishing the best one with
+    a simplex optimizer; see `find_mode`).
+
+    Parameters
+    ----------
+    joint : JointLikelihood
+        The joint likelihood to maximize.
+
+    nguesses : int
+        How many random guesses should we check?
+
+    maxiter : int
+        The most iterations the simplex optimizer can take.
+
+    Returns
+    -------
+    best : dict
+        A dictionary of {parameter:best value}, for the joint parameters.
+
+    models : dict
+        A dictionary of {name:astropy model}, with the best fit for each dataset.
+    '''
+    theta, _ = find_mode(joint, nguesses=nguesses, maxiter=maxiter)
+    return dict(zip(joint.free_names, theta)), joint.models(theta)
+
+class JointResults:
+    '''
+    The results of a `joint_mcmc_fit`. Like `MCMCResults`, these can
+    be unpacked as `max_likelihood, sampler = joint_mcmc_fit(...)`.
+    '''
+
+    def __init__(self, joint, sampler, burnin, backend=None, monitor=None):
+        '''
+        Parameters
+        ----------
+        joint : JointLikelihood
+            The joint likelihood that was sampled.
+
+        sampler : emcee.EnsembleSampler
+            The sampler, after it has been run.
+
+        burnin : int
+            How many steps at the start of the chain to ignore.
+
+        backend : ChainBackend
+            If the chain was streamed to disk, the on-disk chain.
+
+        monitor : ConvergenceMonitor
+            If we watched the chain for convergence, the monitor.
+        '''
+        self.joint = joint
+        self.sampler = sampler
+        self.burnin = burnin
+        self.backend = backend
+        self.monitor = monitor
+        self.variable_names = joint.free_names
+
+        # summarize the chain, after burn-in
+        if backend is None:
+            self.summary = summarize_chain(sampler.get_chain(), lnprob=sampler.get_log_prob(),
+                                           names=self.variable_names, discard=burnin)
+        else:
+            self.summary = backend.summarize(discard=burnin)
+        self.max_likelihood = self.summary['quantiles']
+
+        # make a model for each dataset, at the median parameters
+        self.models = joint.models([self.max_likelihood[k][1] for k in self.variable_names])
+
+    def __iter__(self):
+        return iter((self.max_likelihood, self.sampler))
+
+    def plot_models(self, filename=None):
+        '''
+        Plot each dataset, with its model (at the median parameters).
+        '''
+        names = self.joint.names
+        fig, ax = plt.subplots(len(names), 1, figsize=(8, 3*len(names)), squeeze=False)
+        for a, name in zip(ax[:, 0], names):
+            likelihood = self.joint.likelihoods[name]
+            theta = self.joint.split([self.max_likelihood[k][1] for k in self.variable_names])[name]
+            model, _ = likelihood.models(likelihood.full(np.atleast_2d(theta)))
+            a.errorbar(likelihood.time, likelihood.flux, likelihood.flux_err,
+                       linewidth=0, elinewidth=1, marker='.', alpha=0.5, color='gray')
+            a.plot(likelihood.time, model[0], color='b')
+            a.set_title(name)
+        plt.tight_layout()
+        if filename is not None:
+            plt.savefig(filename)
+        return fig
+
+def joint_mcmc_fit(datasets, shared=['period', 't0', 'radius', 'a', 'b'], nsteps=10000,
+                   baseline_order=None, gp=False, **kw):
+    '''
+    Run an MCMC on several light curves at once, with
+    some parameters shared between them.
+
+    Parameters
+    ----------
+    datasets : dict
+        A dictionary of {name:(model, lc)} (see `JointLikelihood`).
+        The light curves should already be folded and normalized.
+
+    shared : list of str
+        The names of the parameters that are the same for every dataset.
+
+    nsteps : int
+        How many steps to run (at most, if there's a `monitor`).
+
+    baseline_order : int
+        If not None, marginalize over a polynomial baseline
+        of this order for each dataset.
+
+    gp : bool
+        If True, model correlated noise in each dataset
+        with a Gaussian process (see `JointLikelihood`).
+
+    **kw : dict
+        Any other keywords (like `processes`, `backend`, `monitor`, or
+        `initialize`) are used just as they are in `mcmc_fit`.
+
+    Returns
+    -------
+    results : JointResults
+        The results (with the `max_likelihood` dictionary,
+        the `sampler`, a `summary`, and the best `models`).
+    '''
+    joint = JointLikelihood(datasets, shared=shared, baseline_order=baseline_order, gp=gp)
+    sampler, backend, monitor, burnin = _run_sampler(joint, nsteps, **kw)
+    return JointResults(joint, sampler, burnin, backend=backend, monitor=monitor)
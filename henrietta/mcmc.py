@@ -4,6 +4,13 @@ import emcee
 import batman
 import corner as triangle
 import matplotlib.pyplot as plt
+import multiprocessing
+from scipy.optimize import minimize
+from .objectives import CompiledModel, hold_baseline, linear_baseline, evaluate_baseline
+from .chains import ChainBackend, sample_to_backend
+from .convergence import ConvergenceMonitor
+from .summaries import summarize_chain
+from .noise import ExponentialGP
 
 """
 
@@ -13,206 +20,977 @@ to fit those parameters and create a maximum likelihood model.
 
 """
 
-def lnprob(params, astropy_model, lc):
+class TransitLikelihood:
 
     """
-    Determine which parameters are variable, and set their value to the
-    current parameter value in the chain.
+    A Gaussian log-probability for a transit model and a light curve,
+    which can be handed straight to emcee. Everything that doesn't change
+    from step to step (which parameters are free and where they sit in
+    the model, which data points are good, the inverse variances, and the
+    normalization of the likelihood) gets figured out once, up front.
+
+    Calling it with an (nwalkers, ndim) array (as emcee does with
+    `vectorize=True`) scores all the walkers at once.
     -----------
     """
-    n = len(astropy_model.param_names)
 
-    i = 0
-    for k in astropy_model.param_names:
-        if astropy_model.fixed[k] == False:
-            for m in range(n):
-                if astropy_model.param_names[m] == str(k):
-                    astropy_model.parameters[m] = params[i]
-                    i += 1
+    def __init__(self, astropy_model, lc, baseline_order=None, supersample=1, exptime=0.0,
+                 gp=False, gp_bounds={'log_sigma':[np.log(1e-6), np.log(1e-1)],
+                                      'log_tau':[np.log(1e-3), np.log(10.0)]}):
+
+        """
+        Parameters
+        ----------
+
+        astropy_model: An 'astropy model' object (or a `CompiledModel`
+            that was made for `lc.time`)
+            The model, whose free parameters will be sampled.
+
+        lc: LightCurve object
+            The light curve to compare to the model.
+
+        baseline_order: int
+            If None, the baseline is treated like any other parameter.
+            Otherwise, the model's baseline is held at 1, and a polynomial
+            baseline of that order is marginalized over analytically.
+
+        supersample, exptime: int, float
+            To account for long exposures, calculate the model at `supersample`
+            times spread across each exposure of length `exptime` (in days),
+            and average them. (see `CompiledModel`)
+
+        gp: bool
+            If True, replace the white-noise chi-squared with a
+            correlated-noise Gaussian process likelihood (see
+            `noise.ExponentialGP`), whose two parameters (the log of its
+            standard deviation and the log of its timescale, in days)
+            get sampled along with the others, as `gp_log_sigma` and `gp_log_tau`.
+
+        gp_bounds: dict
+            The bounds for `log_sigma` and `log_tau`.
+        -----------
+        """
+
+        # pull out the good data points
+        time = np.asarray(lc.time, dtype=float)
+        flux = np.asarray(lc.flux, dtype=float)
+        flux_err = np.asarray(lc.flux_err, dtype=float)
+        self.mask = np.isfinite(time) & np.isfinite(flux) & np.isfinite(flux_err)
+        self.time, self.flux, self.flux_err = time[self.mask], flux[self.mask], flux_err[self.mask]
+
+        # precompute the inverse variances, and the normalization
+        self.inverse_variance = 1.0/self.flux_err**2
+        self.lnnorm = -0.5*np.sum(np.log(2*np.pi*self.flux_err**2))
+
+        # compile the model (only at the good times)
+        if isinstance(astropy_model, CompiledModel):
+            self.compiled = astropy_model
+            self.modelmask = self.mask
+        else:
+            if baseline_order is not None:
+                astropy_model = hold_baseline(astropy_model)
+            self.compiled = CompiledModel(astropy_model, self.time, supersample=supersample, exptime=exptime)
+            self.modelmask = slice(None)
+        self.baseline_order = baseline_order
+
+        # keep track of which parameters are free, and where some parameters are
+        self.free_names = self.compiled.free_names
+        self.nmodel = len(self.free_names)
+        self.bounds = self.compiled.bounds
+
+        # add the noise parameters, if we're using a Gaussian process
+        if gp:
+            if baseline_order is not None:
+                raise ValueError("The baseline can't be marginalized over with correlated noise; sample `baseline` instead.")
+            self.gp = ExponentialGP(self.time, self.flux_err)
+            self.free_names = self.free_names + ['gp_log_sigma', 'gp_log_tau']
+            self.bounds = np.vstack([self.bounds, [gp_bounds['log_sigma'], gp_bounds['log_tau']]])
+        else:
+            self.gp = None
+        self.ndim = len(self.free_names)
+        self.index = {k:i for i, k in enumerate(self.compiled.param_names)}
+        self.tmin, self.tmax = self.time.min(), self.time.max()
+
+    def full(self, thetas):
+
+        """
+        Fill an (nwalkers, ndim) array of free parameters into an
+        (nwalkers, nparameters) array of all the model parameters,
+        nudging `a` out of the star if it's inside `b`.
+        ------------
+        """
+        parameters = self.compiled.full(np.asarray(thetas)[:, :self.nmodel])
+
+        if ('a' in self.index) and ('b' in self.index):
+            a, b = self.index['a'], self.index['b']
+            inside = parameters[:, a] <= parameters[:, b]
+            parameters[inside, a] = parameters[inside, b] + 0.01
+        return parameters
+
+    def physical(self, parameters):
+
+        """
+        Which rows of an (nwalkers, nparameters) array are allowed?
+        ------------
+        """
+        ok = np.ones(len(parameters), dtype=bool)
+        for k, lower, upper in [('radius', 0.0, 1.0),
+                                ('t0', self.tmin, self.tmax),
+                                ('a', 1.0, 200.0)]:
+            if k in self.index:
+                values = parameters[:, self.index[k]]
+                ok &= (lower <= values) & (values <= upper)
+        return ok
+
+    def models(self, parameters):
+
+        """
+        Calculate the model (including any marginalized baseline) for an
+        (nwalkers, nparameters) array, and the log-determinant needed to
+        marginalize over the baseline. All the walkers' models get
+        calculated together (see `CompiledModel.evaluate_many`; a batman
+        transit still gets calculated once per walker, inside it).
+        ------------
+        """
+        models = self.compiled.evaluate_many(parameters)[:, self.modelmask]
+
+        logdet = np.zeros(len(parameters))
+        if self.baseline_order is not None:
+            _, baseline, logdet = linear_baseline(models, self.time, self.flux,
+                                                  weights=1/self.flux_err,
+                                                  order=self.baseline_order)
+            models = models*baseline
+        return models, logdet
+
+    def __call__(self, theta):
+
+        """
+        Calculate the log probability for one set of free parameters
+        (ndim,), or for a whole ensemble of walkers (nwalkers, ndim).
+        ------------
+        """
+        single = np.ndim(theta) == 1
+        thetas = np.atleast_2d(theta)
+
+        lnp = np.full(len(thetas), -np.inf)
+        parameters = self.full(thetas)
+        ok = self.physical(parameters)
+        if self.gp is None:
+            if np.any(ok):
+                models, logdet = self.models(parameters[ok])
+                chisq = np.sum((self.flux - models)**2*self.inverse_variance, axis=1)
+                lnp[ok] = self.lnnorm - 0.5*chisq - 0.5*logdet
+        else:
+            # (the noise parameters have to stay within their bounds)
+            noise = thetas[:, self.nmodel:]
+            ok &= np.all((noise >= self.bounds[self.nmodel:, 0]) & (noise <= self.bounds[self.nmodel:, 1]), axis=1)
+            if np.any(ok):
+                models, _ = self.models(parameters[ok])
+                lnp[ok] = [self.gp.lnlikelihood(self.flux - m, np.exp(logsigma), np.exp(logtau))
+                           for m, (logsigma, logtau) in zip(models, noise[ok])]
+
+        if single:
+            return lnp[0]
+        else:
+            return lnp
+
+# each worker process keeps its own copy of the likelihood
+_likelihood = None
+
+def _initialize_worker(likelihood):
 
-    if (astropy_model.a <= astropy_model.b):
-        astropy_model.a = astropy_model.b + 0.01
+    """
+    Store a copy of the likelihood, once per worker process.
+    -----------
+    """
+    global _likelihood
+    _likelihood = likelihood
+
+def _worker_lnprob(thetas):
 
     """
-    Create the new model and calculate the log probability for a Gaussian
-    likelihood.
-    ------------
+    Score a chunk of walkers with this worker's copy of the likelihood.
+    -----------
     """
-    model = astropy_model(lc.time)
+    return _likelihood(thetas)
 
-    if (0.0 <= astropy_model.radius <= 1.0) and (lc.time[0] <= astropy_model.t0 <= lc.time[-1] ) and (1.0 <= astropy_model.a <= 200.0 ):
-        chisq = np.nansum((lc.flux - model)**2/(lc.flux_err)**2)
-        lnp = np.nansum(1/np.sqrt(2*np.pi*(lc.flux_err))) - 0.5*chisq
+class PooledLikelihood:
 
-        return lnp
+    """
+    A wrapper that splits an ensemble of walkers into chunks and scores
+    them in parallel, in a pool of processes. The likelihood (which holds
+    only plain arrays, not LightCurve or astropy model objects) gets sent
+    to each worker just once, when the pool is created, and each worker
+    keeps its own compiled copy of the model.
+    -----------
+    """
 
-    return -np.inf
+    def __init__(self, likelihood, processes=None, pool=None):
+
+        """
+        Parameters
+        ----------
+
+        likelihood: TransitLikelihood
+            The likelihood to be calculated.
+
+        processes: int
+            How many processes to use? (None = one per CPU, or
+            the number of workers in `pool`)
+
+        pool: a pool object with a `.map` method
+            An existing pool to use, instead of creating a new one. (It
+            doesn't know about our workers, so the likelihood gets sent
+            along with every chunk.) The walkers get split into one chunk
+            per worker, so if the pool doesn't say how many workers it has
+            (like a `multiprocessing.Pool` does), `processes` is needed too.
+        -----------
+        """
+        if pool is None:
+            self.processes = processes or multiprocessing.cpu_count()
+            self.pool = multiprocessing.Pool(self.processes,
+                                             initializer=_initialize_worker,
+                                             initargs=(likelihood,))
+            self.function = _worker_lnprob
+            self.owner = True
+        else:
+            self.processes = processes or getattr(pool, '_processes', None)
+            if not self.processes:
+                raise ValueError("Please say how many workers the pool has, with `processes`.")
+            self.pool = pool
+            self.function = likelihood
+            self.owner = False
+        self.ndim = likelihood.ndim
+
+    def __call__(self, thetas):
+
+        """
+        Calculate the log probability for an (nwalkers, ndim) array.
+        -----------
+        """
+        chunks = np.array_split(np.atleast_2d(thetas), self.processes)
+        return np.concatenate(self.pool.map(self.function, chunks))
+
+    def close(self):
+
+        """
+        Shut down the pool (if we made it).
+        -----------
+        """
+        if self.owner:
+            self.pool.terminate()
+
+def lnprob(params, astropy_model, lc, baseline_order=None):
 
-def mcmc_fit(astropy_model, lc, nsteps = 10000, saveplots=False):
+    """
+    Calculate the log probability of one set of parameters.
 
-    '''
-    This function will employ a Markov-Chain Monte Carlo to fit any number
-    of free parameters to an exoplanet transit light curve.
+    (This sets up a new `TransitLikelihood` every time it's called,
+    so inside an MCMC it's much faster to use a `TransitLikelihood`.)
+    -----------
+    """
+    return TransitLikelihood(astropy_model, lc, baseline_order=baseline_order)(params)
+
+def find_mode(likelihood, nguesses=1000, polish=True, maxiter=2000):
 
+    """
+    Find the most probable parameters: check a big batch of random
+    guesses from within the bounds all at once (like `guessncheck`),
+    and then polish the best one with a simplex (Nelder-Mead) optimizer.
 
     Parameters
     ----------
 
-    lc: LightCurve object
-        This is a `lightkurve`-style LightCurve object, which contains
-        the attributes `lc.time` (times in JD) and `lc.flux` (the brightness
-        of the star), as well as lots of methods for analysis and plotting.
+    likelihood: TransitLikelihood
+        The likelihood to maximize.
 
-    astropy_model: An 'astropy model' object
-        This model obect contains all the model parameters, their names,
-        and their bounds if they are free parameters. It interfaces
-        with a custom model to generate the function of interest,
-        which is a BATMAN light curve model in this case.
+    nguesses: int
+        How many random guesses should we check?
+
+    polish: bool
+        Should we polish the best guess with a simplex optimizer?
+
+    maxiter: int
+        The most iterations the simplex optimizer can take.
 
 
     Returns
     -------
 
-    max_likelihood: A dictionary
-        This dictionary contains the names of the variable parameters,
-        as well as a 3-element list of the maximum likelihood value,
-        and +/- 1 sigma uncertainties.
+    mode: array
+        The free parameters with the highest log probability.
 
-    sampler: EnsembleSampler Object
-        This object has several capabilities. In this MCMC, it is primarily
-        used to run the emcee function and give us access to sample parameter
-        values generated by the Monte Carlo.
+    lnp: float
+        The log probability there.
+    -----------
+    """
 
-    '''
+    # check lots of guesses at once
+    guesses = np.random.uniform(likelihood.bounds[:, 0], likelihood.bounds[:, 1], (nguesses, likelihood.ndim))
+    lnps = likelihood(guesses)
+    best = np.argmax(lnps)
+    mode, lnp = guesses[best], lnps[best]
+
+    # polish the best one
+    if polish:
+        result = minimize(lambda theta: -likelihood(theta), mode, method='Nelder-Mead',
+                          options=dict(maxiter=maxiter, xatol=1e-8, fatol=1e-8))
+        if -result.fun > lnp:
+            mode, lnp = result.x, -result.fun
+
+    return mode, lnp
+
+def local_covariance(likelihood, mode, relstep=1e-4):
 
     """
-    First, check that the lc object is normalized and folded. If not,
-    fold and normalize it.
+    Estimate the covariance of the posterior near its mode, from
+    the (finite-difference) curvature of the log probability there.
+    All the points needed for the curvature are scored in one batch.
+
+    Parameters
     ----------
-    """
 
-    fold_check = input(["Is your light curve folded? (y/n)"])
+    likelihood: TransitLikelihood
+        The likelihood.
 
-    if fold_check == "n":
-        lc = lc.fold(period = astropy_model.period.value)
-        print("That's okay, I did it for you")
+    mode: array
+        The most probable free parameters (see `find_mode`).
 
-    norm_check = input(["Is your light curve normalized? (y/n)"])
+    relstep: float
+        The finite-difference step, as a fraction of the width of each
+        parameter's bounds.
 
-    if norm_check == "n":
-        lc = lc.normalize()
-        print("Do I have to do everything?")
+
+    Returns
+    -------
+
+    covariance: array
+        An (ndim, ndim) covariance matrix, or None if the curvature
+        couldn't be measured (for example, if the mode sits right
+        on the edge of what's allowed).
+    -----------
+    """
+
+    ndim = len(mode)
+    steps = relstep*(likelihood.bounds[:, 1] - likelihood.bounds[:, 0])
+    E = np.diag(steps)
+
+    # all the points we need for central differences
+    points = [mode]
+    for i in range(ndim):
+        points += [mode + E[i], mode - E[i]]
+    pairs = [(i, j) for i in range(ndim) for j in range(i + 1, ndim)]
+    for i, j in pairs:
+        points += [mode + E[i] + E[j], mode + E[i] - E[j], mode - E[i] + E[j], mode - E[i] - E[j]]
+    values = likelihood(np.array(points))
+    if not np.all(np.isfinite(values)):
+        return None
+
+    # fill in the Hessian of the log probability
+    hessian = np.zeros((ndim, ndim))
+    for i in range(ndim):
+        hessian[i, i] = (values[1 + 2*i] - 2*values[0] + values[2 + 2*i])/steps[i]**2
+    for k, (i, j) in enumerate(pairs):
+        pp, pm, mp, mm = values[1 + 2*ndim + 4*k:5 + 2*ndim + 4*k]
+        hessian[i, j] = hessian[j, i] = (pp - pm - mp + mm)/(4*steps[i]*steps[j])
+
+    # the covariance is the inverse of the (negative) curvature
+    try:
+        covariance = np.linalg.inv(-hessian)
+        np.linalg.cholesky(covariance)
+    except np.linalg.LinAlgError:
+        return None
+    return covariance
+
+def initialize_walkers(likelihood, nwalkers, method='mode', nguesses=1000, scale=1.0, fallback=1e-3):
 
     """
-    Determine the names of all variable parameters, so that we can use
-    these names later.
+    Pick starting positions for the walkers.
+
+    Parameters
     ----------
+
+    likelihood: TransitLikelihood
+        The likelihood that will be sampled.
+
+    nwalkers: int
+        How many walkers?
+
+    method: str
+        'uniform' scatters the walkers over the whole box of bounds.
+        'mode' finds the most probable parameters (see `find_mode`),
+        and starts the walkers in a tight ball around them, shaped
+        by the local covariance (see `local_covariance`), so much less
+        of the chain is wasted on burn-in.
+
+    nguesses: int
+        How many random guesses to check, when looking for the mode.
+
+    scale: float
+        Multiply the width of the ball by this.
+
+    fallback: float
+        If the covariance can't be measured, make the ball this
+        fraction of the width of each parameter's bounds.
+
+
+    Returns
+    -------
+
+    p0: array
+        The starting positions, with shape (nwalkers, ndim).
+    -----------
     """
 
-    variable_names = []
-    i = 0
-    for k in astropy_model.param_names:
-        if astropy_model.fixed[k] == False:
-            variable_names.append(str(k))
-            i += 1
+    lower, upper = likelihood.bounds[:, 0], likelihood.bounds[:, 1]
+    if method == 'uniform':
+        return np.random.uniform(lower, upper, (nwalkers, likelihood.ndim))
+    elif method != 'mode':
+        raise ValueError("`method` must be 'mode' or 'uniform', not {}".format(method))
+
+    # find the mode, and how wide the posterior is there
+    mode, _ = find_mode(likelihood, nguesses=nguesses)
+    covariance = local_covariance(likelihood, mode)
+    if covariance is None:
+        covariance = np.diag((fallback*(upper - lower))**2)
+    covariance = covariance*scale**2
+
+    # draw walkers in a ball around the mode, redrawing any that land somewhere impossible
+    p0 = np.random.multivariate_normal(mode, covariance, nwalkers)
+    for attempt in range(100):
+        bad = ~np.isfinite(likelihood(p0))
+        if not np.any(bad):
+            break
+        p0[bad] = np.random.multivariate_normal(mode, covariance, np.sum(bad))
+    else:
+        # (shrink any stubborn ones right down onto the mode)
+        p0[bad] = mode + 1e-6*(p0[bad] - mode)
+    return p0
+
+class MCMCResults:
 
     """
-    Create an organized parameter dictionary so that we can easily
-    populate some initial parameter values, and then define an array
-    of these initial values, to be input into emcee.
-    ----------
+    The results of an `mcmc_fit`, which hold onto the sampler and the
+    data so that figures can be made whenever (and if ever) they're needed.
+
+    For backwards compatibility, this can be unpacked like the old output:
+        max_likelihood, sampler = mcmc_fit(...)
+    -----------
     """
 
-    organized = dict(period = astropy_model.period, t0 = astropy_model.t0,
-                 radius = astropy_model.radius, a = astropy_model.a,
-                 b = astropy_model.b, baseline = astropy_model.baseline,
-                 ld1 = astropy_model.ld1, ld2 = astropy_model.ld2)
+    def __init__(self, astropy_model, lc, likelihood, sampler, burnin, backend=None, monitor=None):
+
+        """
+        Parameters
+        ----------
+
+        astropy_model: An 'astropy model' object
+            The model that was fit.
+
+        lc: LightCurve object
+            The (folded/normalized) light curve that was fit.
+
+        likelihood: TransitLikelihood
+            The likelihood that was sampled.
+
+        sampler: EnsembleSampler Object
+            The sampler, after it has been run.
+
+        burnin: int
+            How many steps at the start of the chain to ignore.
+
+        backend: ChainBackend
+            If the chain was streamed to disk, the on-disk chain.
+
+        monitor: ConvergenceMonitor
+            If we watched the chain for convergence, the monitor
+            (with the history of autocorrelation times).
+        -----------
+        """
+
+        self.lc = lc
+        self.likelihood = likelihood
+        self.sampler = sampler
+        self.burnin = burnin
+        self.backend = backend
+        self.monitor = monitor
+        self.variable_names = likelihood.free_names
+        self.baseline_order = likelihood.baseline_order
+
+        """
+        Summarize the chain after burn-in (in one pass, a chunk at a time),
+        and populate the max_likelihood dictionary with the percentiles.
+        ----------
+        """
+
+        if backend is None:
+            self.summary = summarize_chain(sampler.get_chain(), lnprob=sampler.get_log_prob(),
+                                           names=self.variable_names, discard=burnin)
+        else:
+            self.summary = backend.summarize(discard=burnin)
+        self.max_likelihood = self.summary['quantiles']
+
+        """
+        Set a copy of the model parameters to the maximum likelihood values.
+        ----------
+        """
+
+        self.astropy_model = astropy_model.copy()
+        if self.baseline_order is not None:
+            self.astropy_model = hold_baseline(self.astropy_model)
+        likelihood.compiled.update(self.astropy_model, [self.max_likelihood[k][1] for k in likelihood.compiled.free_names])
+
+    def __iter__(self):
+        return iter((self.max_likelihood, self.sampler))
+
+    @property
+    def chain(self):
+
+        """
+        The chain, as an (nwalkers, nsteps, ndim) array. (If it's on disk,
+        this is a view of the file, which is only read when it's used.)
+        ----------
+        """
+        if self.backend is None:
+            return self.sampler.chain
+        else:
+            return self.backend.get_chain()
+
+    @property
+    def samples(self):
+
+        """
+        The samples after burn-in, flattened into an (nsamples, ndim) array.
+        ----------
+        """
+        if self.backend is None:
+            return self.sampler.chain[:, self.burnin:, :].reshape((-1, len(self.variable_names)))
+        else:
+            return np.array(self.backend.get_chain(discard=self.burnin)).reshape((-1, len(self.variable_names)))
+
+    @property
+    def diagnostics(self):
+
+        """
+        A dictionary describing how the run went: how many steps it took,
+        how many were burn-in, and (if we watched for convergence) whether
+        it converged and the last autocorrelation time of each parameter.
+        ----------
+        """
+        nsteps = self.sampler.iteration if self.backend is None else self.backend.nsteps
+        diagnostics = dict(nsteps=nsteps, burnin=self.burnin, ess=self.summary['ess'])
+        if self.monitor is not None:
+            diagnostics['converged'] = self.monitor.converged
+            if self.monitor.tau is not None:
+                diagnostics['tau'] = dict(zip(self.variable_names, self.monitor.tau))
+        return diagnostics
+
+    def best_model(self, time=None):
+
+        """
+        Calculate the maximum likelihood model (including any
+        marginalized baseline).
+
+        Parameters
+        ----------
+
+        time: array
+            The times at which to calculate the model. (None = the
+            light curve times.) Any baseline is still solved for on
+            the light curve itself, and then extended to these times.
+        ----------
+        """
+        data_model = self.astropy_model(self.lc.time)
+        if time is None:
+            best_model = data_model
+        else:
+            best_model = self.astropy_model(np.asarray(time, dtype=float))
+        if self.baseline_order is not None:
+            coefficients, _, _ = linear_baseline(data_model, self.lc.time, self.lc.flux, weights=1/self.lc.flux_err, order=self.baseline_order)
+            if time is None:
+                time = self.lc.time
+            best_model = best_model*evaluate_baseline(coefficients, time, self.lc.time)
+        return best_model
+
+    def draw_samples(self, ndraws=200):
+
+        """
+        Pick some random samples from the chain after burn-in
+        (reading only those samples, if the chain is on disk).
+        ----------
+        """
+        if self.backend is None:
+            chain = self.sampler.get_chain(discard=self.burnin)
+        else:
+            chain = self.backend.memmap()[int(np.ceil(self.burnin/self.backend.thin)):, :, :-1]
+        steps = np.sort(np.random.randint(0, chain.shape[0], ndraws))
+        walkers = np.random.randint(0, chain.shape[1], ndraws)
+        return np.array(chain[steps, walkers])
+
+    def predictive_bands(self, ndraws=200, time=None, npoints=500, q=[2.5, 16., 50., 84., 97.5]):
+
+        """
+        Calculate posterior-predictive bands: the model for lots of random
+        samples from the chain, all at once on a grid of times, and then
+        the percentiles of those models at each time.
+
+        Parameters
+        ----------
+
+        ndraws: int
+            How many samples should we draw from the chain?
+
+        time: array
+            The times at which to calculate the models.
+            (None = `npoints` evenly spaced times across the light curve)
+
+        npoints: int
+            How many times to use, if `time` isn't given.
+
+        q: list
+            The percentiles to calculate at each time.
+
+
+        Returns
+        -------
+
+        time: array
+            The times.
+
+        bands: array
+            The percentiles of the models, with shape (len(q), len(time)).
+        ----------
+        """
+
+        likelihood = self.likelihood
+        if time is None:
+            time = np.linspace(likelihood.time.min(), likelihood.time.max(), npoints)
+        time = np.asarray(time, dtype=float)
+
+        # fill the samples into full parameter arrays
+        parameters = likelihood.full(self.draw_samples(ndraws))
+
+        # calculate the models on the grid (for all the samples together)
+        models = CompiledModel(self.astropy_model, time).evaluate_many(parameters)
+
+        # include the best baseline for each sample (solved for on the data)
+        if self.baseline_order is not None:
+            data_models = likelihood.compiled.evaluate_many(parameters)[:, likelihood.modelmask]
+            coefficients, _, _ = linear_baseline(data_models, likelihood.time, likelihood.flux,
+                                                 weights=1/likelihood.flux_err, order=self.baseline_order)
+            models = models*evaluate_baseline(coefficients, time, likelihood.time)
+
+        return time, np.percentile(models, q, axis=0)
+
+    def plot_walkers(self, filename=None):
+
+        """
+        Plot each free parameter value as a function of the step in the
+        chain each walker is at. This will show us whether or not
+        parameters are converging, and at which values.
+        ----------
+        """
+        ndim = len(self.variable_names)
+        fig,ax = plt.subplots(ndim, 1, sharex=True, figsize=(8, 9), squeeze=False)
+        ax = ax[:, 0]
+        for j in range(ndim):
+            ax[j].plot(self.chain[:, :, j].T, color="k", alpha=0.4)
+            ax[j].set_ylabel(self.variable_names[j])
+        ax[-1].set_xlabel('Steps')
+        if filename is not None:
+            plt.savefig(filename)
+        return fig
+
+    def plot_corner(self, filename=None):
+
+        """
+        Set up a corner plot, which will show us contour plots for each pair
+        of parameters.
+        ----------
+        """
+        ndim = len(self.variable_names)
+        fig, axes = plt.subplots(ndim, ndim, figsize=(13,13))
+        triangle.corner(self.samples, bins=20, labels=self.variable_names,
+                          max_n_ticks=3,plot_contours=True,quantiles=[0.16,0.5,0.84],fig=fig,
+                          show_titles=True,verbose=True,range=None)
+        if filename is not None:
+            plt.savefig(filename)
+        return fig
+
+    def plot_model(self, filename=None, bands=True, ndraws=200):
+
+        """
+        Produce a plot of the data with the best fit model
+        (and, if `bands` is True, the 1- and 2-sigma
+        posterior-predictive bands from `ndraws` samples).
+        ----------
+        """
+        fig = plt.figure()
+        self.lc.errorbar(ax=plt.gca(), alpha= 0.5,zorder=0,label='Data')
+        if bands:
+            time, band = self.predictive_bands(ndraws=ndraws, q=[2.5, 16., 84., 97.5])
+            plt.fill_between(time, band[0], band[3], color='b', alpha=0.15, zorder=50, linewidth=0)
+            plt.fill_between(time, band[1], band[2], color='b', alpha=0.3, zorder=50, linewidth=0,
+                             label='Posterior Predictive (1 and 2 sigma)')
+        plt.plot(self.lc.time,self.best_model(),zorder=100,
+                    label='Maximum Likelihood Model',
+                    color='b')
+        plt.title('Light Curve with Maximum Likelihood Model')
+        plt.legend()
+        if filename is not None:
+            plt.savefig(filename)
+        return fig
+
+    def plot(self, saveplots=False):
+
+        """
+        Make all three of the walker, corner, and best-fit model plots
+        (and save them to PDFs, if `saveplots` is True).
+        ----------
+        """
+        names = ['walker_plot.pdf', 'corner_plot.pdf', 'Best-fit-model.pdf']
+        if not saveplots:
+            names = [None, None, None]
+        self.plot_walkers(names[0])
+        self.plot_corner(names[1])
+        self.plot_model(names[2])
+
+def _run_sampler(likelihood, nsteps, nwalkers=100, vectorize=True, processes=None, pool=None,
+                 backend=None, thin=None, blocksize=100, monitor=None, initialize='mode'):
 
-    ndim, nwalkers, nsteps = i, 100, nsteps
-    burnin = int(0.2*nsteps)
+    """
+    Start the walkers and run an emcee sampler on a likelihood (anything
+    with `ndim`, `free_names`, and `bounds` that scores an (nwalkers, ndim)
+    array at once), in memory or into a backend, serially or in a pool,
+    and (optionally) stopping once it has converged. (see `mcmc_fit`)
 
-    param_initial = []
-    for k in astropy_model.param_names:
-        if organized[k].fixed == False:
-            bounds = organized[k].bounds
-            organized[k].initialwalkers = np.random.uniform(bounds[0],bounds[1],nwalkers)
-            param_initial.append(organized[k].initialwalkers)
+    Returns
+    -------
 
-    p0 = np.transpose(param_initial)
+    sampler: EnsembleSampler Object
+        The sampler, after it has been run.
 
+    backend: ChainBackend
+        The on-disk chain (or None).
+
+    monitor: ConvergenceMonitor
+        The convergence monitor (or None).
+
+    burnin: int
+        How many steps at the start of the chain to ignore.
+    -----------
     """
-    Create a sampler object and run the MCMC.
+
+    """
+    Pick the initial positions of the walkers (either in a ball
+    around the mode, or uniformly within the bounds of each
+    variable parameter).
     ----------
     """
 
-    sampler = emcee.EnsembleSampler(nwalkers, ndim, lnprob, args=[astropy_model, lc])
-    result = sampler.run_mcmc(p0, nsteps)
+    ndim = likelihood.ndim
+
+    if isinstance(backend, str):
+        backend = ChainBackend(backend, nwalkers=nwalkers, ndim=ndim, names=likelihood.free_names, thin=thin)
 
-    samples = sampler.chain[:, burnin:, :].reshape((-1, ndim))
+    if (backend is not None) and (backend.nsaved > 0):
+        # (we're resuming, so the walkers start where they left off)
+        p0 = None
+    else:
+        p0 = initialize_walkers(likelihood, nwalkers, method=initialize)
 
     """
-    Set up the max_likelihood dictionary and populate it with the sample
-    results. Then, plot each free parameter value as a function of the
-    step in the chain each walker is at. This will show us whether or not
-    parameters are converging, and at which values.
+    Create a sampler object and run the MCMC.
     ----------
     """
 
-    max_likelihood = {}
+    if monitor is True:
+        monitor = ConvergenceMonitor()
+
+    def run(sampler):
+        if backend is not None:
+            sample_to_backend(sampler, p0, nsteps, backend, blocksize=blocksize, monitor=monitor)
+        elif monitor is None:
+            sampler.run_mcmc(p0, nsteps)
+        else:
+            # check the autocorrelation times every so often, and stop once converged
+            for state in sampler.sample(p0, iterations=nsteps):
+                if monitor.due(sampler.iteration) and monitor.update(sampler.get_chain()):
+                    break
+
+    if (pool is None) and ((processes or multiprocessing.cpu_count()) == 1):
+        sampler = emcee.EnsembleSampler(nwalkers, ndim, likelihood, vectorize=vectorize)
+        run(sampler)
+    else:
+        pooled = PooledLikelihood(likelihood, processes=processes, pool=pool)
+        try:
+            sampler = emcee.EnsembleSampler(nwalkers, ndim, pooled, vectorize=True)
+            run(sampler)
+        finally:
+            pooled.close()
+
+    """
+    Decide how much of the chain to throw away as burn-in
+    (from the autocorrelation times, if we were watching them).
+    ----------
+    """
+
+    nsteps = sampler.iteration if backend is None else backend.nsteps
+    if monitor is None:
+        burnin = int(0.2*nsteps)
+    else:
+        burnin = monitor.burnin(nsteps)
+
+    return sampler, backend, monitor, burnin
+
+def mcmc_fit(astropy_model, lc, nsteps = 10000, saveplots=False, baseline_order=None, vectorize=True,
+             processes=None, pool=None, folded=True, normalized=True, plot=False,
+             backend=None, thin=None, blocksize=100, monitor=None, initialize='mode', gp=False):
+
+    '''
+    This function will employ a Markov-Chain Monte Carlo to fit any number
+    of free parameters to an exoplanet transit light curve.
+
+
+    Parameters
+    ----------
+
+    lc: LightCurve object
+        This is a `lightkurve`-style LightCurve object, which contains
+        the attributes `lc.time` (times in JD) and `lc.flux` (the brightness
+        of the star), as well as lots of methods for analysis and plotting.
+
+    astropy_model: An 'astropy model' object
+        This model obect contains all the model parameters, their names,
+        and their bounds if they are free parameters. It interfaces
+        with a custom model to generate the function of interest,
+        which is a BATMAN light curve model in this case.
 
-    fig,ax = plt.subplots(i, 1, sharex=True, figsize=(8, 9))
-    for j in range(i):
-        param_samples = sampler.flatchain[int(nsteps*nwalkers/i):,j]
-        max_likelihood[variable_names[j]] = np.percentile(param_samples, [16., 50., 84.])
+    baseline_order: int
+        If None, the baseline is sampled like any other parameter.
+        Otherwise, a polynomial baseline of this order (0 = constant)
+        is marginalized over analytically at every step, so the
+        walkers only have to explore the nonlinear parameters.
 
-        ax[j].plot(sampler.chain[:, :, j].T, color="k", alpha=0.4)
-        ax[j].set_ylabel(variable_names[j])
-        if j == i-1:
-            ax[j].set_xlabel('Steps')
-    if saveplots == True:
-        plt.savefig('walker_plot.pdf', clobber=True)
+    vectorize: bool
+        Should all the walkers be scored together, in one batch?
+        (This only matters if we're not using multiple processes.)
+
+    processes: int
+        How many processes should score walkers in parallel?
+        (None = one per CPU, 1 = don't use multiprocessing)
+
+    pool: a pool object with a `.map` method
+        An existing pool of workers to use. (The walkers get split
+        into one chunk per worker; if the pool doesn't say how many
+        workers it has, give that as `processes`.)
+
+    folded: bool
+        Is the light curve already folded? If not, fold it.
+
+    normalized: bool
+        Is the light curve already normalized? If not, normalize it.
+
+    plot: bool
+        Should we make the walker, corner, and best-fit plots right away?
+        (They can always be made later, from the results.)
+
+    saveplots: bool
+        If we're plotting, should we save the plots to PDFs?
+
+    backend: str, or ChainBackend
+        If not None, stream the chain to this file (or ChainBackend)
+        instead of keeping it in memory. If the file already has some
+        of the chain in it, the run picks up where it left off.
+
+    thin: int
+        If streaming to a backend, save only every `thin`-th step.
+        (None = 1 for a new chain, or whatever an existing chain used.
+        Resuming a chain with a different `thin` raises a ValueError.)
+
+    blocksize: int
+        If streaming to a backend, write this many saved steps at once.
+
+    monitor: bool, or ConvergenceMonitor
+        If not None, keep an eye on the autocorrelation times as the
+        chain runs, stop as soon as it has converged (so `nsteps` becomes
+        the most steps we'll take), and pick the burn-in from the
+        autocorrelation times. `True` uses a default `ConvergenceMonitor`.
+        (With a backend, convergence is checked whenever a block is written.)
+
+    initialize: str
+        How should the walkers start? 'mode' starts them in a tight ball
+        around the most probable parameters; 'uniform' scatters them
+        over the whole box of bounds. (see `initialize_walkers`)
+
+    gp: bool
+        If True, model correlated noise with a linear-time Gaussian
+        process, instead of assuming white noise. (see `TransitLikelihood`)
+
+
+    Returns
+    -------
+
+    results: MCMCResults
+        The results, which contain (among other things)...
+
+        max_likelihood: A dictionary
+            This dictionary contains the names of the variable parameters,
+            as well as a 3-element list of the maximum likelihood value,
+            and +/- 1 sigma uncertainties.
+
+        sampler: EnsembleSampler Object
+            This object has several capabilities. In this MCMC, it is primarily
+            used to run the emcee function and give us access to sample parameter
+            values generated by the Monte Carlo.
+
+        summary: A dictionary
+            The quantiles, most probable sample, covariance, and
+            effective sample size of the chain after burn-in
+            (see `summarize_chain`).
+
+        ...and methods to make plots. They can be unpacked like
+        `max_likelihood, sampler = mcmc_fit(...)`
+
+    '''
 
     """
-    Set up a corner plot, which will show us contour plots for each pair
-    of parameters.
+    First, if the lc object isn't normalized and folded,
+    fold and normalize it.
     ----------
     """
 
-    ndim = i
-    labels = variable_names
+    if not folded:
+        lc = lc.fold(period = astropy_model.period.value)
+
+    if not normalized:
+        lc = lc.normalize()
 
-    fig, axes = plt.subplots(ndim, ndim, figsize=(13,13))
-    triangle.corner(samples, bins=20, labels=labels,
-                      max_n_ticks=3,plot_contours=True,quantiles=[0.16,0.5,0.84],fig=fig,
-                      show_titles=True,verbose=True,range=None)
+    """
+    Set up the likelihood, which figures out which parameters are
+    variable (and takes the baseline out of them, if we're solving for it).
+    ----------
+    """
 
-    if saveplots == True:
-        plt.savefig('corner_plot.pdf', clobber=True)
+    likelihood = TransitLikelihood(astropy_model, lc, baseline_order=baseline_order, gp=gp)
 
     """
-    Finally, set the model parameters to the maximum likelihood values and
-    produce a plot of the data with that best fit model.
+    Pick the initial positions of the walkers, and run the MCMC.
     ----------
     """
 
-    n = len(astropy_model.param_names)
-    i = 0
-    for k in astropy_model.param_names:
-        if astropy_model.fixed[k] == False:
-            for m in range(n):
-                if astropy_model.param_names[m] == str(k):
-                    astropy_model.parameters[m] = max_likelihood[k][1]
-                    i += 1
+    sampler, backend, monitor, burnin = _run_sampler(likelihood, nsteps, vectorize=vectorize,
+                                                     processes=processes, pool=pool,
+                                                     backend=backend, thin=thin, blocksize=blocksize,
+                                                     monitor=monitor, initialize=initialize)
 
-    plt.figure()
-    lc.errorbar(alpha= 0.5,zorder=0,label='Data')
-    plt.plot(lc.time,astropy_model(lc.time),zorder=100,
-                label='Maximum Likelihood Model',
-                color='b')
-    plt.title('Light Curve with Maximum Likelihood Model')
-    plt.legend()
+    """
+    Package up the results, and (optionally) plot them.
+    ----------
+    """
 
-    if saveplots == True:
-        plt.savefig('Best-fit-model.pdf',clobber=True)
+    results = MCMCResults(astropy_model, lc, likelihood, sampler, burnin, backend=backend, monitor=monitor)
+    if plot:
+        results.plot(saveplots=saveplots)
 
-    return max_likelihood,sampler
+    return results
@@ -0,0 +1,204 @@
+'''
+This module contains tools to fit a model starting from lots of different
+initial guesses at once, to avoid getting stuck in local minima.
+'''
+
+from .imports import *
+from .optimizers import batch_guessncheck
+from .goodnesses import sumofsquares
+from .objectives import compiled_fit, hold_baseline, linear_baseline
+
+import pickle
+import multiprocessing
+from astropy.modeling import fitting, custom_model
+from astropy.table import Table
+
+def _model_recipe(model):
+    '''
+    Pack up an astropy model into a (picklable) recipe, so that it can be
+    shipped off to another process and rebuilt there. The classes made by
+    `custom_model` can't be pickled, but the functions they wrap can be.
+
+    Parameters
+    ----------
+    model : astropy.model
+        The astropy model we want to pack up.
+
+    Returns
+    -------
+    recipe : dict
+        Everything we need to rebuild the model in another process.
+    '''
+
+    # use the model class, if it can be pickled, or the function it wraps
+    try:
+        pickle.dumps(type(model))
+        kind, ingredient = 'class', type(model)
+    except (pickle.PicklingError, AttributeError, TypeError):
+        kind, ingredient = 'function', type(model).evaluate
+
+    return dict(kind=kind,
+                ingredient=ingredient,
+                parameters=np.array(model.parameters),
+                fixed=dict(model.fixed),
+                bounds=dict(model.bounds))
+
+def _rebuild_model(recipe):
+    '''
+    Rebuild an astropy model from a recipe made by `_model_recipe`.
+
+    Parameters
+    ----------
+    recipe : dict
+        A recipe, made by `_model_recipe`.
+
+    Returns
+    -------
+    model : astropy.model
+        A fresh copy of the original model.
+    '''
+
+    # create a model from either its class or its function
+    if recipe['kind'] == 'class':
+        model = recipe['ingredient']()
+    else:
+        model = custom_model(recipe['ingredient'])()
+
+    # set the parameters, and which are fixed or bounded
+    model.parameters = recipe['parameters']
+    for k in model.param_names:
+        model.fixed[k] = recipe['fixed'][k]
+        model.bounds[k] = recipe['bounds'][k]
+    return model
+
+def _polish(recipe, start, x, y, weights, goodness, maxiter, acc, baseline_order=None):
+    '''
+    Polish one starting guess with a Simplex fitter.
+    (This runs inside a worker process.)
+    '''
+
+    # rebuild the model, and start it from this guess
+    model = _rebuild_model(recipe)
+    model.parameters = start
+
+    # run the simplex optimization, without complaining
+    if baseline_order is None:
+        fitter = fitting.SimplexLSQFitter()
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            fitted = fitter(model, x, y, weights=weights, maxiter=maxiter, acc=acc)
+    else:
+        # (solving for the baseline needs the compiled simplex)
+        fitted = compiled_fit(model, x, y, weights=weights, goodness=goodness,
+                              method='Nelder-Mead', baseline_order=baseline_order,
+                              options=dict(maxiter=maxiter, fatol=acc))
+
+    # calculate the goodness of fit for this local optimum
+    values = fitted.evaluate(x, *fitted.parameters)
+    if baseline_order is not None:
+        # (include the whole polynomial baseline, not just its constant term)
+        held = hold_baseline(fitted)
+        values = held.evaluate(x, *held.parameters)
+        _, baseline, _ = linear_baseline(values, x, y, weights=weights, order=baseline_order)
+        values = values*baseline
+    residuals = values - y
+    if weights is not None:
+        residuals = weights*residuals
+
+    return np.array(fitted.parameters), goodness(residuals)
+
+def multistart_fit(model, x, y, weights=None,
+                   nstarts=8,
+                   nguesses=1000,
+                   goodness=sumofsquares,
+                   processes=None,
+                   maxiter=1000, acc=1e-7,
+                   baseline_order=None):
+    '''
+    This function fits a model from lots of different starting points,
+    and returns the best of all the local optima it finds. The starting
+    points are the best few guesses from a big batch of guess-n-check
+    models, and each one gets polished with a `SimplexLSQFitter`, in
+    parallel, one per CPU.
+
+    Parameters
+    ----------
+    model : astropy.model
+        The astropy model we're trying to fit (for example, one made with
+        `setup_transit_model`). Its free parameters must have bounds.
+
+    x : numpy.ndarray
+        The independent values (x).
+
+    y : numpy.ndarray
+        The dependent values (y).
+
+    weights : numpy.ndarray
+        The weights to apply to each residual (usually 1/uncertainty).
+
+    nstarts : int
+        How many starting points should we polish?
+
+    nguesses : int
+        How many random guesses should we check to pick those starting points?
+
+    goodness : function
+        A goodness-of-fit function of the (weighted) residuals,
+        which should be *smaller* for better fits.
+
+    processes : int
+        How many processes should run at once? (None = one per CPU,
+        1 = don't bother with multiprocessing at all)
+
+    maxiter, acc : int, float
+        Passed to the `SimplexLSQFitter` that polishes each start.
+
+    baseline_order : int
+        If not None, take `baseline` out of the search, and solve for a
+        polynomial baseline of this order exactly for every model
+        (see `objectives.linear_baseline`).
+
+    Returns
+    -------
+    best : astropy.model
+        A copy of the model, set to the best parameters we found.
+
+    optima : astropy.table.Table
+        A table of all the local optima (one row per starting point),
+        sorted from best to worst, with a column for each free
+        parameter and one for the goodness of fit. Its spread
+        shows how rugged the goodness-of-fit landscape is.
+    '''
+
+    # pick out the most promising starting points from lots of guesses
+    guesses, _ = batch_guessncheck(model, x, y, weights=weights, N=np.maximum(nguesses, nstarts),
+                                   goodness=goodness, baseline_order=baseline_order)
+    starts = guesses[:nstarts]
+
+    # polish each start, either in a pool of processes or one by one
+    recipe = _model_recipe(model)
+    tasks = [(recipe, s, x, y, weights, goodness, maxiter, acc, baseline_order) for s in starts]
+    if processes == 1:
+        results = [_polish(*t) for t in tasks]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.starmap(_polish, tasks)
+
+    # sort the local optima from best to worst
+    parameters = np.array([r[0] for r in results])
+    gof = np.array([r[1] for r in results])
+    order = np.argsort(gof)
+    parameters, gof = parameters[order], gof[order]
+
+    # make a table of the optima, for the free parameters
+    optima = Table()
+    for w, p in enumerate(model.param_names):
+        if model.fixed[p] == False:
+            optima[p] = parameters[:, w]
+    optima[goodness.__name__] = gof
+
+    # create a copy of the model, with the best parameters
+    best = model.copy()
+    best.parameters = parameters[0]
+
+    return best, optima
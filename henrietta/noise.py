@@ -0,0 +1,172 @@
+'''
+This module contains a correlated-noise (Gaussian process) likelihood
+that takes a time proportional to the number of data points, instead
+of the number cubed, so it can be used on long light curves.
+
+The noise is modeled as white noise (the flux uncertainties) plus
+an exponentially correlated ("red") noise with a standard deviation
+`sigma` and a correlation timescale `tau`,
+
+    K(t_i, t_j) = sigma**2 * exp(-|t_i - t_j|/tau) + flux_err_i**2 (if i == j),
+
+which is the simplest of the "celerite" kernels. Because the exponential
+part is a Markov process, the inverse of its covariance matrix is
+tridiagonal, so the likelihood needs only a banded Cholesky decomposition.
+'''
+
+from .imports import *
+from scipy.linalg import cholesky_banded, cho_solve_banded
+
+import time as clock
+
+class ExponentialGP:
+    '''
+    An exponential-kernel Gaussian process, set up for a fixed
+    set of times and uncertainties.
+    '''
+
+    def __init__(self, time, flux_err, mindt=1e-10):
+        '''
+        Set up the Gaussian process.
+
+        Parameters
+        ----------
+        time : array
+            The times of the data points, in days.
+            (They don't need to be sorted.)
+
+        flux_err : array
+            The (white noise) uncertainties of the data points.
+
+        mindt : float
+            Treat any times closer together than this
+            (in days) as being this far apart.
+        '''
+        time = np.asarray(time, dtype=float)
+        self.order = np.argsort(time)
+        self.time = time[self.order]
+        self.variance = np.asarray(flux_err, dtype=float)[self.order]**2
+        self.dt = np.maximum(np.diff(self.time), mindt)
+        self.N = len(self.time)
+
+    def lnlikelihood(self, residuals, sigma, tau):
+        '''
+        Calculate the log likelihood of some residuals.
+
+        Parameters
+        ----------
+        residuals : array
+            The data minus the model (in the same order as `time`).
+
+        sigma : float
+            The standard deviation of the correlated noise.
+
+        tau : float
+            The correlation timescale of the correlated noise, in days.
+
+        Returns
+        -------
+        lnlike : float
+            The log of the Gaussian likelihood.
+        '''
+
+        r = np.asarray(residuals, dtype=float)[self.order]
+        a = sigma**2
+
+        # how correlated is each point with the one before it?
+        phi = np.exp(-self.dt/tau)
+        s = -np.expm1(-2*self.dt/tau)
+
+        # the (tridiagonal) inverse of the correlated part of the covariance
+        diagonal = np.concatenate([[1.0], 1/s])
+        diagonal[:-1] += phi**2/s
+        offdiagonal = -phi/s
+
+        # add the inverse of the white noise (for the Woodbury identity)
+        banded = np.zeros((2, self.N))
+        banded[0, 1:] = offdiagonal/a
+        banded[1] = diagonal/a + 1/self.variance
+        try:
+            cholesky = cholesky_banded(banded)
+        except np.linalg.LinAlgError:
+            return -np.inf
+
+        # solve for the chi-squared-like term
+        z = r/self.variance
+        x = cho_solve_banded((cholesky, False), z)
+        quadratic = np.sum(r*z) - np.dot(z, x)
+
+        # add up the log-determinant of the covariance
+        logdet = (self.N*np.log(a) + np.sum(np.log(s))
+                  + np.sum(np.log(self.variance))
+                  + 2*np.sum(np.log(cholesky[1])))
+
+        return -0.5*(quadratic + logdet + self.N*np.log(2*np.pi))
+
+    def covariance(self, sigma, tau):
+        '''
+        Make the full (N, N) covariance matrix (in the same order as `time`).
+        This takes a lot of memory, so it's only for checking small datasets.
+        '''
+        time = self.time[np.argsort(self.order)]
+        variance = self.variance[np.argsort(self.order)]
+        return sigma**2*np.exp(-np.abs(time[:, np.newaxis] - time[np.newaxis, :])/tau) + np.diag(variance)
+
+    def dense_lnlikelihood(self, residuals, sigma, tau):
+        '''
+        Calculate the same log likelihood as `lnlikelihood`, but the slow
+        way, with the full covariance matrix (for checking small datasets).
+        '''
+        K = self.covariance(sigma, tau)
+        _, logdet = np.linalg.slogdet(K)
+        quadratic = np.dot(residuals, np.linalg.solve(K, residuals))
+        return -0.5*(quadratic + logdet + self.N*np.log(2*np.pi))
+
+def benchmark_gp(sizes=[1e4, 1e5, 1e6], densemax=2000, repeats=3):
+    '''
+    Time the linear-time Gaussian process likelihood for different numbers
+    of data points (and the slow, dense version, for small ones).
+
+    Parameters
+    ----------
+    sizes : list
+        The numbers of data points to try.
+
+    densemax : int
+        Only time the dense version for datasets this small or smaller.
+
+    repeats : int
+        How many times to repeat each calculation?
+
+    Returns
+    -------
+    timings : astropy.table.Table
+        A table with the number of data points and the seconds per
+        likelihood for each method (NaN if it wasn't tried).
+    '''
+    from astropy.table import Table
+
+    timings = Table(names=['N', 'banded', 'dense'], dtype=[int, float, float])
+    for N in sizes:
+        N = int(N)
+        time = np.sort(np.random.uniform(0, N*2.0/60/24, N))
+        flux_err = np.full(N, 1e-3)
+        residuals = np.random.normal(0, 1e-3, N)
+        gp = ExponentialGP(time, flux_err)
+
+        start = clock.time()
+        for _ in range(repeats):
+            gp.lnlikelihood(residuals, 1e-3, 0.1)
+        banded = (clock.time() - start)/repeats
+
+        dense = np.nan
+        if N <= densemax:
+            start = clock.time()
+            for _ in range(repeats):
+                gp.dense_lnlikelihood(residuals, 1e-3, 0.1)
+            dense = (clock.time() - start)/repeats
+
+        timings.add_row([N, banded, dense])
+        print('N={:>8}: {:.4f}s banded, {}'.format(N, banded,
+              'n/a dense' if np.isnan(dense) else '{:.4f}s dense'.format(dense)))
+    return timings
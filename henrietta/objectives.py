@@ -0,0 +1,598 @@
+'''
+This module contains tools to "compile" an astropy model into a plain
+function of a flat array of its free parameters. Calling an astropy model
+checks its inputs, units, and parameter sets every time, which for short
+light curves can take longer than calculating the transit itself. These
+compiled versions skip all of that, so they're much faster to call over
+and over again inside an optimizer or an MCMC.
+'''
+
+from .imports import *
+from .modeling import BATMAN
+from .goodnesses import sumofsquares
+
+import time
+import inspect
+import scipy.optimize
+
+try:
+    import batman
+except ImportError:
+    pass
+
+class BatmanCache:
+    '''
+    A batman transit model that's set up once for a fixed array of times,
+    and then just recalculated for new parameters. (The `BATMAN` function
+    sets up a brand new batman.TransitModel every time it is called.)
+    '''
+
+    def __init__(self, t):
+        '''
+        Initialize the cache.
+
+        Parameters
+        ----------
+        t : array
+            An array of times, in units of days.
+        '''
+        self.t = np.asarray(t, dtype=float)
+        self.params = None
+        self.model = None
+
+    def __call__(self, period=1.0, t0=0, radius=0.1, a=10.0, b=0.0,
+                       baseline=1.0, ld1=0.1, ld2=0.3):
+        '''
+        Calculate a transit model, with the same inputs as `BATMAN`.
+        '''
+
+        return self.light_curve(period, t0, radius, a, np.arccos(b/a)*180/np.pi, ld1, ld2)*baseline
+
+    def light_curve(self, period, t0, radius, a, inc, ld1, ld2):
+        '''
+        Calculate a transit model (with a baseline of 1), for an
+        inclination in degrees.
+        '''
+
+        # create the batman parameters and model only once
+        if self.params is None:
+            self.params = batman.TransitParams()
+            self.params.ecc = 0.
+            self.params.w = 90.
+            self.params.limb_dark = "quadratic"
+
+        # update the parameters
+        self.params.t0 = t0
+        self.params.per = period
+        self.params.rp = radius
+        self.params.a = a
+        self.params.inc = inc
+        self.params.u = [ld1, ld2]
+
+        # (batman figures out its integration step size when it's created)
+        if self.model is None:
+            self.model = batman.TransitModel(self.params, self.t)
+
+        return self.model.light_curve(self.params)
+
+    def batch(self, parameters):
+        '''
+        Calculate transit models for an (N, 8) array of parameters, in the
+        same order as the inputs to `BATMAN`. (batman itself can only do one
+        set of parameters at a time, so it still gets called once per row,
+        but the inclinations and baselines get worked out all at once.)
+        '''
+        period, t0, radius, a, b, baseline, ld1, ld2 = np.atleast_2d(parameters).T
+        inc = np.arccos(b/a)*180/np.pi
+        models = np.empty((len(inc), len(self.t)))
+        for i in range(len(inc)):
+            models[i] = self.light_curve(period[i], t0[i], radius[i], a[i], inc[i], ld1[i], ld2[i])
+        return models*baseline[:, np.newaxis]
+
+    def __getstate__(self):
+        '''
+        Only the times need to get pickled; each copy rebuilds its own model.
+        '''
+        return dict(t=self.t, params=None, model=None)
+
+class CompiledModel:
+    '''
+    A compiled version of an astropy model, for a fixed array of x values,
+    that can be called with a flat array of just its free parameters.
+    '''
+
+    def __init__(self, model, x, supersample=1, exptime=0.0):
+        '''
+        Compile an astropy model.
+
+        Parameters
+        ----------
+        model : astropy.model
+            An astropy model (for example, one made with `setup_transit_model`).
+            Its fixed parameters stay at their current values.
+
+        x : numpy.ndarray
+            The independent values (x) at which the model will be calculated.
+
+        supersample : int
+            If more than 1, calculate the model at this many evenly spaced
+            times within each exposure, and average them (to account for
+            long exposures smearing out the transit).
+
+        exptime : float
+            The length of each exposure, in the same units as x.
+        '''
+
+        # keep track of all the parameters
+        self.param_names = list(model.param_names)
+        self.parameters = np.array(model.parameters, dtype=float)
+
+        # figure out where the free parameters sit in the full parameter array
+        self.free_names = [p for p in self.param_names if model.fixed[p] == False]
+        self.free_index = np.array([self.param_names.index(p) for p in self.free_names], dtype=int)
+
+        # store the bounds of the free parameters (None = unbounded)
+        self.bounds = np.array([[-np.inf if lo is None else lo,
+                                 np.inf if hi is None else hi]
+                                for lo, hi in [model.bounds[p] for p in self.free_names]],
+                               dtype=float).reshape(-1, 2)
+
+        # the free parameters start at the model's current values
+        self.initial = self.parameters[self.free_index]
+
+        # keep track of the x values (and the finer grid within each exposure)
+        self.x = np.asarray(x, dtype=float)
+        self.supersample = int(supersample)
+        if self.supersample > 1:
+            offsets = exptime*((np.arange(self.supersample) + 0.5)/self.supersample - 0.5)
+            self.xfine = (self.x[:, np.newaxis] + offsets[np.newaxis, :]).flatten()
+        else:
+            self.xfine = self.x
+
+        # skip straight to the function underneath the astropy model
+        self.evaluate = type(model).evaluate
+        if self.evaluate is BATMAN:
+            self.evaluate = BatmanCache(self.xfine)
+            self.fast = True
+        else:
+            self.fast = False
+
+    @property
+    def ndim(self):
+        '''
+        How many free parameters are there?
+        '''
+        return len(self.free_names)
+
+    def full(self, theta):
+        '''
+        Fill a flat array of free parameters into the full parameter array.
+
+        Parameters
+        ----------
+        theta : array
+            The values of the free parameters (or an (N, ndim) array of them).
+
+        Returns
+        -------
+        parameters : array
+            The values of all the model parameters (or an (N, nparameters) array).
+        '''
+        theta = np.asarray(theta, dtype=float)
+        parameters = np.tile(self.parameters, theta.shape[:-1] + (1,))
+        parameters[..., self.free_index] = theta
+        return parameters
+
+    def evaluate_full(self, parameters):
+        '''
+        Calculate the model, for an array of all the parameters.
+        '''
+        if self.fast:
+            values = self.evaluate(*parameters)
+        else:
+            values = self.evaluate(self.xfine, *parameters)
+
+        # average over each exposure, if we're supersampling
+        if self.supersample > 1:
+            values = values.reshape(len(self.x), self.supersample).mean(axis=1)
+        return values
+
+    def evaluate_many(self, parameters):
+        '''
+        Calculate the model for an (N, nparameters) array of all the
+        parameters, returning an (N, len(x)) array of model values.
+
+        Most astropy models' functions work on arrays of parameters, so
+        they get called just once, for every row at once. (A batman transit
+        can only be calculated for one set of parameters at a time, so
+        it gets called once per row; see `BatmanCache.batch`.)
+        '''
+        parameters = np.atleast_2d(parameters)
+        if self.fast:
+            values = self.evaluate.batch(parameters)
+        else:
+            values = self.evaluate(self.xfine[np.newaxis, :], *parameters.T[:, :, np.newaxis])
+            values = np.broadcast_to(values, (len(parameters), len(self.xfine)))
+
+        # average over each exposure, if we're supersampling
+        if self.supersample > 1:
+            values = values.reshape(len(parameters), len(self.x), self.supersample).mean(axis=-1)
+        return values
+
+    def __call__(self, theta):
+        '''
+        Calculate the model, for an array of only the free parameters.
+        '''
+        return self.evaluate_full(self.full(theta))
+
+    def batch(self, thetas):
+        '''
+        Calculate the model for lots of sets of free parameters at once.
+
+        Parameters
+        ----------
+        thetas : array
+            An (N, ndim) array of free parameter sets.
+
+        Returns
+        -------
+        models : array
+            An (N, len(x)) array of model values.
+        '''
+        return self.evaluate_many(self.full(np.atleast_2d(thetas)))
+
+    def update(self, model, theta):
+        '''
+        Copy a flat array of free parameters back into an astropy model.
+
+        Parameters
+        ----------
+        model : astropy.model
+            The astropy model to update.
+
+        theta : array
+            The values of the free parameters.
+
+        Returns
+        -------
+        model : astropy.model
+            The same model, with its parameters updated.
+        '''
+        model.parameters = self.full(theta)
+        return model
+
+def hold_baseline(model):
+    '''
+    Make a copy of a model whose multiplicative `baseline` is held fixed
+    at 1, so the baseline can be solved for separately (see `linear_baseline`).
+
+    Parameters
+    ----------
+    model : astropy.model
+        An astropy model with a `baseline` parameter.
+
+    Returns
+    -------
+    held : astropy.model
+        A copy of the model, with `baseline` fixed to 1.
+    '''
+    if 'baseline' not in model.param_names:
+        raise ValueError("{} has no `baseline` parameter to solve for.".format(model.name))
+    held = model.copy()
+    held.baseline = 1.0
+    held.fixed['baseline'] = True
+    return held
+
+def _baseline_powers(x, xfit, order):
+    '''
+    The powers of (x - mean(xfit))/(half the span of xfit), up to `order`,
+    which the polynomial baseline is built from.
+    '''
+    xfit = np.asarray(xfit, dtype=float)
+    span = np.ptp(xfit)/2.0 or 1.0
+    return ((np.asarray(x, dtype=float) - np.mean(xfit))/span)[:, np.newaxis]**np.arange(order + 1)
+
+def evaluate_baseline(coefficients, x, xfit):
+    '''
+    Calculate polynomial baselines (from `linear_baseline`) at new x values.
+
+    Parameters
+    ----------
+    coefficients : numpy.ndarray
+        The polynomial coefficients, or an (N, order+1) array of them.
+
+    x : numpy.ndarray
+        The x values at which to calculate the baselines.
+
+    xfit : numpy.ndarray
+        The x values the baselines were fit to (which set the scaling).
+
+    Returns
+    -------
+    baselines : numpy.ndarray
+        The baseline at each x (for each set of coefficients).
+    '''
+    coefficients = np.asarray(coefficients, dtype=float)
+    powers = _baseline_powers(x, xfit, coefficients.shape[-1] - 1)
+    return np.dot(coefficients, powers.T)
+
+def linear_baseline(models, x, y, weights=None, order=0):
+    '''
+    Solve for the best multiplicative baseline for one or more models,
+    in closed form (with weighted linear least squares). The baseline
+    is a polynomial in time, so `order=0` is a constant `baseline`.
+
+    Parameters
+    ----------
+    models : numpy.ndarray
+        A model (with baseline=1), or an (N, len(x)) array of models.
+
+    x : numpy.ndarray
+        The independent values (x).
+
+    y : numpy.ndarray
+        The dependent values (y).
+
+    weights : numpy.ndarray
+        The weights to apply to each residual (usually 1/uncertainty).
+
+    order : int
+        The order of the polynomial baseline.
+
+    Returns
+    -------
+    coefficients : numpy.ndarray
+        The best polynomial coefficients, for powers of
+        (x - mean(x))/(half the span of x), lowest order first.
+
+    baselines : numpy.ndarray
+        The best baseline, at each x, for each model.
+        (The best fit is `models*baselines`.)
+
+    logdet : numpy.ndarray
+        The log-determinant of the (weighted) normal matrix, which
+        is needed to marginalize over the coefficients (rather than
+        just picking the best ones).
+    '''
+
+    single = np.ndim(models) == 1
+    models = np.atleast_2d(models)
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+
+    # set up the polynomial in a nicely scaled time
+    powers = _baseline_powers(x, x, order)
+
+    # figure out the weights, ignoring any bad data
+    w2 = np.ones_like(y) if weights is None else np.asarray(weights, dtype=float)**2
+    ok = np.isfinite(y) & np.isfinite(w2)
+
+    # solve the normal equations for every model at once
+    design = models[:, ok, np.newaxis]*powers[np.newaxis, ok, :]
+    normal = np.einsum('kni,n,knj->kij', design, w2[ok], design)
+    projected = np.einsum('kni,n->ki', design, w2[ok]*y[ok])
+    coefficients = np.linalg.solve(normal, projected[:, :, np.newaxis])[:, :, 0]
+    baselines = np.dot(coefficients, powers.T)
+    logdet = np.linalg.slogdet(normal)[1]
+
+    if single:
+        return coefficients[0], baselines[0], logdet[0]
+    else:
+        return coefficients, baselines, logdet
+
+class Objective:
+    '''
+    A compiled goodness-of-fit, which is a plain function of a flat array
+    of free parameters, so it can go straight into any optimizer
+    (like `scipy.optimize.minimize`).
+    '''
+
+    def __init__(self, model, x, y, weights=None, goodness=sumofsquares, baseline_order=None):
+        '''
+        Compile a goodness-of-fit.
+
+        Parameters
+        ----------
+        model : astropy.model
+            The astropy model we're trying to fit.
+
+        x : numpy.ndarray
+            The independent values (x).
+
+        y : numpy.ndarray
+            The dependent values (y).
+
+        weights : numpy.ndarray
+            The weights to apply to each residual (usually 1/uncertainty).
+
+        goodness : function
+            A goodness-of-fit function of the (weighted) residuals,
+            which should be *smaller* for better fits.
+
+        baseline_order : int
+            If None, `baseline` is treated like any other parameter.
+            Otherwise, `baseline` is taken out of the free parameters,
+            and a polynomial baseline of this order (0 = constant) gets
+            solved for exactly at every step (see `linear_baseline`).
+        '''
+        self.baseline_order = baseline_order
+        if baseline_order is not None:
+            model = hold_baseline(model)
+        self.compiled = CompiledModel(model, x)
+        self.y = np.asarray(y, dtype=float)
+        self.weights = None if weights is None else np.asarray(weights, dtype=float)
+        self.goodness = goodness
+
+    def model(self, theta):
+        '''
+        Calculate the model (including any solved-for baseline),
+        for a set of free parameters.
+        '''
+        model = self.compiled(theta)
+        if self.baseline_order is not None:
+            _, baseline, _ = linear_baseline(model, self.compiled.x, self.y,
+                                             weights=self.weights, order=self.baseline_order)
+            model = model*baseline
+        return model
+
+    def coefficients(self, theta):
+        '''
+        Calculate the best baseline polynomial coefficients,
+        for a set of free parameters.
+        '''
+        coefficients, _, _ = linear_baseline(self.compiled(theta), self.compiled.x, self.y,
+                                             weights=self.weights, order=self.baseline_order or 0)
+        return coefficients
+
+    def residuals(self, theta):
+        '''
+        Calculate the (weighted) residuals, for a set of free parameters.
+        '''
+        residuals = self.model(theta) - self.y
+        if self.weights is not None:
+            residuals = self.weights*residuals
+        return residuals
+
+    def __call__(self, theta):
+        '''
+        Calculate the goodness of fit, for a set of free parameters.
+        '''
+        return self.goodness(self.residuals(theta))
+
+    def batch(self, thetas):
+        '''
+        Calculate the goodness of fit for lots of sets of free parameters
+        at once, from an (N, ndim) array. The models (and any baselines)
+        are calculated together, and so is the goodness of fit, if the
+        goodness function takes an `axis` (like `sumofsquares`).
+        '''
+        models = self.compiled.batch(thetas)
+        if self.baseline_order is not None:
+            _, baselines, _ = linear_baseline(models, self.compiled.x, self.y,
+                                              weights=self.weights, order=self.baseline_order)
+            models = models*baselines
+        residuals = models - self.y
+        if self.weights is not None:
+            residuals = self.weights*residuals
+        if 'axis' in inspect.signature(self.goodness).parameters:
+            return np.asarray(self.goodness(residuals, axis=-1), dtype=float)
+        else:
+            return np.array([self.goodness(r) for r in residuals])
+
+def compile_model(model, x):
+    '''
+    Compile an astropy model into a fast function of its free parameters.
+    (see `CompiledModel`)
+    '''
+    return CompiledModel(model, x)
+
+def compile_objective(model, x, y, weights=None, goodness=sumofsquares, baseline_order=None):
+    '''
+    Compile a goodness-of-fit into a fast function of the free parameters.
+    (see `Objective`)
+    '''
+    return Objective(model, x, y, weights=weights, goodness=goodness, baseline_order=baseline_order)
+
+def compiled_fit(model, x, y, weights=None, goodness=sumofsquares, method='Nelder-Mead', baseline_order=None, **kw):
+    '''
+    Fit a model with `scipy.optimize.minimize`, using a compiled objective.
+
+    Parameters
+    ----------
+    model : astropy.model
+        The astropy model we're trying to fit. It starts from its current
+        parameters; the bounds of its free parameters are passed along.
+
+    x : numpy.ndarray
+        The independent values (x).
+
+    y : numpy.ndarray
+        The dependent values (y).
+
+    weights : numpy.ndarray
+        The weights to apply to each residual (usually 1/uncertainty).
+
+    goodness : function
+        A goodness-of-fit function of the (weighted) residuals.
+
+    method : str
+        Which `scipy.optimize.minimize` method should we use?
+        ('Nelder-Mead' is the same simplex algorithm as `SimplexLSQFitter`.)
+
+    baseline_order : int
+        If not None, solve for a polynomial `baseline` of this order exactly,
+        instead of searching for it (see `Objective`). The fitted model's
+        `baseline` is set to the constant term; the full set of coefficients
+        is stored as `fitted.baseline_coefficients`.
+
+    **kw : dict
+        Any extra keywords will be passed to `scipy.optimize.minimize`.
+
+    Returns
+    -------
+    fitted : astropy.model
+        A copy of the model, set to the best parameters.
+    '''
+
+    objective = Objective(model, x, y, weights=weights, goodness=goodness, baseline_order=baseline_order)
+
+    # pass bounds to scipy only where they exist
+    bounds = [(lo if np.isfinite(lo) else None, hi if np.isfinite(hi) else None)
+              for lo, hi in objective.compiled.bounds]
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        result = scipy.optimize.minimize(objective, objective.compiled.initial,
+                                         method=method, bounds=bounds, **kw)
+
+    fitted = model.copy()
+    objective.compiled.update(fitted, result.x)
+
+    # fill in the baseline we solved for
+    if baseline_order is not None:
+        fitted.baseline_coefficients = objective.coefficients(result.x)
+        fitted.baseline = fitted.baseline_coefficients[0]
+    return fitted
+
+def benchmark_objective(model, x, y, weights=None, N=1000):
+    '''
+    Time how long one goodness-of-fit calculation takes, both going
+    through the astropy model and through a compiled objective.
+
+    Parameters
+    ----------
+    model : astropy.model
+        The astropy model to test.
+
+    x, y, weights : numpy.ndarray
+        The data to calculate the goodness of fit on.
+
+    N : int
+        How many calls should we time?
+
+    Returns
+    -------
+    timing : dict
+        The average time per call (in seconds) for the
+        'astropy' and 'compiled' versions, and their ratio.
+    '''
+
+    objective = Objective(model, x, y, weights=weights)
+    theta = objective.compiled.initial
+    w = 1.0 if weights is None else weights
+
+    # go through the astropy model, the way the fitters do
+    start = time.time()
+    for i in range(N):
+        objective.compiled.update(model, theta)
+        sumofsquares(w*(model(x) - y))
+    slow = (time.time() - start)/N
+
+    # go through the compiled objective
+    start = time.time()
+    for i in range(N):
+        objective(theta)
+    fast = (time.time() - start)/N
+
+    timing = dict(astropy=slow, compiled=fast, speedup=slow/fast)
+    print('{:.1f}us/call through astropy, {:.1f}us/call compiled ({:.1f}x faster)'.format(slow*1e6, fast*1e6, slow/fast))
+    return timing
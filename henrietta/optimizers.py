@@ -1,4 +1,6 @@
 import numpy as np
+from .goodnesses import sumofsquares
+from .objectives import Objective
 
 def guessncheck(objfunc, model, x, y, N=100):
     '''
@@ -9,7 +11,8 @@ def guessncheck(objfunc, model, x, y, N=100):
     ----------
     objfunc : function
         The function that tells us how good a fit is, based on the model
-        and the data (this is fed automitically by our "fitter").
+        and the data (this is fed automitically by our "fitter"). This
+        can also be a compiled `Objective`, which is much faster.
 
     model : astropy.model
         The astropy model we're trying to fit.
@@ -24,6 +27,12 @@ def guessncheck(objfunc, model, x, y, N=100):
         How many models should we try?
     '''
 
+    # a compiled Objective can check guesses without touching the model
+    if isinstance(objfunc, Objective):
+        guesses = draw_from_bounds(model, N=N)
+        gof = objfunc.batch(guesses[:, objfunc.compiled.free_index])
+        return guesses[np.nanargmin(gof)]
+
     # assume our first model has the best parameters (initially)
     best = model.parameters
 
@@ -56,3 +65,89 @@ def guessncheck(objfunc, model, x, y, N=100):
             best = tester.parameters
 
     return best
+
+def draw_from_bounds(model, N=100):
+    '''
+    This function draws lots of random parameter sets for a model,
+    picking each free parameter uniformly from within its bounds.
+
+    Parameters
+    ----------
+    model : astropy.model
+        The astropy model whose parameters we want to draw.
+
+    N : int
+        How many parameter sets should we draw?
+
+    Returns
+    -------
+    parameters : numpy.ndarray
+        An (N, number of parameters) array of parameter sets. Fixed
+        (or unbounded) parameters are held at their current values.
+    '''
+
+    # start every guess from the current parameters
+    parameters = np.tile(model.parameters, (int(N), 1))
+
+    # randomize only the bounded and un-fixed variables
+    for w, p in enumerate(model.param_names):
+        if None in model.bounds[p] or model.fixed[p]:
+            pass
+        else:
+            parameters[:, w] = np.random.uniform(*model.bounds[p], size=int(N))
+
+    return parameters
+
+def batch_guessncheck(model, x, y, weights=None, N=100, goodness=sumofsquares, baseline_order=None):
+    '''
+    This function guesses and checks lots of different models, like
+    `guessncheck`, but it scores all the guesses together (with one
+    batched `Objective.batch` call, instead of one model at a
+    time), and keeps the goodness of fit for *every* guess, so we can
+    pick out several good ones.
+
+    Parameters
+    ----------
+    model : astropy.model
+        The astropy model we're trying to fit.
+
+    x : numpy.ndarray
+        The independent values (x).
+
+    y : numpy.ndarray
+        The dependent values (y).
+
+    weights : numpy.ndarray
+        The weights to apply to each residual (usually 1/uncertainty).
+
+    N : int
+        How many models should we try?
+
+    goodness : function
+        A goodness-of-fit function of the (weighted) residuals,
+        which should be *smaller* for better fits.
+
+    baseline_order : int
+        If not None, solve for a polynomial `baseline` of this order
+        exactly for each guess, rather than guessing it.
+
+    Returns
+    -------
+    parameters : numpy.ndarray
+        An (N, number of parameters) array of the guessed parameters,
+        sorted from best to worst.
+
+    gof : numpy.ndarray
+        The goodness of fit for each guess (also sorted from best to worst).
+    '''
+
+    # draw all the guesses at once
+    parameters = draw_from_bounds(model, N=N)
+
+    # calculate the goodness of fit for all the guesses at once (with a compiled objective)
+    objective = Objective(model, x, y, weights=weights, goodness=goodness, baseline_order=baseline_order)
+    gof = objective.batch(parameters[:, objective.compiled.free_index])
+
+    # sort from the best to worst (NaNs go to the end)
+    order = np.argsort(gof)
+    return parameters[order], gof[order]
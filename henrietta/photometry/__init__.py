@@ -1,3 +1,8 @@
 from .cartoons import *
 from .loupe import *
+from .extraction import *
+from .centroid import *
+from .growth import *
+from .differential import *
+from .detection import *
 from .photometry import *
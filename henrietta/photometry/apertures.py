@@ -8,9 +8,42 @@ Define an Aperture object, which
 
 from ..imports import *
 import photutils
-from astropy.stats import sigma_clipped_stats
+from .extraction import extract_photometry
 from astropy.table import Table
-
+from matplotlib.collections import EllipseCollection
+
+
+def measurement_table(names, x, y, flux, sky=None):
+    '''
+    Make a table of aperture measurements (one row per aperture).
+
+    Parameters
+    ----------
+    names : list of str
+        The names of the apertures.
+    x, y : arrays
+        The pixel positions of the apertures.
+    flux : array
+        The flux in each aperture.
+    sky : array
+        The sky that was subtracted from each aperture
+        (None = we didn't subtract the background).
+
+    Returns
+    -------
+    table : astropy.table.Table
+        A nicely formatted table of the measurements.
+    '''
+    table = Table(data=[list(names), x, y, flux], names=['#', 'x', 'y', 'flux'])
+    if sky is not None:
+        table['sky'] = sky
+        table['sky'].format = '.2e'
+
+    # update the default format for the table outputs
+    table['x'].format = '.0f'
+    table['y'].format = '.0f'
+    table['flux'].format = '.2e'
+    return table
 
 class InteractiveAperture(photutils.CircularAperture):
 
@@ -49,8 +82,12 @@ class InteractiveAperture(photutils.CircularAperture):
         # keep track of the loupe this aperture is a part of
         self.loupe = loupe
 
+        # (if this aperture gets drawn along with lots of others, see `ApertureGroup`)
+        self.group = None
+
         # keep track of the flux in this aperture with an undefined flux
         self.flux = np.nan
+        self.sky = np.nan
 
     def plot(self, ax):
         '''
@@ -66,7 +103,7 @@ class InteractiveAperture(photutils.CircularAperture):
         self.plotted = {}
 
         # (this can handle only single-position apertures)
-        pos = self.positions[0]
+        pos = np.atleast_2d(self.positions)[0]
 
         # (pull out the apeture radius)
         aperture_radius = self.r
@@ -76,7 +113,8 @@ class InteractiveAperture(photutils.CircularAperture):
         ax.add_artist(self.plotted['circle'])
 
         # put a crosshair at the center of the aperture
-        self.plotted['marker'] = plt.scatter(pos[0], pos[1], marker='+', alpha=0.3, color='black')
+        # (without rescaling the axes, which is slow when adding lots of apertures)
+        self.plotted['marker'], = ax.plot(pos[0], pos[1], marker='+', alpha=0.3, color='black', scalex=False, scaley=False)
 
         # add a label next to the aperture
         self.plotted['label'] = plt.text(pos[0]+aperture_radius+1, pos[1], self.name, va='center', zorder=11, color='black')
@@ -97,11 +135,17 @@ class InteractiveAperture(photutils.CircularAperture):
         Remove any traces of this aperture from the plot.
         '''
 
+        # take this aperture out of any group it was drawn with
+        if self.group is not None:
+            self.group.remove(self)
+            self.group = None
+
         # loop through all plotted elements and remove them
         for k in self.plotted.keys():
             self.plotted[k].remove()
+        self.plotted = {}
 
-    def update(self, plot=True):
+    def update(self, flux=None, sky=None, plot=True):
         '''
         After a plot has already been created, update its hidden properties,
         as well as its appearance on the interactive plot. This function
@@ -110,53 +154,62 @@ class InteractiveAperture(photutils.CircularAperture):
 
         Parameters
         ----------
+        flux, sky : float
+            The flux and sky in this aperture, if they've already been
+            measured (the Loupe measures all its apertures at once). If
+            None, this aperture does its own photometry.
         plot : bool
             Should we update the plot?
         '''
 
         # update the various radii and options
-        self.r = self.loupe.aperture_radius
-        self.background_aperture.r_in, self.background_aperture.r_out = self.loupe.background_radii
+        # (only if they've changed, because photutils resets
+        # some of its internal properties every time they're set)
+        if self.r != self.loupe.aperture_radius:
+            self.r = self.loupe.aperture_radius
+        if [self.background_aperture.r_in, self.background_aperture.r_out] != list(self.loupe.background_radii):
+            self.background_aperture.r_in, self.background_aperture.r_out = self.loupe.background_radii
         self.subtract_background = self.loupe.subtract_background
 
+        # (this can handle only single-position apertures)
+        pos = np.atleast_2d(self.positions)[0]
 
         # update the plot (if we're supposed to)
-        if plot:
-            pos = self.positions[0]
+        if plot and (self.group is not None):
+            self.group.update(self.r, self.background_aperture.r_in,
+                              self.background_aperture.r_out, self.subtract_background)
+        elif plot:
             self.plotted['circle'].set_radius(self.r)
-            self.plotted['label'].set_position((pos[0]+self.r+1, pos[1]))
-            self.plotted['marker'].set_offsets(pos)
+            self.plotted['marker'].set_data([pos[0]], [pos[1]])
             self.plotted['background_inner_circle'].set_radius(self.background_aperture.r_in)
             self.plotted['background_outer_circle'].set_radius(self.background_aperture.r_out)
             for k in ['background_inner_circle', 'background_outer_circle']:
                 self.plotted[k].set_visible(self.subtract_background)
+        if plot and ('label' in self.plotted):
+            self.plotted['label'].set_position((pos[0]+self.r+1, pos[1]))
 
-        # create a table of measurements
-        self.table = Table(data=[[self.name], [pos[0]], [pos[1]], [0.0]], names=['#','x', 'y', 'flux'])
-
-        # do the photometry in the aperture
-        aperture, _ = self.do_photometry(self.loupe.image)
-
-        # subtract the background, if we're supposed to
-        if self.subtract_background:
-
-            # calculate the background flux
-            background_mask = self.background_aperture.to_mask(method='center')[0]
-            background_masked_image = background_mask.multiply(self.loupe.image)
-            values = background_masked_image[background_masked_image != 0]
-            _, background_median, _ = sigma_clipped_stats(values)
-            aperture_background = background_median*self.area()
-            aperture -= aperture_background
-            self.table['sky'] = aperture_background
-            self.table['sky'].format = '.2e'
-
-        # store our final flux in the table
-        self.table['flux'] = aperture
-
-        # update the default format for the table outputs
-        self.table['x'].format = '.0f'
-        self.table['y'].format = '.0f'
-        self.table['flux'].format = '.2e'
+        # do the photometry in the aperture (subtracting the background, if we're
+        # supposed to), with pixel weights from the shared template cache
+        if flux is None:
+            flux, sky = extract_photometry(self.loupe.image[np.newaxis, :, :], [pos],
+                                           aperture_radius=self.r,
+                                           subtract_background=self.subtract_background,
+                                           background_radii=[self.background_aperture.r_in,
+                                                             self.background_aperture.r_out])
+            flux, sky = flux[0, 0], sky[0, 0]
+
+        # store our final flux (and sky)
+        self.flux = flux
+        self.sky = sky
+
+    @property
+    def table(self):
+        '''
+        A table of this aperture's latest measurements.
+        '''
+        pos = np.atleast_2d(self.positions)[0]
+        sky = [self.sky] if self.subtract_background else None
+        return measurement_table([self.name], [pos[0]], [pos[1]], [self.flux], sky=sky)
 
     #def __str__(self):
     #    '''
@@ -166,6 +219,109 @@ class InteractiveAperture(photutils.CircularAperture):
     #    #return '{:>8} at ({:4.1f}, {:4.1f}) sums to {:10.1f} (area of {:.1f} pixels).'.format(self.name, self.positions[0][0], self.positions[0][1],  self.flux, self.area())
     #    return repr(self.table)
 
+class ApertureGroup:
+    '''
+    Lots of interactive apertures drawn together, with one matplotlib
+    collection each for all their circles, background annuli, and
+    crosshairs (instead of separate artists for every aperture, which
+    gets slow for hundreds of them). All the apertures in a group share
+    the same radii, like all the apertures in a Loupe.
+    '''
+
+    def __init__(self, apertures, ax, labels=True):
+        '''
+        Draw a bunch of apertures.
+
+        Parameters
+        ----------
+        apertures : list of InteractiveAperture
+            The apertures to draw.
+        ax : matplotlib axes
+            The axes in which we should plot them.
+        labels : bool
+            Should each aperture get its name written next to it?
+            (Text is the slowest thing to draw, so for lots of
+            apertures, leaving it off makes the plot much quicker.)
+        '''
+        self.apertures = list(apertures)
+        self.ax = ax
+        self.radii = None
+        self.plot(labels=labels)
+
+    @property
+    def positions(self):
+        '''
+        The (x, y) positions of the apertures, with shape (napertures, 2).
+        '''
+        return np.reshape([np.atleast_2d(a.positions)[0] for a in self.apertures], (-1, 2))
+
+    def plot(self, labels=True):
+        '''
+        Plot all the apertures onto the axes.
+        '''
+        pos = self.positions
+        self.plotted = {}
+
+        # put a crosshair at the center of every aperture
+        self.plotted['marker'], = self.ax.plot(pos[:, 0], pos[:, 1], linestyle='none', marker='+',
+                                               alpha=0.3, color='black', scalex=False, scaley=False)
+
+        # each aperture keeps its own label (and knows it's part of this group)
+        for a, (x, y) in zip(self.apertures, pos):
+            a.group = self
+            a.plotted = {}
+            if labels:
+                a.plotted['label'] = self.ax.text(x+a.r+1, y, a.name, va='center', zorder=11, color='black')
+
+        # draw the circles for the apertures and background annuli
+        a = self.apertures[0]
+        self.update(a.r, a.background_aperture.r_in, a.background_aperture.r_out, a.subtract_background)
+
+    def _draw_circles(self):
+        '''
+        (Re)draw the circles for all the apertures and background annuli,
+        as one collection each. (A collection's circles can't be resized,
+        but making a new one is about as quick.)
+        '''
+        pos = self.positions
+        r, r_in, r_out, subtract_background = self.radii
+        bgkw = dict(edgecolors='black', alpha=0.3, zorder=100, visible=subtract_background)
+        for k, radius, kw in [('circle', r, dict(edgecolors='black', linewidths=2, zorder=100)),
+                              ('background_inner_circle', r_in, bgkw),
+                              ('background_outer_circle', r_out, bgkw)]:
+            if k in self.plotted:
+                self.plotted[k].remove()
+            diameters = np.full(len(pos), 2.0*radius)
+            self.plotted[k] = EllipseCollection(diameters, diameters, np.zeros(len(pos)),
+                                                units='xy', offsets=pos, offset_transform=self.ax.transData,
+                                                facecolors='none', **kw)
+            self.ax.add_collection(self.plotted[k], autolim=False)
+
+    def update(self, r, r_in, r_out, subtract_background):
+        '''
+        Update the radii of all the apertures (and whether
+        the background annuli are showing) on the plot.
+        '''
+        radii = (r, r_in, r_out, subtract_background)
+        if radii != self.radii:
+            self.radii = radii
+            self._draw_circles()
+
+    def remove(self, aperture):
+        '''
+        Take one aperture out of the group (and off the plot).
+        '''
+        self.apertures = [a for a in self.apertures if a is not aperture]
+        if len(self.apertures) == 0:
+            for k in self.plotted.keys():
+                self.plotted[k].remove()
+            self.plotted = {}
+            return
+
+        pos = self.positions
+        self.plotted['marker'].set_data(pos[:, 0], pos[:, 1])
+        self._draw_circles()
+
 #class ApertureWithBackground(InteractiveAperture):
 #    pass
     #def __init__(self, name='', pos=(0,0), aperture_radius=3 ):
@@ -1,70 +1,189 @@
-from numpy import *
-import pdb
-import matplotlib.pyplot as plt
+'''
+Tools to find the centers of stars, for lots of stars
+in a whole stack of images at once.
+'''
 
-def mean_centroid(image, center, boxsize=60.):
+from ..imports import *
 
-	'''
-    Determines the weighted mean centroid for multiple stars
+def extract_stamps(cube, centers, boxsize=20):
+    '''
+    Cut out little square images ("stamps") around stars,
+    for every star in every image at once.
 
-    Parameters:
-    -----------
-    image : ndarray
-        Image for aperture photometry to be performed on.
-    center : 2darray
-        A list of positions in x,y pixel coordinates for each star.
-        Needs to be as [[0,0],[1,1]...]
-		Basically is a best guess to the center
-    boxsize : int, even number
-        The size of the box to crop around star, needs to be even
-    num_stars : int
-        Number of stars to look at
+    Parameters
+    ----------
+    cube : array
+        The images, with shape (nframes, ny, nx).
+
+    centers : array
+        The approximate (x, y) pixel positions of the stars, either with
+        shape (nstars, 2) (the same in every image) or with shape
+        (nframes, nstars, 2) (different in each image).
+
+    boxsize : int
+        The width of the square stamps, in pixels.
 
     Returns
     -------
-    centroid position for each star : array
+    stamps : array
+        The stamps, with shape (nframes, nstars, boxsize, boxsize).
+        (Pixels that fall off the edge of the image are NaN.)
+
+    x, y : arrays
+        The pixel coordinates of the columns and rows of each stamp,
+        each with shape (nframes, nstars, boxsize).
+    '''
+    cube = np.asarray(cube, dtype=float)
+    nframes, ny, nx = cube.shape
+    L = int(boxsize)
+    centers = np.broadcast_to(centers, (nframes,) + np.shape(centers)[-2:])
+
+    # figure out the pixel coordinates of each stamp
+    corner = np.round(centers).astype(int) - L//2
+    x = corner[:, :, 0, np.newaxis] + np.arange(L)
+    y = corner[:, :, 1, np.newaxis] + np.arange(L)
+
+    # pull all the pixels out at once (clipping at the edges, and then blanking those)
+    frame = np.arange(nframes)[:, np.newaxis, np.newaxis, np.newaxis]
+    rows = np.clip(y, 0, ny - 1)[:, :, :, np.newaxis]
+    columns = np.clip(x, 0, nx - 1)[:, :, np.newaxis, :]
+    stamps = cube[frame, rows, columns]
+    outside = ((y < 0) | (y >= ny))[:, :, :, np.newaxis] | ((x < 0) | (x >= nx))[:, :, np.newaxis, :]
+    stamps[outside] = np.nan
+
+    return stamps, x, y
+
+def _marginal_centroids(stamps, x, y):
+    '''
+    Find thresholded marginal centroids for a bunch of stamps
+    (see `batch_centroids`). Returns the (x, y) centers, with
+    shape stamps.shape[:-2] + (2,).
+    '''
+    stamps = np.where(np.isfinite(stamps), stamps, 0)
+
+    centroid = []
+    for marginal, coordinate in [(stamps.sum(-2), x), (stamps.sum(-1), y)]:
+        # use only the part of the sums that's above the average
+        weight = np.maximum(marginal - marginal.mean(-1, keepdims=True), 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            centroid.append(np.sum(weight*coordinate, -1)/np.sum(weight, -1))
+    return np.stack(centroid, -1)
+
+def _gaussian_centroids(stamps, x, y):
+    '''
+    Refine centroids by fitting a 2D Gaussian to each stamp (see
+    `batch_centroids`). Returns the (x, y) centers, with shape
+    stamps.shape[:-2] + (2,), which are NaN if the fit failed.
     '''
 
-	# figure out the number of stars from the list of centers
-	num_stars = len(center)
-	centroid = zeros((num_stars,2)) #setting up the centroid array
-	L = boxsize #size of the box to isolate the star
+    # subtract the background, and use only the pixels above it
+    background = np.nanmedian(stamps, axis=(-2, -1))[..., np.newaxis, np.newaxis]
+    signal = stamps - background
+    good = np.isfinite(signal) & (signal > 0)
+    signal = np.where(good, signal, 1.0)
 
+    # the log of a Gaussian is a parabola, so fit
+    # log(signal) = a + b*x + c*y + d*x**2 + e*y**2 with (weighted) linear least squares
+    # (relative to the stamp centers, to keep the numbers small)
+    dx = (x - x.mean(-1, keepdims=True))[..., np.newaxis, :]*np.ones_like(signal)
+    dy = (y - y.mean(-1, keepdims=True))[..., :, np.newaxis]*np.ones_like(signal)
+    basis = np.stack([np.ones_like(signal), dx, dy, dx**2, dy**2], -1)
+    weight = np.where(good, signal**2, 0)
+    logsignal = np.log(signal)
 
-	for k in range(num_stars):
-		c = center[k] #get the approximate star location
+    # a parabola in x (or y) needs pixels in at least 3 different columns (or rows),
+    # so flag any stamps that don't have enough to fit (like ones off the image)
+    degenerate = (np.sum(np.any(good, axis=-2), axis=-1) < 3) | (np.sum(np.any(good, axis=-1), axis=-1) < 3)
 
-		x = arange((c[0]-L/2.),(c[0]+L/2.),1)
-		y = arange((c[1]-L/2.),(c[1]+L/2.),1)
-		cropped_images = image[int(c[0]-L/2.):int(c[0]+L/2.),int(c[1]-L/2.):int(c[1]+L/2.)]
-		cropped_images = where(isfinite(cropped_images),cropped_images,0)
-		plt.imshow(cropped_images)
-		plt.show()
-		print k
+    # solve the normal equations for every stamp at once
+    # (with a harmless stand-in for the flagged ones, so they can't break the others)
+    A = np.einsum('...ijk,...ij,...ijl->...kl', basis, weight, basis)
+    b = np.einsum('...ijk,...ij,...ij->...k', basis, weight, logsignal)
+    A += 1e-12*np.eye(5)*np.trace(A, axis1=-2, axis2=-1)[..., np.newaxis, np.newaxis]
+    A[degenerate] = np.eye(5)
+    try:
+        coefficients = np.linalg.solve(A, b[..., np.newaxis])[..., 0]
+    except np.linalg.LinAlgError:
+        coefficients = (np.linalg.pinv(A) @ b[..., np.newaxis])[..., 0]
 
+    # the peak of the parabola is the center (if it's actually a peak)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        xc = -coefficients[..., 1]/(2*coefficients[..., 3]) + x.mean(-1)
+        yc = -coefficients[..., 2]/(2*coefficients[..., 4]) + y.mean(-1)
+        ok = (coefficients[..., 3] < 0) & (coefficients[..., 4] < 0) & ~degenerate
+        ok &= (xc >= x[..., 0]) & (xc <= x[..., -1]) & (yc >= y[..., 0]) & (yc <= y[..., -1])
+    return np.where(ok[..., np.newaxis], np.stack([xc, yc], -1), np.nan)
 
+def batch_centroids(cube, centers, boxsize=20, refine=False):
+    '''
+    Find the centers of lots of stars, in every image of a stack at once.
+
+    First, the pixels in a box around each star are added up along
+    rows and columns. The parts of those sums that are above their
+    average get used as weights, to find the weighted mean x and y.
+    If `refine` is True, we then fit a 2D Gaussian to a box centered
+    on each of those (which is more precise for bright, uncrowded stars),
+    and keep the simpler centers wherever that fit fails.
+
+    Parameters
+    ----------
+    cube : array
+        The images, with shape (nframes, ny, nx). (A single 2D
+        image is OK too.)
+
+    centers : array
+        The approximate (x, y) pixel positions of the stars, either with
+        shape (nstars, 2) (the same in every image) or with shape
+        (nframes, nstars, 2) (different in each image).
+
+    boxsize : int
+        The width of the square box around each star, in pixels.
+
+    refine : bool
+        Should we refine the centers by fitting 2D Gaussians?
 
+    Returns
+    -------
+    centroids : array
+        The (x, y) centers of the stars, with shape (nframes, nstars, 2)
+        (or (nstars, 2), if we were given a single image).
+    '''
+    cube = np.asarray(cube, dtype=float)
+    single = cube.ndim == 2
+    if single:
+        cube = cube[np.newaxis, :, :]
+    centers = np.atleast_2d(centers)
 
-		im = cropped_images
-		Ii = []
-		Jj = [] #keeps track of the row and column sums
-		for i in range(int(L)):
-			Ii.append(sum(im[i,:]))
-			Jj.append(sum(im[:,i]))
-		Ii=array(Ii)
-		Jj=array(Jj)
-		Imean = 1./L*sum(Ii)
-		Jmean = 1./L*sum(Jj)
+    stamps, x, y = extract_stamps(cube, centers, boxsize=boxsize)
+    centroids = _marginal_centroids(stamps, x, y)
+    if refine:
+        # (recenter the boxes on the first guesses before fitting)
+        first = np.where(np.isfinite(centroids), centroids, np.broadcast_to(centers, centroids.shape))
+        refined = _gaussian_centroids(*extract_stamps(cube, first, boxsize=boxsize))
+        centroids = np.where(np.isfinite(refined), refined, centroids)
 
-		Ii_red = Ii[where(Ii>Imean)]
-		Jj_red = Jj[where(Jj>Jmean)]
-		x_red = x[where(Ii>Imean)]
-		y_red = y[where(Jj>Jmean)]
-		xc = sum((Ii_red-Imean)*x_red)/sum(Ii_red-Imean)
-		yc = sum((Jj_red-Jmean)*y_red)/sum(Jj_red-Jmean)
-		x_center = xc #put back in normal coordinates
-		y_center = yc
+    if single:
+        return centroids[0]
+    else:
+        return centroids
 
-		centroid[k] = [x_center,y_center]
+def mean_centroid(image, center, boxsize=60):
+    '''
+    Determines the weighted mean centroid for multiple stars
 
-	return centroid
+    Parameters:
+    -----------
+    image : ndarray
+        Image for aperture photometry to be performed on.
+    center : 2darray
+        A list of positions in x,y pixel coordinates for each star.
+        Needs to be as [[0,0],[1,1]...]
+        Basically is a best guess to the center
+    boxsize : int
+        The size of the box to crop around star
+
+    Returns
+    -------
+    centroid position for each star : array
+    '''
+    return batch_centroids(image, center, boxsize=boxsize)
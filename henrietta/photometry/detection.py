@@ -0,0 +1,241 @@
+'''
+Tools to find stars automatically (instead of clicking on them one
+at a time), and to quickly look up which aperture is closest to
+a location (with a KD-tree, instead of checking every aperture).
+'''
+
+from ..imports import *
+from scipy import ndimage
+from scipy.spatial import cKDTree
+
+def median_image(cube, nframes=25):
+    '''
+    Median-combine a stack of images (which gets rid of cosmic rays
+    and satellites, and makes faint stars easier to see).
+
+    Parameters
+    ----------
+    cube : array
+        The images, with shape (nframes, ny, nx).
+        (A single 2D image just gets returned.)
+
+    nframes : int
+        The most images to use (evenly spaced through the stack),
+        to keep this quick for very long stacks. (None = all of them)
+
+    Returns
+    -------
+    image : array
+        The median image, with shape (ny, nx).
+    '''
+    cube = np.asarray(cube, dtype=float)
+    if cube.ndim == 2:
+        return cube
+    if (nframes is not None) and (len(cube) > nframes):
+        cube = cube[np.round(np.linspace(0, len(cube) - 1, nframes)).astype(int)]
+    return np.nanmedian(cube, axis=0)
+
+def find_sources(image, threshold=5.0, fwhm=3.0, separation=None, border=None, max_sources=None):
+    '''
+    Find the stars in an image, as the local peaks of a smoothed
+    copy of it that are well above the background noise.
+
+    Parameters
+    ----------
+    image : array
+        The image (or a stack of images, which gets median-combined).
+
+    threshold : float
+        How many times the noise a peak must be above the background.
+
+    fwhm : float
+        The rough full-width-at-half-maximum of the stars, in pixels.
+        (The image gets smoothed by a Gaussian this wide.)
+
+    separation : float
+        The closest two stars can be, in pixels. Only the biggest peak
+        within this distance counts. (None = the fwhm)
+
+    border : int
+        Ignore peaks this close to the edge of the image, in pixels.
+        (None = the separation)
+
+    max_sources : int
+        The most stars to return (the brightest ones). (None = all)
+
+    Returns
+    -------
+    positions : array
+        The (x, y) pixel positions of the stars, with shape (nstars, 2),
+        sorted from brightest to faintest.
+
+    peaks : array
+        The height of each star's peak above the background,
+        in the smoothed image, with shape (nstars,).
+    '''
+    image = median_image(image)
+    separation = fwhm if separation is None else separation
+    border = int(np.ceil(separation)) if border is None else int(border)
+
+    # smooth the image, and figure out its background and noise
+    smoothed = ndimage.gaussian_filter(np.nan_to_num(image, nan=np.nanmedian(image)), fwhm/2.355)
+    background = np.median(smoothed)
+    noise = 1.4826*np.median(np.abs(smoothed - background))
+
+    # find pixels that are the biggest within the separation, and above the threshold
+    size = 2*int(np.ceil(separation)) + 1
+    biggest = ndimage.maximum_filter(smoothed, size=size, mode='nearest') == smoothed
+    peaked = biggest & (smoothed > background + threshold*noise)
+    if border > 0:
+        peaked[:border, :], peaked[-border:, :] = False, False
+        peaked[:, :border], peaked[:, -border:] = False, False
+    y, x = np.nonzero(peaked)
+
+    # refine to a fraction of a pixel, by fitting a parabola through each peak and its neighbors
+    ny, nx = smoothed.shape
+    left, right = smoothed[y, np.maximum(x - 1, 0)], smoothed[y, np.minimum(x + 1, nx - 1)]
+    below, above = smoothed[np.maximum(y - 1, 0), x], smoothed[np.minimum(y + 1, ny - 1), x]
+    center = smoothed[y, x]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dx = np.nan_to_num(0.5*(left - right)/(left - 2*center + right))
+        dy = np.nan_to_num(0.5*(below - above)/(below - 2*center + above))
+    positions = np.stack([x + np.clip(dx, -0.5, 0.5), y + np.clip(dy, -0.5, 0.5)], -1)
+
+    # sort from brightest to faintest (and if a flat-topped peak
+    # got found more than once, keep just one of them)
+    peaks = center - background
+    order = np.argsort(-peaks, kind='stable')
+    order = order[separate_sources(positions[order], separation)][:max_sources]
+    return positions[order], peaks[order]
+
+def separate_sources(positions, distance, existing=None):
+    '''
+    Drop any stars that are too close to (brighter) stars
+    before them in the list, or to some existing positions.
+
+    Parameters
+    ----------
+    positions : array
+        The (x, y) positions of the stars, with shape (nstars, 2),
+        sorted from most to least important.
+
+    distance : float
+        The closest two positions are allowed to be, in pixels.
+
+    existing : array
+        The (x, y) positions of any apertures we already have,
+        with shape (napertures, 2).
+
+    Returns
+    -------
+    keep : array
+        Which of the positions to keep, as an array of booleans.
+    '''
+    positions = np.atleast_2d(positions).reshape(-1, 2)
+    keep = np.ones(len(positions), bool)
+
+    # drop the ones too close to the existing apertures
+    if existing is not None:
+        keep &= ~ApertureIndex(existing).overlapping(positions, distance)
+
+    # go through the pairs that are too close, and drop the fainter one of each
+    pairs = cKDTree(positions).query_pairs(distance, output_type='ndarray')
+    if len(pairs) > 0:
+        pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+        for i, j in pairs:
+            if keep[i]:
+                keep[j] = False
+    return keep
+
+class ApertureIndex:
+    '''
+    A list of aperture positions, with a KD-tree to quickly find the
+    closest one to a location, or the ones that overlap a location.
+    (The tree gets rebuilt only when it's needed after a change.)
+    '''
+
+    def __init__(self, positions=None):
+        '''
+        Parameters
+        ----------
+        positions : array
+            The (x, y) positions of the apertures to start with,
+            with shape (napertures, 2).
+        '''
+        self.positions = np.zeros((0, 2))
+        self._tree = None
+        if positions is not None:
+            self.add(positions)
+
+    def __len__(self):
+        return len(self.positions)
+
+    @property
+    def tree(self):
+        '''
+        The KD-tree of the positions (rebuilt if they've changed).
+        '''
+        if self._tree is None:
+            self._tree = cKDTree(self.positions)
+        return self._tree
+
+    def add(self, positions):
+        '''
+        Add some (x, y) positions, with shape (n, 2), to the end of the list.
+        '''
+        self.positions = np.concatenate([self.positions, np.reshape(positions, (-1, 2))])
+        self._tree = None
+
+    def remove(self, index):
+        '''
+        Remove the position(s) at some index (or indices) in the list.
+        '''
+        self.positions = np.delete(self.positions, index, axis=0)
+        self._tree = None
+
+    def nearest(self, x, y):
+        '''
+        Find the closest aperture to a location.
+
+        Parameters
+        ----------
+        x, y : float (or arrays)
+            The location(s).
+
+        Returns
+        -------
+        index : int (or array)
+            The index of the closest aperture (-1 if there are none).
+
+        distance : float (or array)
+            How far away it is, in pixels (inf if there are none).
+        '''
+        if len(self) == 0:
+            return np.full(np.shape(x), -1)[()], np.full(np.shape(x), np.inf)[()]
+        distance, index = self.tree.query(np.stack([x, y], -1))
+        return index, distance
+
+    def overlapping(self, positions, distance):
+        '''
+        Check which of some positions are within some distance
+        of an existing aperture.
+
+        Parameters
+        ----------
+        positions : array
+            The (x, y) positions to check, with shape (n, 2).
+
+        distance : float
+            How close counts as overlapping, in pixels
+            (like twice the aperture radius).
+
+        Returns
+        -------
+        overlap : array
+            Which positions overlap an aperture, as an array of booleans.
+        '''
+        positions = np.reshape(positions, (-1, 2))
+        if len(self) == 0:
+            return np.zeros(len(positions), bool)
+        nearest, _ = self.tree.query(positions)
+        return nearest < distance
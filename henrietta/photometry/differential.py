@@ -0,0 +1,251 @@
+'''
+Tools for differential photometry, where each star's light curve is
+divided by the combined light curve of a bunch of other stars (an
+"ensemble") to take out changes that affect every star the same way
+(like clouds passing by, or the airmass changing).
+
+Every star's ensemble is a weighted average of the comparison stars,
+with zero weight on the star itself. Writing those weights as a
+(nstars x ncomparisons) matrix means that the ensembles for *all* the
+stars come from one matrix multiplication, so hundreds of comparison
+stars are no problem. The weights get updated a few times, giving
+less weight to noisy stars and none at all to variable ones.
+'''
+
+from ..imports import *
+from lightkurve import LightCurve
+
+def _robust_std(x, axis=0):
+    '''
+    The standard deviation of some values (ignoring NaNs),
+    estimated from the median absolute deviation.
+    '''
+    median = np.nanmedian(x, axis=axis, keepdims=True)
+    return 1.4826*np.nanmedian(np.abs(x - median), axis=axis)
+
+def _combine(flux, good, weights):
+    '''
+    Make an ensemble light curve for each star, as a weighted
+    average of the comparison stars (skipping missing points).
+
+    Parameters
+    ----------
+    flux : array
+        The normalized fluxes of the comparison stars (with
+        missing points set to zero), with shape (nframes, ncomparisons).
+
+    good : array
+        Which of those fluxes are OK to use? (same shape)
+
+    weights : array
+        The weight of each comparison star in each star's ensemble,
+        with shape (nstars, ncomparisons).
+
+    Returns
+    -------
+    ensemble : array
+        The ensemble light curves, with shape (nframes, nstars).
+
+    total : array
+        The total weight that went into each point (same shape).
+    '''
+    total = good.astype(float) @ weights.T
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (flux @ weights.T)/total, total
+
+class EnsemblePhotometry:
+    '''
+    Differential light curves for a bunch of stars, each one divided
+    by an (iteratively reweighted) ensemble of comparison stars.
+    '''
+
+    def __init__(self, flux, flux_err=None, targets=None, comparisons=None,
+                 clip=5.0, maxiters=10, tolerance=1e-4):
+        '''
+        Make the differential light curves.
+
+        Parameters
+        ----------
+        flux : array
+            The raw fluxes of all the stars, with shape (nframes, nstars).
+            (Missing points can be NaN.)
+
+        flux_err : array
+            The uncertainties on those fluxes (same shape). If None,
+            the uncertainties get estimated from the scatter from one
+            point to the next in each differential light curve.
+
+        targets : array
+            The indices of the stars we want light curves for.
+            (None = all of them.)
+
+        comparisons : array
+            The indices of the stars that can be used in the ensembles.
+            (None = all of them.)
+
+        clip : float
+            Reject a comparison star as variable if its scatter (relative
+            to its expected noise) is more than this many (robust) standard
+            deviations above the typical comparison star's.
+
+        maxiters : int
+            The most times to update the weights.
+
+        tolerance : float
+            Stop once the weights change by less than this (fractionally).
+        '''
+
+        flux = np.atleast_2d(np.asarray(flux, dtype=float))
+        nframes, nstars = flux.shape
+        self.targets = np.arange(nstars) if targets is None else np.atleast_1d(targets)
+        self.comparisons = np.arange(nstars) if comparisons is None else np.atleast_1d(comparisons)
+
+        # normalize every star by its median, so they can all be averaged together
+        self.normalization = np.nanmedian(flux, axis=0)
+        normalized = flux/self.normalization
+        good = np.isfinite(normalized)
+        if flux_err is not None:
+            normalized_err = np.asarray(flux_err, dtype=float)/np.abs(self.normalization)
+            good &= np.isfinite(normalized_err) & (normalized_err > 0)
+        else:
+            normalized_err = None
+
+        # (each star never gets to be part of its own ensemble)
+        def weight_matrix(rows, weights):
+            return np.where(rows[:, np.newaxis] == self.comparisons[np.newaxis, :], 0.0, weights)
+
+        cflux = np.where(good, normalized, 0)[:, self.comparisons]
+        cgood = good[:, self.comparisons]
+
+        # start by weighting all the comparison stars equally
+        weights = np.ones(len(self.comparisons))
+        variable = np.zeros(len(self.comparisons), bool)
+        for self.iterations in range(1, maxiters + 1):
+
+            # divide each comparison star by its own ensemble
+            ensemble, total = _combine(cflux, cgood, weight_matrix(self.comparisons, weights))
+            relative = np.where(cgood & (total > 0), normalized[:, self.comparisons]/ensemble, np.nan)
+            relative /= np.nanmedian(relative, axis=0)
+
+            # measure how much each one scatters, compared to how much it should
+            scatter = _robust_std(relative)
+            if normalized_err is None:
+                expected = _robust_std(np.diff(relative, axis=0))/np.sqrt(2)
+            else:
+                expected = np.sqrt(np.nanmedian(np.where(cgood, normalized_err[:, self.comparisons]**2, np.nan), axis=0))
+            with np.errstate(invalid='ignore', divide='ignore'):
+                excess = scatter/expected
+
+            # reject the stars whose scatter is much bigger than the typical star's
+            # (the spread can't be smaller than how well we can measure a scatter
+            # from this many points; stars we can't judge at all get kept)
+            judged = np.isfinite(excess) & (scatter > 0)
+            kept = excess[judged & ~variable]
+            typical = np.median(kept) if len(kept) > 0 else 1.0
+            spread = _robust_std(kept) if len(kept) > 2 else 0.0
+            spread = np.maximum(spread, typical/np.sqrt(nframes))
+            newvariable = judged & (excess > typical + clip*spread)
+            newvariable |= np.sum(cgood, axis=0) == 0
+
+            # weight the rest by how little they scatter
+            with np.errstate(invalid='ignore', divide='ignore'):
+                inverse = 1/scatter**2
+            inverse = np.where(judged, inverse, np.median(inverse[judged]) if np.any(judged) else 1.0)
+            newweights = np.where(newvariable, 0.0, inverse)
+            newweights /= np.sum(newweights) or 1.0
+            change = np.max(np.abs(newweights - weights/np.sum(weights)))
+            converged = np.all(newvariable == variable) and (change < tolerance*np.max(newweights))
+            weights, variable = newweights, newvariable
+            if converged:
+                break
+
+        self.weights = weights
+        self.variable = variable
+        self.scatter = scatter
+
+        # make the ensembles for all the targets at once
+        self.ensemble_weights = weight_matrix(self.targets, weights)
+        ensemble, total = _combine(cflux, cgood, self.ensemble_weights)
+        tgood = good[:, self.targets] & (total > 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            relative = np.where(tgood, normalized[:, self.targets]/ensemble, np.nan)
+        median = np.nanmedian(relative, axis=0)
+        self.flux = relative/median
+
+        # propagate the uncertainties (from the target, and from its ensemble)
+        if normalized_err is None:
+            noise = _robust_std(np.diff(self.flux, axis=0))/np.sqrt(2)
+            self.flux_err = np.where(tgood, noise, np.nan)
+        else:
+            cerr = np.where(cgood, normalized_err[:, self.comparisons], 0)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                ensemble_variance = (cerr**2 @ (self.ensemble_weights**2).T)/total**2
+                fractional = np.sqrt((normalized_err[:, self.targets]/normalized[:, self.targets])**2
+                                     + ensemble_variance/ensemble**2)
+            self.flux_err = np.where(tgood, np.abs(self.flux)*fractional, np.nan)
+
+    def lightcurves(self, time=None, names=None):
+        '''
+        Package the differential light curves as LightCurve objects.
+
+        Parameters
+        ----------
+        time : array
+            The times of the points. (None = just count them)
+
+        names : list of str
+            The names of *all* the stars (not just the targets).
+            (None = '0', '1', '2', ...)
+
+        Returns
+        -------
+        lightcurves : dict
+            A dictionary of {name:LightCurve}, one for each target,
+            normalized to a median of 1.
+        '''
+        if time is None:
+            time = np.arange(len(self.flux))
+        if names is None:
+            names = ['{}'.format(i) for i in range(np.max(np.concatenate([self.targets, self.comparisons])) + 1)]
+        return {names[t]:LightCurve(time=np.asarray(time), flux=self.flux[:, i], flux_err=self.flux_err[:, i])
+                for i, t in enumerate(self.targets)}
+
+def differential_lightcurves(lightcurves, targets=None, comparisons=None, **kw):
+    '''
+    Divide each of a bunch of light curves (all with the same times)
+    by an ensemble of the others.
+
+    Parameters
+    ----------
+    lightcurves : dict
+        A dictionary of {name:LightCurve} (like from `extract_lightcurves`
+        or `Loupe.make_lightcurves`).
+
+    targets : list of str
+        The names of the stars we want light curves for. (None = all)
+
+    comparisons : list of str
+        The names of the stars that can be used as comparisons. (None = all)
+
+    **kw : dict
+        Passed to `EnsemblePhotometry` (like `clip` and `maxiters`).
+
+    Returns
+    -------
+    lightcurves : dict
+        A dictionary of {name:LightCurve}, one for each target,
+        normalized to a median of 1.
+    '''
+    names = list(lightcurves.keys())
+    flux = np.transpose([np.asarray(lightcurves[k].flux, dtype=float) for k in names])
+    flux_err = np.transpose([np.asarray(lightcurves[k].flux_err, dtype=float) for k in names])
+    if not np.any(np.isfinite(flux_err)):
+        flux_err = None
+
+    def indices(which):
+        return None if which is None else np.array([names.index(k) for k in which])
+
+    ensemble = EnsemblePhotometry(flux, flux_err=flux_err,
+                                  targets=indices(targets),
+                                  comparisons=indices(comparisons), **kw)
+    return ensemble.lightcurves(time=lightcurves[names[0]].time, names=names)
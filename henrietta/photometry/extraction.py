@@ -0,0 +1,819 @@
+'''
+Tools to measure light curves for lots of apertures across a whole
+stack of images at once. The pixel weights of every aperture get
+figured out just once, and stored as one big (sparse) matrix, so
+measuring the fluxes in every aperture in every image is a single
+matrix multiplication.
+
+If the stars move around from image to image, the apertures can follow
+them instead. Then each aperture gets placed (in each image) from a small
+set of pixel weight "templates", one for each sub-pixel offset, so we
+never need to make new photutils apertures for every image. (All the
+templates are kept in a `TemplateCache`, so changing the aperture size
+back and forth, or measuring the same apertures again, doesn't need
+any new templates at all.)
+'''
+
+from ..imports import *
+import photutils
+from scipy import sparse
+from photutils.geometry import circular_overlap_grid
+from collections import OrderedDict
+from lightkurve import LightCurve
+from .centroid import batch_centroids
+
+def masks_to_weights(masks, shape):
+    '''
+    Pack a list of photutils aperture masks into one sparse matrix.
+
+    Parameters
+    ----------
+    masks : list of photutils.ApertureMask
+        The masks (from `aperture.to_mask()`), one per aperture.
+
+    shape : tuple
+        The (ny, nx) shape of the images.
+
+    Returns
+    -------
+    weights : scipy.sparse.csr_matrix
+        A (napertures, ny*nx) matrix, where each row holds the weight
+        of every pixel in the image for that aperture.
+    '''
+    ny, nx = shape
+    rows, columns, values = [], [], []
+    for i, mask in enumerate(masks):
+
+        # figure out which pixels this mask covers
+        y, x = np.nonzero(mask.data)
+        w = mask.data[y, x]
+        y, x = y + mask.bbox.iymin, x + mask.bbox.ixmin
+
+        # ignore any that fall off the edge of the image
+        ok = (x >= 0) & (x < nx) & (y >= 0) & (y < ny)
+        rows.append(np.full(np.sum(ok), i))
+        columns.append(y[ok]*nx + x[ok])
+        values.append(w[ok])
+
+    return sparse.csr_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(columns))),
+                             shape=(len(masks), ny*nx))
+
+def _overlap_grid(radius, dx, dy, h, method='exact'):
+    '''
+    The overlap of a circle (centered at (dx, dy) from the center of
+    the middle pixel) with a (2h+1, 2h+1) grid of pixels.
+    '''
+    n = 2*h + 1
+    return circular_overlap_grid(-h - 0.5 - dx, h + 0.5 - dx, -h - 0.5 - dy, h + 0.5 - dy,
+                                 n, n, radius, int(method == 'exact'), 1)
+
+def circle_template(radius, dx=0.0, dy=0.0, method='exact'):
+    '''
+    Calculate the pixel weights for a circle centered at a
+    sub-pixel offset (dx, dy) from the center of a pixel.
+
+    Parameters
+    ----------
+    radius : float
+        The radius of the circle, in pixels.
+
+    dx, dy : float
+        The offset of the circle center from the pixel center.
+
+    method : str
+        'exact' = by the fraction of each pixel that's inside,
+        'center' = all or nothing, depending on the pixel center.
+
+    Returns
+    -------
+    y, x : arrays
+        The offsets (in whole pixels) of the pixels the circle touches.
+
+    weights : array
+        The weight of each of those pixels.
+    '''
+    h = int(np.ceil(radius + np.hypot(dx, dy))) + 1
+    grid = _overlap_grid(radius, dx, dy, h, method=method)
+    y, x = np.nonzero(grid)
+    return y - h, x - h, grid[y, x]
+
+def annulus_template(inner, outer, dx=0.0, dy=0.0, method='center'):
+    '''
+    Calculate the pixel weights for an annulus centered at a
+    sub-pixel offset (dx, dy) from the center of a pixel.
+
+    Parameters
+    ----------
+    inner, outer : float
+        The inner and outer radii of the annulus, in pixels.
+
+    dx, dy : float
+        The offset of the annulus center from the pixel center.
+
+    method : str
+        'exact' = by the fraction of each pixel that's inside,
+        'center' = all or nothing, depending on the pixel center.
+
+    Returns
+    -------
+    y, x : arrays
+        The offsets (in whole pixels) of the pixels in the annulus.
+
+    weights : array
+        The weight of each of those pixels.
+    '''
+    outer = np.maximum(outer, inner + 1)
+    h = int(np.ceil(outer + np.hypot(dx, dy))) + 1
+    grid = _overlap_grid(outer, dx, dy, h, method=method) - _overlap_grid(inner, dx, dy, h, method=method)
+    y, x = np.nonzero(grid > 0)
+    return y - h, x - h, grid[y, x]
+
+class TemplateCache:
+    '''
+    A memory of pixel weight templates for apertures and annuli,
+    each keyed by its radii and its sub-pixel offset, so each one
+    only ever has to be calculated once. (Placing a template at some
+    whole pixel is just adding to its pixel offsets.)
+    '''
+
+    def __init__(self, maxsize=100e6):
+        '''
+        Initialize a template cache.
+
+        Parameters
+        ----------
+        maxsize : float
+            The maximum total size of the templates, in bytes. When it
+            gets bigger than this, the least recently used ones get forgotten.
+        '''
+        self.maxsize = maxsize
+        self.templates = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, make):
+        '''
+        Look up a template (or make it with `make()`, if it's not there yet).
+
+        Parameters
+        ----------
+        key : tuple
+            Something that uniquely identifies the template.
+
+        make : function
+            A function that returns the (y, x, weights) of the template.
+
+        Returns
+        -------
+        y, x, weights : arrays
+            The template (see `circle_template`).
+        '''
+        if key in self.templates:
+            # mark this template as recently used
+            self.templates.move_to_end(key)
+            self.hits += 1
+            return self.templates[key]
+
+        self.misses += 1
+        template = make()
+        self.templates[key] = template
+        self.size += sum(a.nbytes for a in template)
+
+        # make sure the cache doesn't get too big
+        while self.size > self.maxsize and len(self.templates) > 1:
+            _, forgotten = self.templates.popitem(last=False)
+            self.size -= sum(a.nbytes for a in forgotten)
+        return template
+
+    def aperture(self, radius, dx=0.0, dy=0.0, method='exact'):
+        '''
+        Get the template for a circular aperture (see `circle_template`).
+        '''
+        key = ('aperture', float(radius), float(dx), float(dy), method)
+        return self.get(key, lambda: circle_template(radius, dx, dy, method=method))
+
+    def annulus(self, inner, outer, dx=0.0, dy=0.0, method='center'):
+        '''
+        Get the template for an annulus (see `annulus_template`).
+        '''
+        key = ('annulus', float(inner), float(outer), float(dx), float(dy), method)
+        return self.get(key, lambda: annulus_template(inner, outer, dx, dy, method=method))
+
+    def clear(self):
+        '''
+        Forget all the templates.
+        '''
+        self.templates.clear()
+        self.size = 0
+
+# (one cache that everything shares)
+template_cache = TemplateCache()
+
+def _split_positions(positions, subpixels=None):
+    '''
+    Split positions into whole pixels and sub-pixel offsets
+    (rounded to the nearest 1/subpixels of a pixel, if subpixels isn't None).
+    '''
+    positions = np.asarray(positions, dtype=float)
+    whole = np.round(positions)
+    offsets = positions - whole
+    if subpixels is not None:
+        offsets = np.round(offsets*subpixels)/subpixels
+    return whole.astype(int), offsets
+
+def _place_templates(positions, make_template, subpixels=None):
+    '''
+    Round positions to the nearest 1/subpixels of a pixel (if subpixels
+    isn't None), and look up one template (with `make_template(dx, dy)`) for each different
+    sub-pixel offset that's needed.
+
+    Returns
+    -------
+    iy, ix : arrays
+        The whole pixel nearest to each position.
+
+    y, x, weights : arrays
+        The template pixel offsets and weights for each position, with
+        shape positions.shape[:-1] + (npixels,). (Padded with weights of 0.)
+    '''
+    whole, offsets = _split_positions(positions, subpixels)
+    keys, which = np.unique(offsets.reshape(-1, 2), axis=0, return_inverse=True)
+
+    # look up each template, and pad them all to the same length
+    templates = [make_template(dx, dy) for dx, dy in keys]
+    npixels = max(len(t[2]) for t in templates)
+    y, x, weights = np.zeros((3, len(templates), npixels))
+    for i, t in enumerate(templates):
+        y[i, :len(t[2])], x[i, :len(t[2])], weights[i, :len(t[2])] = t
+
+    which = which.reshape(whole.shape[:-1])
+    return whole[..., 1], whole[..., 0], y[which].astype(int), x[which].astype(int), weights[which]
+
+def template_weights(positions, shape, make_template, subpixels=None):
+    '''
+    Build a sparse matrix of pixel weights, by placing a template
+    (from `make_template(dx, dy)`) at each position.
+
+    Parameters
+    ----------
+    positions : array
+        The (x, y) pixel positions, with shape (napertures, 2).
+
+    shape : tuple
+        The (ny, nx) shape of the images.
+
+    make_template : function
+        A function that returns the (y, x, weights) template for a
+        sub-pixel offset (dx, dy), like `template_cache.aperture`.
+
+    subpixels : int
+        If not None, round the offsets to the nearest 1/subpixels
+        of a pixel (so more positions can share a template).
+
+    Returns
+    -------
+    weights : scipy.sparse.csr_matrix
+        A (napertures, ny*nx) matrix of pixel weights.
+    '''
+    ny, nx = shape
+    iy, ix, y, x, w = _place_templates(np.atleast_2d(positions), make_template, subpixels=subpixels)
+    y, x = y + iy[:, np.newaxis], x + ix[:, np.newaxis]
+
+    # ignore any pixels that fall off the edge of the image (or are just padding)
+    ok = (x >= 0) & (x < nx) & (y >= 0) & (y < ny) & (w != 0)
+    rows = np.broadcast_to(np.arange(len(w))[:, np.newaxis], w.shape)
+    return sparse.csr_matrix((w[ok], (rows[ok], y[ok]*nx + x[ok])), shape=(len(w), ny*nx))
+
+def aperture_weights(positions, shape, radius=5, method='exact', subpixels=100):
+    '''
+    Calculate the pixel weights for circular apertures.
+
+    Parameters
+    ----------
+    positions : array
+        The (x, y) pixel positions of the aperture centers,
+        with shape (napertures, 2).
+
+    shape : tuple
+        The (ny, nx) shape of the images.
+
+    radius : float
+        The radius of the apertures, in pixels.
+
+    method : str
+        How to handle pixels on the edge of the aperture
+        ('exact' = by the fraction of the pixel that's inside,
+        'center' = all or nothing, depending on the pixel center).
+
+    subpixels : int
+        Round the aperture centers to the nearest 1/subpixels of a pixel,
+        so apertures at different positions can share cached templates.
+        (None = use the exact centers, with one template for each.)
+
+    Returns
+    -------
+    weights : scipy.sparse.csr_matrix
+        A (napertures, ny*nx) matrix of pixel weights.
+    '''
+    return template_weights(positions, shape,
+                            lambda dx, dy: template_cache.aperture(radius, dx, dy, method=method),
+                            subpixels=subpixels)
+
+def annulus_weights(positions, shape, inner=15, outer=25, method='exact', subpixels=100):
+    '''
+    Calculate the pixel weights for circular annuli.
+
+    Parameters
+    ----------
+    positions : array
+        The (x, y) pixel positions of the annulus centers,
+        with shape (napertures, 2).
+
+    shape : tuple
+        The (ny, nx) shape of the images.
+
+    inner, outer : float
+        The inner and outer radii of the annulus, in pixels.
+
+    method : str
+        How to handle pixels on the edge of the annulus
+        (see `aperture_weights`).
+
+    subpixels : int
+        Round the annulus centers to the nearest 1/subpixels of a pixel
+        (see `aperture_weights`). (None = use the exact centers.)
+
+    Returns
+    -------
+    weights : scipy.sparse.csr_matrix
+        A (napertures, ny*nx) matrix of pixel weights.
+    '''
+    return template_weights(positions, shape,
+                            lambda dx, dy: template_cache.annulus(inner, outer, dx, dy, method=method),
+                            subpixels=subpixels)
+
+def annulus_pixels(positions, shape, inner=15, outer=25):
+    '''
+    Figure out which pixels are in the background annulus
+    around each aperture (using whole pixels, by their centers).
+
+    Parameters
+    ----------
+    positions : array
+        The (x, y) pixel positions of the aperture centers,
+        with shape (napertures, 2).
+
+    shape : tuple
+        The (ny, nx) shape of the images.
+
+    inner, outer : float
+        The inner and outer radii of the annulus, in pixels.
+
+    Returns
+    -------
+    pixels : list of arrays
+        For each aperture, the (flattened) indices of its annulus pixels.
+    '''
+    weights = annulus_weights(positions, shape, inner, outer, method='center')
+    return np.split(weights.indices, weights.indptr[1:-1])
+
+def annulus_pixel_grid(positions, shape, inner=15, outer=25):
+    '''
+    Gather the background annulus pixels of every aperture into one
+    padded (napertures, npixels) grid of pixel indices, along with a
+    mask saying which entries are real pixels (and which are padding).
+
+    Parameters
+    ----------
+    positions : array
+        The (x, y) pixel positions of the aperture centers,
+        with shape (napertures, 2).
+
+    shape : tuple
+        The (ny, nx) shape of the images.
+
+    inner, outer : float
+        The inner and outer radii of the annulus, in pixels.
+
+    Returns
+    -------
+    indices : array
+        The (flattened) image indices of each aperture's annulus pixels,
+        with shape (napertures, npixels). (Padding entries point at pixel 0.)
+
+    mask : array
+        A boolean array with the same shape, which is True for real
+        annulus pixels and False for padding.
+    '''
+    pixels = annulus_pixels(positions, shape, inner, outer)
+    npixels = np.array([len(p) for p in pixels])
+    mask = np.arange(np.max(npixels, initial=1))[np.newaxis, :] < npixels[:, np.newaxis]
+    indices = np.zeros(mask.shape, dtype=int)
+    indices[mask] = np.concatenate(pixels)
+    return indices, mask
+
+def _search_sorted_rows(ordered, value, side='left'):
+    '''
+    Like `np.searchsorted`, but for every row of an array of sorted rows
+    at once (with a different value for each row), using a binary search.
+
+    Parameters
+    ----------
+    ordered : array
+        Rows of sorted values, with shape (..., npixels).
+
+    value : array
+        The value to look for in each row, with shape (...).
+
+    side : str
+        'left' to count the values < value,
+        'right' to count the values <= value.
+
+    Returns
+    -------
+    count : array
+        The number of values in each row that are below `value`.
+    '''
+    length = ordered.shape[-1]
+    low = np.zeros(ordered.shape[:-1], dtype=int)
+    high = np.full(ordered.shape[:-1], length)
+    for _ in range(int(np.ceil(np.log2(length + 1)))):
+        middle = (low + high)//2
+        v = np.take_along_axis(ordered, np.minimum(middle, length - 1)[..., np.newaxis], axis=-1)[..., 0]
+        with np.errstate(invalid='ignore'):
+            below = (v < value) if side == 'left' else (v <= value)
+        below &= low < high
+        low = np.where(below, middle + 1, low)
+        high = np.where(below | (low >= high), high, middle)
+    return low
+
+def sigma_clipped_background(values, mask, sigma=3.0, maxiters=5):
+    '''
+    Estimate the background with iterative sigma clipping (like
+    `astropy.stats.sigma_clipped_stats`), for lots of apertures
+    and frames at once.
+
+    Each round, we find the median and standard deviation of the
+    pixels we're still using, and then drop any pixels more than
+    `sigma` standard deviations away from the median, until nothing
+    changes (or we run out of iterations).
+
+    To make this fast, each row gets sorted just once. After that, the
+    pixels we're still using are always a continuous slice of the sorted
+    row, so every round only needs to move the two ends of the slice
+    (with a binary search), and the median, mean, and standard deviation of the slice come
+    straight from the sorted values and their running sums.
+
+    Parameters
+    ----------
+    values : array
+        The background pixel values, with shape (..., npixels)
+        (like (nframes, napertures, npixels)).
+
+    mask : array
+        A boolean array (that can be broadcast to the same shape), which
+        is True for real pixels, and False for padding. (NaN pixels are
+        always ignored.)
+
+    sigma : float
+        How many standard deviations away does a pixel need to be to get clipped?
+
+    maxiters : int
+        The most rounds of clipping to do.
+
+    Returns
+    -------
+    median : array
+        The sigma-clipped median of each row, with shape (...).
+
+    std : array
+        The sigma-clipped standard deviation of each row, with shape (...).
+    '''
+
+    # sort each row (with the pixels we shouldn't use, and NaNs, pushed to the end)
+    ordered = np.where(mask, values, np.inf)
+    ordered.sort(axis=-1)
+    n = _search_sorted_rows(ordered, np.inf, 'left')
+
+    def pick(i):
+        i = np.clip(i, 0, ordered.shape[-1] - 1)
+        return np.take_along_axis(ordered, i[..., np.newaxis], axis=-1)[..., 0]
+
+    # keep running sums (relative to the unclipped median, to avoid round-off)
+    # (these are garbage past the first n values in each row, but we never look there)
+    reference = np.nan_to_num(0.5*(pick((n - 1)//2) + pick(n//2)), posinf=0.0)
+    shifted = ordered - reference[..., np.newaxis]
+    sums = np.zeros(shifted.shape[:-1] + (shifted.shape[-1] + 1,))
+    squares = np.zeros_like(sums)
+    np.cumsum(shifted, axis=-1, out=sums[..., 1:])
+    np.cumsum(np.square(shifted, out=shifted), axis=-1, out=squares[..., 1:])
+
+    # the pixels we're using are ordered[..., low:high]
+    low, high = np.zeros_like(n), n
+    for i in range(maxiters + 1):
+
+        # calculate the statistics for the pixels we're still using
+        count = high - low
+        median = 0.5*(pick(low + (count - 1)//2) + pick(low + count//2))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = (np.take_along_axis(sums, high[..., np.newaxis], axis=-1)[..., 0] -
+                    np.take_along_axis(sums, low[..., np.newaxis], axis=-1)[..., 0])/count
+            meansquare = (np.take_along_axis(squares, high[..., np.newaxis], axis=-1)[..., 0] -
+                          np.take_along_axis(squares, low[..., np.newaxis], axis=-1)[..., 0])/count
+            std = np.sqrt(np.maximum(meansquare - mean**2, 0))
+        if i == maxiters:
+            break
+
+        # clip any outliers (and stop if there weren't any)
+        newlow = np.maximum(low, _search_sorted_rows(ordered, median - sigma*std, 'left'))
+        newhigh = np.minimum(high, _search_sorted_rows(ordered, median + sigma*std, 'right'))
+        newhigh = np.maximum(newhigh, newlow)
+        if np.array_equal(newlow, low) and np.array_equal(newhigh, high):
+            break
+        low, high = newlow, newhigh
+
+    bad = (high - low) == 0
+    return np.where(bad, np.nan, median), np.where(bad, np.nan, std)
+
+def _gather_pixels(flat, shape, iy, ix, y, x):
+    '''
+    Pull out the template pixels for each (frame, aperture) from a
+    stack of flattened images, with shape (nframes, ny*nx).
+
+    Returns the pixel values, with shape (nframes, napertures, npixels),
+    and a mask that's True for pixels that are on the image.
+    '''
+    ny, nx = shape
+    rows = iy[..., np.newaxis] + y
+    columns = ix[..., np.newaxis] + x
+    inside = (rows >= 0) & (rows < ny) & (columns >= 0) & (columns < nx)
+    index = np.where(inside, rows*nx + columns, 0)
+    values = np.take_along_axis(flat, index.reshape(len(flat), -1), axis=1).reshape(index.shape)
+    return values, inside
+
+def track_positions(cube, positions, offsets=None, track=True, boxsize=11):
+    '''
+    Figure out where each aperture should go in each image.
+
+    Parameters
+    ----------
+    cube : array
+        The images, with shape (nframes, ny, nx).
+
+    positions : array
+        The (x, y) pixel positions of the apertures in the first image
+        (or the reference image, if there are `offsets`), with shape
+        (napertures, 2).
+
+    offsets : array
+        The (x, y) shift of each whole image, with shape (nframes, 2)
+        (like from image registration). These get added to all the positions.
+
+    track : bool
+        Should we follow each star with its centroid? If there are
+        `offsets`, each star gets centroided near its shifted position,
+        all at once. If not, we follow each star from one image to the next.
+
+    boxsize : int
+        The size of the box used to find the centroids (see `batch_centroids`).
+
+    Returns
+    -------
+    positions : array
+        The (x, y) positions of the apertures in each image,
+        with shape (nframes, napertures, 2).
+    '''
+    cube = np.asarray(cube, dtype=float)
+    positions = np.atleast_2d(positions).astype(float)
+    nframes = len(cube)
+
+    # shift everything by the offsets (if there are any)
+    if offsets is None:
+        guesses = np.broadcast_to(positions, (nframes,) + positions.shape)
+    else:
+        guesses = positions[np.newaxis, :, :] + np.asarray(offsets, dtype=float)[:, np.newaxis, :]
+    if not track:
+        return np.array(guesses)
+
+    if offsets is None:
+        # follow each star from one image to the next
+        tracked = np.zeros(guesses.shape)
+        previous = positions
+        for i in range(nframes):
+            centroids = batch_centroids(cube[i], previous, boxsize=boxsize)
+            tracked[i] = np.where(np.isfinite(centroids), centroids, previous)
+            previous = tracked[i]
+        return tracked
+    else:
+        # centroid every star in every image at once
+        centroids = batch_centroids(cube, guesses, boxsize=boxsize)
+        return np.where(np.isfinite(centroids), centroids, guesses)
+
+def _moving_photometry(cube, positions, aperture_radius=5,
+                       subtract_background=False, background_radii=[15, 25],
+                       chunksize=5, subpixels=20):
+    '''
+    Measure the flux in apertures that move from image to image
+    (see `_aperture_photometry`), for positions with shape (nframes, napertures, 2).
+    '''
+    cube = np.asarray(cube, dtype=float)
+    positions = np.asarray(positions, dtype=float)
+    nframes, ny, nx = cube.shape
+    flat = cube.reshape(nframes, ny*nx)
+
+    flux, sky, area, skystd = np.zeros((4,) + np.shape(positions)[:-1])
+    for start in range(0, nframes, chunksize):
+        chunk = slice(start, start + chunksize)
+
+        # figure out the aperture (and background) pixels for each aperture
+        # in just these images (so memory stays limited by the chunksize)
+        iy, ix, y, x, weights = _place_templates(positions[chunk],
+                                                 lambda dx, dy: template_cache.aperture(aperture_radius, dx, dy),
+                                                 subpixels=subpixels)
+
+        # add up the pixels in every aperture
+        values, inside = _gather_pixels(flat[chunk], (ny, nx), iy, ix, y, x)
+        weights = np.where(inside, weights, 0)
+        flux[chunk] = np.sum(values*weights, axis=-1)
+        area[chunk] = np.sum(weights, axis=-1)
+
+        # subtract the background, if we're supposed to
+        if subtract_background:
+            iy, ix, y, x, ok = _place_templates(positions[chunk],
+                                                lambda dx, dy: template_cache.annulus(*background_radii, dx, dy),
+                                                subpixels=subpixels)
+            values, inside = _gather_pixels(flat[chunk], (ny, nx), iy, ix, y, x)
+            median, skystd[chunk] = sigma_clipped_background(values, inside & (ok > 0))
+            sky[chunk] = median*area[chunk]
+
+    return flux - sky, sky, area, skystd
+
+def extract_photometry(cube, positions,
+                       aperture_radius=5,
+                       subtract_background=False,
+                       background_radii=[15, 25],
+                       chunksize=5,
+                       offsets=None,
+                       track=False,
+                       boxsize=11,
+                       subpixels=20):
+    '''
+    Measure the flux in circular apertures, for a whole stack of images.
+
+    Parameters
+    ----------
+    cube : array
+        The images, with shape (nframes, ny, nx).
+
+    positions : array
+        The (x, y) pixel positions of the aperture centers,
+        with shape (napertures, 2). (Or, for apertures that
+        move, with shape (nframes, napertures, 2).)
+
+    aperture_radius : float
+        The radius of the apertures, in pixels.
+
+    subtract_background : bool
+        Should we subtract the (sigma-clipped median) background,
+        measured in an annulus around each aperture?
+
+    background_radii : list of two floats
+        The inner and outer radii of the background annulus.
+
+    chunksize : int
+        How many images at a time to estimate the background for.
+        (Small chunks stay in the computer's fast memory cache,
+        so this doesn't need to be big to be fast.)
+
+    offsets : array
+        The (x, y) shift of each whole image, with shape (nframes, 2),
+        for the apertures to follow (see `track_positions`).
+
+    track : bool
+        Should the apertures follow the stars' centroids from
+        image to image? (see `track_positions`)
+
+    boxsize : int
+        The size of the box for finding centroids, if we're tracking.
+
+    subpixels : int
+        For apertures that move, the aperture centers get
+        rounded to the nearest 1/subpixels of a pixel.
+
+    Returns
+    -------
+    flux : array
+        The (background-subtracted) flux in each aperture in each image,
+        with shape (nframes, napertures).
+
+    sky : array
+        The background that was subtracted from each aperture (the
+        median sky per pixel times the area of the aperture),
+        with shape (nframes, napertures). (All zeros if we're not
+        subtracting the background.)
+    '''
+
+    flux, sky, _, _ = _aperture_photometry(cube, positions, aperture_radius=aperture_radius,
+                                           subtract_background=subtract_background,
+                                           background_radii=background_radii,
+                                           chunksize=chunksize, offsets=offsets, track=track,
+                                           boxsize=boxsize, subpixels=subpixels)
+    return flux, sky
+
+def _aperture_photometry(cube, positions, aperture_radius=5,
+                         subtract_background=False, background_radii=[15, 25],
+                         chunksize=5, offsets=None, track=False, boxsize=11, subpixels=20):
+    '''
+    Measure the flux in circular apertures (see `extract_photometry`),
+    also keeping what's needed to estimate the uncertainties.
+
+    Returns
+    -------
+    flux, sky : arrays
+        The same as from `extract_photometry`.
+
+    area : array
+        The area of each aperture, in pixels (same shape).
+
+    skystd : array
+        The (sigma-clipped) standard deviation of the background pixels
+        around each aperture (same shape). (All zeros if we're not
+        subtracting the background.)
+    '''
+
+    cube = np.asarray(cube, dtype=float)
+    nframes, ny, nx = cube.shape
+    flat = cube.reshape(nframes, ny*nx)
+
+    # if the apertures need to move, place them in each image separately
+    if (offsets is not None) or track:
+        positions = track_positions(cube, positions, offsets=offsets, track=track, boxsize=boxsize)
+    if np.ndim(positions) == 3:
+        return _moving_photometry(cube, positions, aperture_radius=aperture_radius,
+                                  subtract_background=subtract_background,
+                                  background_radii=background_radii,
+                                  chunksize=chunksize, subpixels=subpixels)
+
+    # add up the pixels in every aperture, in every image, all at once
+    weights = aperture_weights(positions, (ny, nx), radius=aperture_radius)
+    flux = (weights.dot(flat.T)).T
+    area = np.asarray(weights.sum(axis=1)).flatten()
+
+    # subtract the background, if we're supposed to
+    sky = np.zeros_like(flux)
+    skystd = np.zeros_like(flux)
+    if subtract_background:
+        indices, mask = annulus_pixel_grid(positions, (ny, nx), *background_radii)
+        for start in range(0, nframes, chunksize):
+            # (values has shape (nframes in this chunk, napertures, npixels))
+            values = flat[start:start + chunksize, indices]
+            median, skystd[start:start + chunksize] = sigma_clipped_background(values, mask)
+            sky[start:start + chunksize] = median*area[np.newaxis, :]
+        flux = flux - sky
+
+    return flux, sky, np.broadcast_to(area, flux.shape), skystd
+
+def extract_lightcurves(cube, positions, time=None, names=None, gain=1.0, **kw):
+    '''
+    Make light curves for lots of apertures, from a whole stack of images.
+
+    Parameters
+    ----------
+    cube : array
+        The images, with shape (nframes, ny, nx).
+
+    positions : array
+        The (x, y) pixel positions of the aperture centers,
+        with shape (napertures, 2).
+
+    time : array
+        The times of the images (as JD). (None = just count the images)
+
+    names : list of str
+        The names of the apertures. (None = '0', '1', '2', ...)
+
+    gain : float
+        The number of photons (electrons) per count in the images,
+        for the photon noise in the uncertainties.
+
+    **kw : dict
+        Passed to `extract_photometry` (like `aperture_radius`,
+        `subtract_background`, `background_radii`, and `track`).
+
+    Returns
+    -------
+    lightcurves : dict
+        A dictionary of {name:LightCurve}, one for each aperture.
+        The uncertainties are the photon noise from the star (and from
+        the sky, if it isn't subtracted) plus the scatter of the
+        background pixels, added up over the area of the aperture.
+    '''
+    flux, sky, area, skystd = _aperture_photometry(cube, positions, **kw)
+    flux_err = np.sqrt(np.abs(flux)/gain + area*skystd**2)
+    if time is None:
+        time = np.arange(len(flux))
+    if names is None:
+        names = ['{}'.format(i) for i in range(flux.shape[1])]
+    return {k:LightCurve(time=np.asarray(time), flux=flux[:, i], flux_err=flux_err[:, i])
+            for i, k in enumerate(names)}
@@ -0,0 +1,226 @@
+'''
+Tools to pick a good aperture size, by measuring each star's
+"curve of growth" (how much flux is inside a circle, as the
+circle gets bigger) for a whole stack of images at once.
+
+For each star, the pixels around it are sorted by their distance
+from the star just once. Then, adding up the sorted pixels gives the
+flux inside every possible radius at the same time, so trying lots of
+different radii costs no more than measuring just one.
+'''
+
+from ..imports import *
+from .extraction import annulus_pixel_grid, sigma_clipped_background
+
+class CurveOfGrowth:
+    '''
+    The curves of growth for a bunch of stars, measured
+    across a whole stack of images (in one pass).
+    '''
+
+    def __init__(self, cube, positions, rmax=15, background_radii=[15, 25], gain=1.0, chunksize=5):
+        '''
+        Measure the curves of growth.
+
+        Parameters
+        ----------
+        cube : array
+            The images, with shape (nframes, ny, nx).
+
+        positions : array
+            The (x, y) pixel positions of the stars,
+            with shape (nstars, 2).
+
+        rmax : float
+            The biggest aperture radius we might want, in pixels.
+
+        background_radii : list of two floats
+            The inner and outer radii of the background annulus
+            (whose sigma-clipped median gets subtracted from every pixel).
+
+        gain : float
+            The number of photons per unit of pixel value (used
+            to estimate the photon noise of the flux).
+
+        chunksize : int
+            How many images to work on at a time.
+        '''
+
+        cube = np.asarray(cube, dtype=float)
+        if cube.ndim == 2:
+            cube = cube[np.newaxis, :, :]
+        nframes, ny, nx = cube.shape
+        flat = cube.reshape(nframes, ny*nx)
+        self.positions = np.atleast_2d(positions).astype(float)
+        self.nframes = nframes
+
+        # figure out the distance of each pixel (in a box around each star) from the star
+        h = int(np.ceil(rmax)) + 1
+        y, x = [a.flatten() for a in np.mgrid[-h:h + 1, -h:h + 1]]
+        whole = np.round(self.positions).astype(int)
+        ix, iy = whole[:, 0], whole[:, 1]
+        x, y = np.broadcast_to(x, (len(whole), len(x))), np.broadcast_to(y, (len(whole), len(y)))
+        distance = np.hypot(ix[:, np.newaxis] + x - self.positions[:, 0, np.newaxis],
+                            iy[:, np.newaxis] + y - self.positions[:, 1, np.newaxis])
+
+        # (pixels off the edge of the image never count)
+        columns, rows = ix[:, np.newaxis] + x, iy[:, np.newaxis] + y
+        inside = (columns >= 0) & (columns < nx) & (rows >= 0) & (rows < ny)
+        distance[~inside] = np.inf
+
+        # sort the pixels by distance, just once
+        order = np.argsort(distance, axis=1, kind='stable')
+        self.distance = np.take_along_axis(distance, order, axis=1)
+        pixels = np.take_along_axis(np.where(inside, rows*nx + columns, 0), order, axis=1)
+        inside = np.take_along_axis(inside, order, axis=1)
+        npixels = np.arange(1, self.distance.shape[1] + 1)
+
+        # set up the background pixels
+        indices, mask = annulus_pixel_grid(self.positions, (ny, nx), *background_radii)
+
+        # add up the sorted pixels for each star, in every image (in chunks)
+        self._sum = np.zeros(self.distance.shape)
+        self._variance = np.zeros(self.distance.shape)
+        self._jumps = np.zeros(self.distance.shape)
+        previous = None
+        for start in range(0, nframes, chunksize):
+            chunk = flat[start:start + chunksize]
+            sky, skystd = sigma_clipped_background(chunk[:, indices], mask)
+
+            # the flux inside every radius, minus the background
+            values = np.where(inside, chunk[:, pixels], 0)
+            net = np.cumsum(values, axis=-1) - sky[:, :, np.newaxis]*npixels
+
+            # keep track of the total, the expected noise, and the scatter from image to image
+            self._sum += np.sum(net, axis=0)
+            self._variance += np.sum(np.abs(net)/gain + npixels*skystd[:, :, np.newaxis]**2, axis=0)
+            if previous is not None:
+                net = np.concatenate([previous, net])
+            self._jumps += np.sum(np.diff(net, axis=0)**2, axis=0)
+            previous = net[-1:]
+
+    def _lookup(self, quantity, radii):
+        '''
+        Read a (nstars, npixels) running total off at some radii,
+        giving an array with shape (nstars, nradii).
+        '''
+        radii = np.atleast_1d(radii)
+        index = np.array([np.searchsorted(d, radii, side='right') for d in self.distance]) - 1
+        values = np.take_along_axis(quantity, np.maximum(index, 0), axis=1)
+        return np.where(index >= 0, values, 0.0)
+
+    def flux(self, radii):
+        '''
+        The average (background-subtracted) flux inside each radius.
+
+        Parameters
+        ----------
+        radii : array
+            The aperture radii, in pixels. (Pixels count if their
+            centers are inside the aperture.)
+
+        Returns
+        -------
+        flux : array
+            The flux of each star inside each radius,
+            with shape (nstars, nradii).
+        '''
+        return self._lookup(self._sum, radii)/self.nframes
+
+    def noise(self, radii, method=None):
+        '''
+        The noise on the flux inside each radius.
+
+        Parameters
+        ----------
+        radii : array
+            The aperture radii, in pixels.
+
+        method : str
+            'scatter' = the typical change in flux from one image to
+            the next (divided by sqrt(2)), which includes every kind of noise;
+            'expected' = photon noise from the star plus the
+            scatter of the background pixels.
+            (None = 'scatter' if there are at least 3 images.)
+
+        Returns
+        -------
+        noise : array
+            The noise for each star inside each radius,
+            with shape (nstars, nradii).
+        '''
+        if method is None:
+            method = 'scatter' if self.nframes >= 3 else 'expected'
+        if method == 'scatter':
+            return np.sqrt(self._lookup(self._jumps, radii)/(2*(self.nframes - 1)))
+        else:
+            return np.sqrt(self._lookup(self._variance, radii)/self.nframes)
+
+    def snr(self, radii, method=None):
+        '''
+        The signal-to-noise ratio of the flux inside each radius,
+        with shape (nstars, nradii). (see `noise`)
+        '''
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return self.flux(radii)/self.noise(radii, method=method)
+
+    def best_radius(self, radii=None, each=True, method=None):
+        '''
+        Find the aperture radius that gives the highest signal-to-noise.
+
+        Parameters
+        ----------
+        radii : array
+            The radii to choose from. (None = every half pixel.)
+
+        each : bool
+            If True, pick a radius for each star. If False, pick one radius
+            for all the stars (the one where the typical star's signal-to-noise
+            is closest to the best it could be).
+
+        method : str
+            How to estimate the noise (see `noise`).
+
+        Returns
+        -------
+        radius : array or float
+            The best radius for each star (if `each`), or for all of them.
+        '''
+        if radii is None:
+            radii = np.arange(1, np.max(self.distance[np.isfinite(self.distance)]), 0.5)
+        radii = np.atleast_1d(radii)
+        snr = np.nan_to_num(self.snr(radii, method=method), nan=-np.inf)
+        if each:
+            return radii[np.argmax(snr, axis=1)]
+        else:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                relative = snr/np.max(snr, axis=1, keepdims=True)
+            return radii[np.argmax(np.nanmedian(relative, axis=0))]
+
+    def plot(self, radii=None, filename=None):
+        '''
+        Plot the (normalized) curves of growth, and the signal-to-noise,
+        for every star.
+        '''
+        if radii is None:
+            radii = np.arange(1, np.max(self.distance[np.isfinite(self.distance)]), 0.5)
+        flux = self.flux(radii)
+        snr = self.snr(radii)
+
+        fig, ax = plt.subplots(2, 1, sharex=True, figsize=(6, 6))
+        for f, s in zip(flux, snr):
+            ax[0].plot(radii, f/np.max(f), alpha=0.5)
+            ax[1].plot(radii, s/np.nanmax(s), alpha=0.5)
+        ax[0].set_ylabel('Flux (normalized)')
+        ax[1].set_ylabel('S/N (normalized)')
+        ax[1].set_xlabel('Aperture Radius (pixels)')
+        if filename is not None:
+            plt.savefig(filename)
+        return fig
+
+def curve_of_growth(cube, positions, **kw):
+    '''
+    Measure the curves of growth for a bunch of stars
+    (see `CurveOfGrowth` for the keywords).
+    '''
+    return CurveOfGrowth(cube, positions, **kw)
@@ -1,8 +1,12 @@
 import illumination as il
 from ..imports import *
 from .apertures import *
+from .extraction import *
+from .growth import CurveOfGrowth
+from .differential import differential_lightcurves
+from .detection import ApertureIndex, median_image, find_sources, separate_sources
 from ..imaging import io
-from tqdm import tqdm
+from ..imaging.registration import register_images
 
 from IPython.display import display
 
@@ -10,7 +14,6 @@ from IPython.display import display
 #from IPython import get_ipython
 #get_ipython().run_line_magic('matplotlib', 'widget')
 
-from astropy.table import vstack
 import ipywidgets as widgets
 
 from lightkurve import LightCurve
@@ -128,6 +131,9 @@ class Loupe(il.IllustrationBase):
         #widgets.jslink([aperture_radius_slider, 'value'],
         #               [aperture_radius_text, 'value'])
 
+        # (keep track of the radius box, so it can be changed from code too)
+        self._widget_aperture_radius = aperture_radius_text
+
         # make the combined aperture widget
         self._widget_aperture = widgets.VBox([aperture_radius_label,
                                               #aperture_radius_slider,
@@ -323,8 +329,10 @@ class Loupe(il.IllustrationBase):
 
 
         # start with no apertures defined
+        # (the index keeps track of where they are, to quickly find the closest one)
         self.apertures = []
         self.napertures = 0
+        self.index = ApertureIndex()
 
     def do_something_with_keyboard(self, event):
         '''
@@ -359,23 +367,28 @@ class Loupe(il.IllustrationBase):
         #with self.out:
         #    print('adding aperture at {}'.format((x,y)))
         position = np.array([x,y])
-        name = '{}'.format(self.napertures)
-
-        new = InteractiveAperture(name=name,
-                                  pos=position,
-                                  loupe=self,
-                                  aperture_radius=self.aperture_radius,
-                                  subtract_background=self.subtract_background,
-                                  background_radii=self.background_radii,
-                                  )
+        new = self._new_aperture(position, '{}'.format(self.napertures))
 
         # plot this aperture on the image
         new.plot(ax=self.frames['imshow'].ax)
 
         # store this new aperture in a list
         self.apertures.append(new)
+        self.index.add(position)
         self.napertures += 1
 
+    def _new_aperture(self, position, name):
+        '''
+        Make (but don't plot or store) an aperture at an (x, y) position.
+        '''
+        return InteractiveAperture(name=name,
+                                   pos=position,
+                                   loupe=self,
+                                   aperture_radius=self.aperture_radius,
+                                   subtract_background=self.subtract_background,
+                                   background_radii=self.background_radii,
+                                   )
+
     def remove_aperture(self, x, y):
         '''
         Remove the closest aperture to the given (x,y) location.
@@ -386,14 +399,72 @@ class Loupe(il.IllustrationBase):
             The location where we want to remove an aperture.
         '''
 
-        positions = [a.positions[0] for a in self.apertures]
-        xexisting, yexisting = np.array(positions).T
-        distance = (xexisting - x)**2 + (yexisting - y)**2
-        closest = np.argmin(distance)
+        # if we have no apertures, do nothing
+        if len(self.apertures) == 0:
+            return
+
+        closest, distance = self.index.nearest(x, y)
 
         toremove = self.apertures.pop(closest)
+        self.index.remove(closest)
         toremove.erase()
 
+    def detect_apertures(self, threshold=5.0, fwhm=3.0, separation=None, max_sources=None, nframes=25, labels=True):
+        '''
+        Find stars automatically (on a median of the images), and
+        add an aperture on each one that doesn't overlap another.
+
+        Parameters
+        ----------
+        threshold : float
+            How many times the noise a star's peak must be above the background.
+
+        fwhm : float
+            The rough full-width-at-half-maximum of the stars, in pixels.
+
+        separation : float
+            The closest two apertures can be, in pixels.
+            (None = twice the aperture radius, so they don't overlap.)
+
+        max_sources : int
+            The most apertures to add (the brightest stars). (None = all)
+
+        nframes : int
+            The most images to median together, to find the stars.
+
+        labels : bool
+            Should each new aperture get its name written next to it?
+            (For hundreds of stars, leaving them off is much quicker to draw.)
+
+        Returns
+        -------
+        positions : array
+            The (x, y) positions of the new apertures, with shape (n, 2).
+        '''
+
+        # find the stars, on the median of the images
+        image = median_image(self.images._gather_3d(), nframes=nframes)
+        positions, peaks = find_sources(image, threshold=threshold, fwhm=fwhm)
+
+        # skip the ones that would overlap a brighter star, or an aperture we already have
+        if separation is None:
+            separation = 2*self.aperture_radius
+        keep = separate_sources(positions, separation, existing=self.index.positions)
+        positions = positions[keep][:max_sources]
+
+        # add all the apertures at once, drawn together (see `ApertureGroup`),
+        # and then update the plot and the photometry once
+        new = [self._new_aperture(p, '{}'.format(self.napertures + i)) for i, p in enumerate(positions)]
+        if len(new) > 0:
+            ApertureGroup(new, ax=self.frames['imshow'].ax, labels=labels)
+        self.apertures.extend(new)
+        self.index.add(positions)
+        self.napertures += len(new)
+        plt.draw()
+        self._interaction_photometry.update()
+
+        return positions
+
 
     def photometry(self, aperture_radius=5,
                          subtract_background = False,
@@ -445,8 +516,14 @@ class Loupe(il.IllustrationBase):
         self.subtract_background = subtract_background
         self.background_radii = background_radii
 
+        # measure all the apertures at once, and then hand each one its numbers
+        positions = np.array([np.atleast_2d(a.positions)[0] for a in self.apertures])
+        flux, sky = extract_photometry(image[np.newaxis, :, :], positions,
+                                       aperture_radius=self.aperture_radius,
+                                       subtract_background=self.subtract_background,
+                                       background_radii=self.background_radii)
         for i, a in enumerate(self.apertures):
-            a.update()
+            a.update(flux=flux[0, i], sky=sky[0, i])
 
         #if back_photo == True:
         #    back_table = photutils.aperture_photometry(image,back_aperture)
@@ -457,33 +534,131 @@ class Loupe(il.IllustrationBase):
         #    return flux_values,back_values*np.pi*aperture_radius**2
         #else:
 
-        self.measurements = vstack([a.table for a in self.apertures])
+        self.measurements = measurement_table([a.name for a in self.apertures],
+                                              positions[:, 0], positions[:, 1], flux[0],
+                                              sky=sky[0] if self.subtract_background else None)
 
         if not quick:
             self._widget_results.clear_output()
             with self._widget_results:
-                print('r={:.0f}px (area={:.1f}px)'.format(self.aperture_radius, self.apertures[0].area()))
+                print('r={:.0f}px (area={:.1f}px)'.format(self.aperture_radius, self.apertures[0].area))
                 print(self.measurements)
             plt.draw()
 
         return self.measurements
 
-    def make_lightcurves(self):
+    def make_lightcurves(self, track=False, register=False, differential=False, gain=1.0, **kw):
+        '''
+        Make a light curve for every aperture, across all the images.
+        (The pixel weights of all the apertures are calculated once,
+        and applied to the whole stack of images at once.)
 
-        # create an empty list of photometry tables and times
-        tables = []
-        times = []
+        Parameters
+        ----------
+        track : bool
+            Should the apertures follow the stars (by their centroids)
+            as they drift from image to image? If False, the apertures
+            stay where they were clicked.
+
+        register : bool
+            Should the apertures move with the whole image, by measuring
+            how much each image has shifted relative to the one we're
+            looking at (see `register_images`)? This is one FFT per image,
+            so it's much faster than tracking lots of stars one by one.
+
+        differential : bool
+            Should each light curve be divided by an ensemble of the
+            other apertures (see `differential_lightcurves`)? If True,
+            the raw light curves are still kept in `self.lightcurves`.
+
+        gain : float
+            The number of photons (electrons) per count in the images,
+            for the uncertainties (see `extract_lightcurves`).
+
+        **kw : dict
+            Passed to `differential_lightcurves` (like `targets`,
+            `comparisons`, and `clip`).
 
-        # loop over all the images
-        for i in tqdm(range(len(self.images))):
-            table = self.photometry(image_number=i, quick=True)
-            table.add_index('#')
-            tables.append(table)
-            times.append(self.images.time[i].jd)
+        Returns
+        -------
+        lightcurves : dict
+            A dictionary of {name:LightCurve}, one for each aperture.
+        '''
 
-        lightcurves = {}
-        for k in tables[0]['#']:
-            lightcurves[k] = LightCurve( flux=[t.loc[k]['flux'] for t in tables])
+        # pull out the whole stack of images, and their times
+        cube = self.images._gather_3d()
+        times = self.images.time.jd
+
+        # figure out how much each image has shifted (if we're supposed to)
+        offsets = None
+        if register:
+            offsets = register_images(cube, reference=self.image)
+
+        # measure all the apertures in all the images
+        lightcurves = extract_lightcurves(cube,
+                                          positions=[np.atleast_2d(a.positions)[0] for a in self.apertures],
+                                          time=times,
+                                          names=[a.name for a in self.apertures],
+                                          aperture_radius=self.aperture_radius,
+                                          subtract_background=self.subtract_background,
+                                          background_radii=self.background_radii,
+                                          track=track,
+                                          offsets=offsets,
+                                          gain=gain)
 
         self.lightcurves = lightcurves
+
+        # divide by the ensembles of comparison stars (if we're supposed to)
+        if differential:
+            self.differential_lightcurves = differential_lightcurves(lightcurves, **kw)
+            return self.differential_lightcurves
+
         return lightcurves
+
+    def choose_aperture_radius(self, radii=None, each=False, plot=True):
+        '''
+        Pick the aperture radius that gives the best signal-to-noise,
+        by measuring the curve of growth of every aperture (across all
+        the images) in one pass, instead of redoing the photometry for
+        every radius we might want to try.
+
+        Parameters
+        ----------
+        radii : array
+            The radii to choose from. (None = every half pixel,
+            up to the inner radius of the background annulus.)
+
+        each : bool
+            If True, return the best radius for each aperture.
+            If False, pick one radius for all of them, and use it
+            as this Loupe's `aperture_radius` (updating the radius box).
+
+        plot : bool
+            Should we plot the curves of growth?
+
+        Returns
+        -------
+        radius : float or array
+            The best radius (or the best radius for each aperture).
+        '''
+
+        # measure the curves of growth for all the apertures at once
+        cube = self.images._gather_3d()
+        self.growth = CurveOfGrowth(cube,
+                                    [np.atleast_2d(a.positions)[0] for a in self.apertures],
+                                    rmax=self.background_radii[0],
+                                    background_radii=self.background_radii)
+        if radii is None:
+            radii = np.arange(1, self.background_radii[0] + 0.5, 0.5)
+
+        if plot:
+            self.growth.plot(radii)
+
+        # (changing the radius box redoes the photometry and redraws the apertures)
+        best = self.growth.best_radius(radii, each=each)
+        if not each:
+            self.aperture_radius = best
+            widget = getattr(self, '_widget_aperture_radius', None)
+            if widget is not None:
+                widget.value = float(best)
+        return best
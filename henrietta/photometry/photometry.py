@@ -1,20 +1,21 @@
 import numpy as np
 import matplotlib.pyplot as plt
-import photutils
-import pdb
-plt.ion()
+from .extraction import aperture_weights, annulus_weights
 
-def photometry(ax, image,pos,ap_size=10,r_in=20,r_out=30,back_photo=True):
+def cube_photometry(cube, pos, ap_size=10, r_in=20, r_out=30, back_photo=True):
 
     '''
-    Create apertures around specified list of stars
+    Measure the flux around a list of stars, in every image of a stack.
+    (This only does the measurements; see `plot_apertures` to draw them.)
+
+    The aperture and annulus pixel weights (and areas) are calculated
+    just once, and then applied to all the images at once.
 
     Parameters:
     -----------
-    ax : axis class
-        axis of a subplot.
-    image : ndarray
-        Image for aperture photometry to be performed on.
+    cube : ndarray
+        The images, with shape (N_frames, ny, nx).
+        (A single 2D image is treated as a stack of one.)
     pos : 2darray
         A list of positions in x,y pixel coordinates for each star.
         Needs to be as [[0,0],[1,1]...]
@@ -32,56 +33,111 @@ def photometry(ax, image,pos,ap_size=10,r_in=20,r_out=30,back_photo=True):
 
     Returns
     -------
-    photometry of each star : array
-    average background pixel value around each star : array (If back_photo=True)
-    plots image with the aperture and centroids located for each star
+    photometry of each star in each image : array, with shape (N_frames, N_stars)
+    background in each star's aperture (the average background pixel value
+        around it, times the aperture area) : array, with shape (N_frames, N_stars)
+        (If back_photo=True)
     '''
 
-    nstars = np.arange(0,np.shape(pos)[0],1)
-    name_stars = []
-    for i in nstars:
-        name_stars.append('Star {}'.format(i))
-    #print name_stars
+    cube = np.asarray(cube, dtype=float)
+    if cube.ndim == 2:
+        cube = cube[np.newaxis, :, :]
+    nframes, ny, nx = cube.shape
+    flat = cube.reshape(nframes, ny*nx)
+    pos = np.atleast_2d(pos)
 
-    aperture = photutils.CircularAperture(pos,r=ap_size)
+    # add up the flux in each aperture, in every image at once
+    aperture = aperture_weights(pos, (ny, nx), radius=ap_size)
+    flux_values = aperture.dot(flat.T).T
 
     if back_photo == True:
-        back_aperture = photutils.CircularAnnulus(pos,r_in,r_out)
+        # average the background in each annulus (using the area that's on the image)
+        annulus = annulus_weights(pos, (ny, nx), r_in, r_out)
+        area = np.asarray(annulus.sum(axis=1)).flatten()
+        back_values = annulus.dot(flat.T).T/area[np.newaxis, :]
+        return flux_values, back_values*np.pi*ap_size**2
+    else:
+        return flux_values
 
-    pos = np.array(pos)
+def plot_apertures(ax, pos, ap_size=10, r_in=20, r_out=30, back_photo=True):
 
+    '''
+    Draw apertures (and background annuli) around a list of stars.
 
-    #plt.imshow(image,origin='lower')
+    Parameters:
+    -----------
+    ax : axis class
+        axis of a subplot.
+    pos : 2darray
+        A list of positions in x,y pixel coordinates for each star.
+        Needs to be as [[0,0],[1,1]...]
+    ap_size : int
+        The radius of a circular aperture in pixel size
+    r_in : int
+        The inner radius of background aperture in pixel size
+        (Ignore if back_photo=False)
+    r_out : int
+        The outer radius of background aperture in pixel size
+        (Ignore if back_photo=False)
+    back_photo : bool
+        Set to True to draw the background annuli too
+    '''
+
+    pos = np.array(pos)
+    name_stars = ['Star {}'.format(i) for i in range(np.shape(pos)[0])]
 
     for i in range(len(name_stars)):
         circle1 = plt.Circle((pos[i,0], pos[i,1]), ap_size, color='black',fill=False,zorder=100)
         ax.add_artist(circle1)
-        plt.axhline(pos[i,1],xmin=pos[i,0]/100.-.01,xmax=pos[i,0]/100.+.02,color='black')
-        plt.axvline(pos[i,0],ymin=pos[i,1]/100.-.01,ymax=pos[i,1]/100.+.02,color='black')
-        plt.text(pos[i,0]+ap_size+1, pos[i,1], name_stars[i],zorder=11)
-        #print pos[i,1]
-        #print pos[i,0]
+        ax.axhline(pos[i,1],xmin=pos[i,0]/100.-.01,xmax=pos[i,0]/100.+.02,color='black')
+        ax.axvline(pos[i,0],ymin=pos[i,1]/100.-.01,ymax=pos[i,1]/100.+.02,color='black')
+        ax.text(pos[i,0]+ap_size+1, pos[i,1], name_stars[i],zorder=11)
 
         if back_photo == True:
             circle2 = plt.Circle((pos[i,0], pos[i,1]), r_in, color='cyan',fill=False,zorder=10)
             circle3 = plt.Circle((pos[i,0], pos[i,1]), r_out, color='cyan',fill=False,zorder=10)
             ax.add_artist(circle2)
             ax.add_artist(circle3)
-    #aperture.plot(origin=(0,0),indices=None,ax=ax,fill=False)
-    #plt.ion()
 
+def photometry(ax, image,pos,ap_size=10,r_in=20,r_out=30,back_photo=True):
 
+    '''
+    Create apertures around specified list of stars
 
+    Parameters:
+    -----------
+    ax : axis class
+        axis of a subplot. (If None, don't plot anything.)
+    image : ndarray
+        Image for aperture photometry to be performed on.
+    pos : 2darray
+        A list of positions in x,y pixel coordinates for each star.
+        Needs to be as [[0,0],[1,1]...]
+    ap_size : int
+        The radius of a circular aperture in pixel size
+    r_in : int
+        The inner radius of background aperture in pixel size
+        (Ignore if back_photo=False)
+    r_out : int
+        The outer radius of background aperture in pixel size
+        (Ignore if back_photo=False)
+    back_photo : bool
+        Set to True if want to return an array of background values, False
+        to ignore anything to do with background
 
-    phot_table = photutils.aperture_photometry(image,aperture)
-    flux_values = phot_table['aperture_sum'].data #gets a list of the total flux in specified aperture for each star
+    Returns
+    -------
+    photometry of each star : array
+    average background pixel value around each star : array (If back_photo=True)
+    plots image with the aperture and centroids located for each star
+    '''
+
+    if ax is not None:
+        plot_apertures(ax, pos, ap_size=ap_size, r_in=r_in, r_out=r_out, back_photo=back_photo)
 
+    # measure this one image (as a stack of one)
     if back_photo == True:
-        back_table = photutils.aperture_photometry(image,back_aperture)
-        area = np.pi*(r_out**2-r_in**2)
-        a = np.ones((np.shape(image)[0],np.shape(image)[1]))
-        area = photutils.aperture_photometry(a,back_aperture)
-        back_values = back_table['aperture_sum'].data/area['aperture_sum'].data
-        return flux_values,back_values*np.pi*ap_size**2
+        flux_values, back_values = cube_photometry(image, pos, ap_size=ap_size, r_in=r_in, r_out=r_out, back_photo=True)
+        return flux_values[0], back_values[0]
     else:
-        return flux_values
+        return cube_photometry(image, pos, ap_size=ap_size, back_photo=False)[0]
@@ -0,0 +1,188 @@
+'''
+This module contains a way to summarize an MCMC chain (quantiles, the
+most probable sample, the covariance, and the effective number of
+independent samples) in a single pass, reading only a chunk of the chain
+at a time, so it works the same for chains in memory or on disk.
+'''
+
+from .imports import *
+
+class _StreamingHistogram:
+    '''
+    A histogram (for each parameter) that can be filled in chunks,
+    without knowing the range ahead of time. Whenever a value falls
+    outside the current range, the range is doubled (toward that side)
+    by merging neighboring bins in pairs, so the counts stay exact.
+    '''
+
+    def __init__(self, ndim, nbins=100000):
+        self.nbins = nbins + nbins % 2
+        self.counts = np.zeros((ndim, self.nbins))
+        self.lower = None
+        self.width = None
+
+    def add(self, flat):
+        '''
+        Add an (n, ndim) array of samples.
+        '''
+        lo, hi = flat.min(axis=0), flat.max(axis=0)
+        if self.lower is None:
+            # start with the range of the first chunk (with a little room)
+            span = np.where(hi > lo, hi - lo, np.maximum(np.abs(lo), 1.0))
+            self.lower = lo - 0.05*span
+            self.width = 1.1*span/self.nbins
+
+        half = self.nbins//2
+        for j in range(len(self.lower)):
+            # double the range until it covers these samples
+            while hi[j] >= self.lower[j] + self.nbins*self.width[j]:
+                merged = self.counts[j].reshape(half, 2).sum(axis=1)
+                self.counts[j] = np.concatenate([merged, np.zeros(half)])
+                self.width[j] *= 2
+            while lo[j] < self.lower[j]:
+                merged = self.counts[j].reshape(half, 2).sum(axis=1)
+                self.counts[j] = np.concatenate([np.zeros(half), merged])
+                self.lower[j] -= self.nbins*self.width[j]
+                self.width[j] *= 2
+
+            # count up the samples
+            i = ((flat[:, j] - self.lower[j])/self.width[j]).astype(int)
+            self.counts[j] += np.bincount(np.clip(i, 0, self.nbins - 1), minlength=self.nbins)
+
+    def quantiles(self, q):
+        '''
+        Interpolate the percentiles `q` of each parameter.
+        '''
+        result = []
+        for j in range(len(self.counts)):
+            edges = self.lower[j] + self.width[j]*np.arange(self.nbins + 1)
+            cdf = np.concatenate([[0], np.cumsum(self.counts[j])])/np.sum(self.counts[j])*100
+            result.append(np.interp(q, cdf, edges))
+        return np.array(result)
+
+def summarize_chain(chain, lnprob=None, names=None,
+                    q=[16., 50., 84.],
+                    discard=0, thin=1,
+                    chunksize=1000, batchsize=50,
+                    nbins=100000):
+    '''
+    Summarize an MCMC chain after burn-in, in one pass,
+    reading `chunksize` steps at a time.
+
+    Parameters
+    ----------
+    chain : array
+        The chain, with shape (nsaved, nwalkers, ndim), like
+        `sampler.get_chain()` (or a memory-mapped file, like
+        `ChainBackend.memmap()`, which will only be read a chunk at a time).
+
+    lnprob : array
+        The log probabilities, with shape (nsaved, nwalkers), like
+        `sampler.get_log_prob()`. (Needed only to find the most probable sample.)
+
+    names : list of str
+        The names of the parameters.
+
+    q : list
+        The percentiles to calculate.
+
+    discard : int
+        How many (unthinned) steps to skip at the start, for burn-in.
+
+    thin : int
+        Only every `thin`-th step was saved in the chain.
+
+    chunksize : int
+        About how many saved steps to read at once.
+
+    batchsize : int
+        How many saved steps go into each "batch" when estimating the
+        effective sample size (it should be a few autocorrelation times).
+
+    nbins : int
+        How many histogram bins to use for each parameter's quantiles.
+
+    Returns
+    -------
+    summary : dict
+        A dictionary with...
+            'quantiles' : {name:array of percentiles}
+            'mean' : {name:mean}
+            'covariance' : an (ndim, ndim) covariance matrix
+            'map' : {name:value} for the most probable sample (if `lnprob` was given)
+            'map_lnprob' : the log probability of that sample
+            'tau' : {name:autocorrelation time, in unthinned steps}
+            'ess' : {name:effective number of independent samples}
+            'nsamples' : the total number of samples summarized
+    '''
+
+    nsaved, nwalkers, ndim = np.shape(chain)
+    names = names or ['p{}'.format(i) for i in range(ndim)]
+    start = int(np.ceil(discard/thin))
+    if start >= nsaved:
+        raise ValueError('There are no steps left after discarding {} for burn-in.'.format(discard))
+
+    # read whole batches at a time
+    chunksize = np.maximum(chunksize//batchsize, 1)*batchsize
+
+    histogram = _StreamingHistogram(ndim, nbins=nbins)
+    shift = None
+    n, total, outer = 0, np.zeros(ndim), np.zeros((ndim, ndim))
+    nbatches, batchtotal, batchsquares = 0, np.zeros(ndim), np.zeros(ndim)
+    best, highest = None, -np.inf
+
+    for i in range(start, nsaved, chunksize):
+        chunk = np.array(chain[i:i + chunksize], dtype=float)
+        flat = chunk.reshape(-1, ndim)
+
+        # (subtract off the first chunk's mean, to keep the sums accurate)
+        if shift is None:
+            shift = flat.mean(axis=0)
+
+        # the quantiles
+        histogram.add(flat)
+
+        # the mean and covariance
+        d = flat - shift
+        n += len(d)
+        total += d.sum(axis=0)
+        outer += d.T.dot(d)
+
+        # the means of each walker over batches of steps
+        ncomplete = len(chunk)//batchsize
+        if ncomplete > 0:
+            batches = chunk[:ncomplete*batchsize].reshape(ncomplete, batchsize, nwalkers, ndim).mean(axis=1) - shift
+            nbatches += ncomplete*nwalkers
+            batchtotal += batches.reshape(-1, ndim).sum(axis=0)
+            batchsquares += (batches.reshape(-1, ndim)**2).sum(axis=0)
+
+        # the most probable sample
+        if lnprob is not None:
+            lp = np.array(lnprob[i:i + chunksize], dtype=float)
+            k = np.unravel_index(np.argmax(lp), lp.shape)
+            if lp[k] > highest:
+                best, highest = chunk[k], lp[k]
+
+    mean = total/n
+    covariance = outer/n - np.outer(mean, mean)
+    variance = np.diag(covariance)
+
+    # the autocorrelation time, from how much the batch means scatter
+    if nbatches > 1:
+        batchmean = batchtotal/nbatches
+        batchvariance = (batchsquares - nbatches*batchmean**2)/(nbatches - 1)
+        tau = np.maximum(batchsize*batchvariance/variance, 1.0)
+    else:
+        tau = np.full(ndim, np.nan)
+    ess = n/tau
+
+    summary = dict(quantiles=dict(zip(names, histogram.quantiles(q))),
+                   mean=dict(zip(names, mean + shift)),
+                   covariance=covariance,
+                   tau=dict(zip(names, tau*thin)),
+                   ess=dict(zip(names, ess)),
+                   nsamples=n)
+    if lnprob is not None:
+        summary['map'] = dict(zip(names, best))
+        summary['map_lnprob'] = highest
+    return summary
@@ -2,8 +2,23 @@ from .test_lightcurves import *
 from .test_statistics import *
 from .test_models import *
 from .test_fitting import *
+from .test_objectives import *
+from .test_multistart import *
+from .test_batch import *
+from .test_cache import *
+from .test_mcmc import *
+from .test_chains import *
+from .test_convergence import *
+from .test_summaries import *
+from .test_joint import *
+from .test_noise import *
 from .test_tools import *
 from .test_photometry import *
+from .test_extraction import *
+from .test_centroid import *
+from .test_growth import *
+from .test_differential import *
+from .test_detection import *
 from .test_tpf import *
 from .test_imaging import *
 from .test_photometry import *
@@ -0,0 +1,55 @@
+from ..batch import *
+from ..fitting import setup_transit_model
+from ..modeling import simulate_transit_data
+from ..utilities import mkdir
+
+directory = 'examples'
+mkdir(directory)
+
+def test_batch(N=4, period=1.58):
+    '''
+    This tests fitting a bunch of light curves, including a broken one,
+    and then resuming the (already finished) batch.
+    '''
+    filename = os.path.join(directory, 'batch-fit-results.csv')
+    if os.path.exists(filename):
+        os.remove(filename)
+
+    lcs = [('planet{}'.format(i), simulate_transit_data(period=period, t0=0.3, radius=0.05+0.02*i, b=0.385)) for i in range(N)]
+    model = setup_transit_model(period=period, t0=[0.2, 0.4], radius=[0.0, 0.2], a=[3.0, 30.0])
+    bounds = {'planet0':dict(t0=0.3), 'planet1':dict(nonsense=[0, 1])}
+
+    for processes in [1, 2]:
+        results = batch_fit(lcs, model, filename=filename, bounds=bounds, processes=processes)
+        assert(len(results) == N)
+        assert(list(results['status']).count('failed') == 1)
+        for row in results[results['status'] == 'ok']:
+            i = int(row['name'][-1])
+            assert(np.abs(row['radius'] - (0.05 + 0.02*i)) < 0.01)
+
+    # the final results can also be written as a columnar table
+    for extension in ['ecsv', 'fits']:
+        table_filename = os.path.join(directory, 'batch-fit-results.{}'.format(extension))
+        results = batch_fit(lcs, model, filename=filename, bounds=bounds, processes=1, table_filename=table_filename)
+        table = Table.read(table_filename)
+        assert(list(table['name']) == list(results['name']))
+        assert(table['radius'].dtype.kind == 'f')
+    return results
+
+def test_batch_baseline(period=1.58):
+    '''
+    This tests that the chi-squared includes a solved-for
+    polynomial baseline (here, a sloped one).
+    '''
+    filename = os.path.join(directory, 'batch-fit-baseline.csv')
+    if os.path.exists(filename):
+        os.remove(filename)
+
+    lc = simulate_transit_data(period=period, t0=0.3, radius=0.1, b=0.385, duration=1.0)
+    lc.flux = lc.flux*(1 + 0.01*(lc.time - np.mean(lc.time)))
+    model = setup_transit_model(period=period, t0=[0.2, 0.4], radius=[0.0, 0.2], a=[3.0, 30.0])
+    results = batch_fit([('sloped', lc)], model, filename=filename, processes=1, baseline_order=1)
+    row = results[0]
+    assert(row['status'] == 'ok')
+    assert(row['chisq'] < 1.2*row['npoints'])
+    return results
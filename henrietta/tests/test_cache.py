@@ -0,0 +1,63 @@
+from ..cache import *
+from ..fitting import setup_transit_model
+from ..modeling import simulate_transit_data
+from ..objectives import compiled_fit
+from astropy.modeling import fitting
+
+def test_cache(period=1.58):
+    '''
+    This tests that a repeated fit comes out of the cache,
+    and that invalidating and evicting fits works.
+    '''
+    cache = FitCache(os.path.join('examples', 'fit-cache'))
+    cache.clear()
+
+    lc = simulate_transit_data(period=period, t0=0.3, radius=0.1, b=0.385)
+    model = setup_transit_model(period=period, t0=[0.2, 0.4], radius=[0.0, 0.2], a=[3.0, 30.0])
+
+    for fitter in [compiled_fit, fitting.SimplexLSQFitter()]:
+        first = cache.fit(fitter, model, lc.time, lc.flux, weights=1/lc.flux_err)
+        again = cache.fit(fitter, model, lc.time, lc.flux, weights=1/lc.flux_err)
+        assert(np.all(first.parameters == again.parameters))
+    assert(len(cache.keys()) == 2)
+
+    # changing the bounds should make a different fit
+    model.bounds['radius'] = [0.05, 0.15]
+    key = cache.key(model, lc.time, lc.flux, weights=1/lc.flux_err, fitter=compiled_fit)
+    assert(cache.get(key) is None)
+    cache.fit(compiled_fit, model, lc.time, lc.flux, weights=1/lc.flux_err)
+    cache.invalidate(key)
+    assert(cache.get(key) is None)
+
+    # shrinking the cache should evict the least recently used fits
+    cache.maxsize = cache.size() - 1
+    cache.evict()
+    assert(len(cache.keys()) == 1)
+    return cache
+
+def test_cache_baseline(period=1.58):
+    '''
+    This tests that a fit with a solved-for polynomial baseline comes
+    back out of the cache with its baseline (and a chi-squared that
+    includes it), and that evicting copes with files that vanish.
+    '''
+    cache = FitCache(os.path.join('examples', 'fit-cache-baseline'))
+    cache.clear()
+
+    lc = simulate_transit_data(period=period, t0=0.3, radius=0.1, b=0.385, duration=1.0)
+    lc.flux = lc.flux*(1 + 0.01*(lc.time - np.mean(lc.time)))
+    model = setup_transit_model(period=period, t0=[0.2, 0.4], radius=[0.0, 0.2], a=[3.0, 30.0])
+
+    first = cache.fit(compiled_fit, model, lc.time, lc.flux, weights=1/lc.flux_err, baseline_order=1)
+    again = cache.fit(compiled_fit, model, lc.time, lc.flux, weights=1/lc.flux_err, baseline_order=1)
+    assert(np.allclose(first.baseline_coefficients, again.baseline_coefficients))
+    assert(np.all(first.parameters == again.parameters))
+    assert(again.cache_diagnostics['chisq'] < 1.2*len(lc.time))
+
+    # (pretend another process deleted a fit while we were evicting)
+    keys = cache.keys()
+    cache.keys = lambda: keys + ['vanished']
+    cache.maxsize = 0
+    cache.evict()
+    assert(len(os.listdir(cache.directory)) == 0)
+    return cache
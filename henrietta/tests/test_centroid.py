@@ -1,11 +1,50 @@
-from henrietta.photometry import *
-import numpy as np
-import matplotlib.pyplot as plt
-import illumination as il
+from ..photometry.centroid import *
+from ..photometry.cartoons import create_test_array
 
-def test_photometry():
-    ax = plt.subplot(111)
+def fake_stars(positions, N=3, size=40, sigma=1.3, peak=2000.0, seed=42):
+    '''
+    Make a stack of noisy images of Gaussian stars at known positions.
+    '''
+    np.random.seed(seed)
+    y, x = np.mgrid[:size, :size]
+    model = np.zeros((size, size)) + 30.0
+    for x0, y0 in positions:
+        model += peak*np.exp(-0.5*((x - x0)**2 + (y - y0)**2)/sigma**2)
+    return np.random.normal(model, np.sqrt(model), (N, size, size))
+
+def test_centroid():
+    '''
+    This tests the simple centroid for one image (like before).
+    '''
     im = create_test_array(N=1, xsize=100, ysize=100, nstars=10, single=False,seed=7)
-    test = mean_centroid(im,[50,50],boxsize=60.,num_stars=1)
-    print test
+    test = mean_centroid(im[0],[[50,50]],boxsize=60)
+    assert(test.shape == (1, 2))
     return test
+
+def test_batch_centroids():
+    '''
+    This tests finding lots of stars in lots of images at once,
+    with and without the 2D Gaussian refinement.
+    '''
+    true = np.array([[10.3, 12.8], [28.6, 25.1], [1.2, 38.0]])
+    cube = fake_stars(true)
+    guess = np.round(true) + [[1, -1], [-1, 0], [0, 1]]
+    for refine in [False, True]:
+        centroids = batch_centroids(cube, guess, boxsize=9, refine=refine)
+        assert(centroids.shape == (3, 3, 2))
+        assert(np.all(np.abs(centroids[:, :2] - true[:2]) < 0.1))
+        assert(np.all(np.isfinite(centroids[:, 2])))
+    return centroids
+
+def test_degenerate_centroids():
+    '''
+    This tests that a star whose box is entirely off the image
+    doesn't stop the other stars from being refined.
+    '''
+    true = np.array([[10.3, 12.8], [28.6, 25.1]])
+    cube = fake_stars(true)
+    alone = batch_centroids(cube, true, boxsize=9, refine=True)
+    both = batch_centroids(cube, np.vstack([true, [[-50, -50]]]), boxsize=9, refine=True)
+    assert(np.allclose(both[:, :2], alone))
+    assert(np.all(np.isnan(both[:, 2])))
+    return both
@@ -0,0 +1,61 @@
+from ..chains import *
+from ..mcmc import mcmc_fit
+from ..fitting import setup_transit_model
+from ..modeling import simulate_transit_data
+from ..utilities import mkdir
+
+directory = 'examples'
+mkdir(directory)
+
+def test_backend(nwalkers=10, ndim=3, nsteps=50, thin=2):
+    '''
+    This tests writing, resuming, and summarizing an on-disk chain.
+    '''
+    filename = os.path.join(directory, 'test-chain.dat')
+    for f in [filename, filename + '.json']:
+        if os.path.exists(f):
+            os.remove(f)
+
+    backend = ChainBackend(filename, nwalkers=nwalkers, ndim=ndim, thin=thin)
+    coords = np.random.normal(0, 1, (nsteps, nwalkers, ndim))
+    lnprob = -0.5*np.sum(coords**2, axis=2)
+    backend.append(coords[:10], lnprob[:10])
+
+    # a partially-written step should get thrown away when reopened
+    with open(filename, 'ab') as f:
+        f.write(b'oops')
+    backend = ChainBackend(filename)
+    assert(backend.nsaved == 10)
+    assert(backend.thin == thin)
+
+    # reopening with a different thinning shouldn't be allowed
+    try:
+        ChainBackend(filename, thin=thin + 1)
+        assert(False)
+    except ValueError:
+        pass
+    backend.append(coords[10:], lnprob[10:])
+
+    assert(backend.nsteps == nsteps*thin)
+    assert(np.all(backend.get_chain() == coords.transpose(1, 0, 2)))
+    best, highest = backend.best(chunksize=7)
+    assert(highest == np.max(lnprob))
+    percentiles = backend.percentiles([50.], chunksize=7)
+    assert(np.allclose(percentiles['p0'], np.median(coords[:, :, 0]), atol=0.05))
+    return backend
+
+def test_streamed_mcmc(period=1.58, nsteps=60):
+    '''
+    This tests streaming an MCMC to disk, and then resuming it.
+    '''
+    filename = os.path.join(directory, 'test-mcmc-chain.dat')
+    for f in [filename, filename + '.json']:
+        if os.path.exists(f):
+            os.remove(f)
+
+    lc = simulate_transit_data(period=period, t0=0.3, duration=1.0)
+    model = setup_transit_model(period=period, t0=[0.25, 0.35], radius=[0.05, 0.2], a=[3.0, 30.0])
+    results = mcmc_fit(model, lc, nsteps=nsteps//2, processes=1, backend=filename, thin=3, blocksize=4)
+    results = mcmc_fit(model, lc, nsteps=nsteps, processes=1, backend=filename, thin=3, blocksize=4)
+    assert(results.chain.shape == (100, nsteps//3, 3))
+    return results
@@ -0,0 +1,39 @@
+from ..convergence import *
+from ..mcmc import mcmc_fit
+from ..fitting import setup_transit_model
+from ..modeling import simulate_transit_data
+
+def test_monitor(nwalkers=20, ndim=2, nsteps=2000, rho=0.9):
+    '''
+    This tests the convergence monitor on fake chains with
+    a known autocorrelation time, (1 + rho)/(1 - rho) = 19 steps.
+    '''
+    chain = np.zeros((nsteps, nwalkers, ndim))
+    for i in range(1, nsteps):
+        chain[i] = rho*chain[i-1] + np.random.normal(0, 1, (nwalkers, ndim))
+
+    monitor = ConvergenceMonitor(check_every=100, ntau=20, tolerance=0.1)
+    for n in range(100, nsteps + 1, 100):
+        if monitor.due(n) and monitor.update(chain[:n]):
+            break
+    assert(monitor.converged)
+    assert(np.all((monitor.tau > 10) & (monitor.tau < 30)))
+    assert(len(monitor.history(names=['x', 'y'])) == len(monitor.iterations))
+    assert(monitor.burnin(n) < n)
+    return monitor
+
+def test_early_stopping(period=1.58, nsteps=2000):
+    '''
+    This tests that an MCMC stops early once it has converged.
+    '''
+    lc = simulate_transit_data(period=period, t0=0.3, duration=1.0)
+    model = setup_transit_model(period=period, t0=[0.25, 0.35], radius=[0.05, 0.2], a=[3.0, 30.0], b=0.0)
+    monitor = ConvergenceMonitor(check_every=50, ntau=5, tolerance=0.5)
+    results = mcmc_fit(model, lc, nsteps=nsteps, processes=1, monitor=monitor)
+    diagnostics = results.diagnostics
+    assert(monitor.converged)
+    assert(diagnostics['nsteps'] < nsteps)
+    assert(diagnostics['burnin'] < diagnostics['nsteps'])
+    assert(set(diagnostics['tau'].keys()) == set(['t0', 'radius', 'a']))
+    monitor.plot(names=results.variable_names)
+    return results
@@ -0,0 +1,37 @@
+from ..photometry.detection import *
+from .test_centroid import fake_stars
+
+def test_find_sources():
+    '''
+    This tests finding stars automatically on a median image.
+    '''
+    true = np.array([[10.3, 12.8], [28.6, 25.1], [45.2, 40.7], [15.5, 44.1]])
+    cube = fake_stars(true, N=5, size=60)
+    positions, peaks = find_sources(cube, threshold=5, fwhm=3)
+    assert(len(positions) == len(true))
+    assert(np.all(np.diff(peaks) <= 0))
+    _, distance = ApertureIndex(true).nearest(*positions.T)
+    assert(np.all(distance < 0.3))
+
+    # only keep the brightest few
+    positions, peaks = find_sources(cube, max_sources=2)
+    assert(len(positions) == 2)
+    return positions
+
+def test_aperture_index():
+    '''
+    This tests looking up the closest aperture, and checking for overlaps.
+    '''
+    index = ApertureIndex()
+    assert(index.nearest(1.0, 2.0)[0] == -1)
+    index.add([[0, 0], [10, 0], [20, 0]])
+    assert(index.nearest(9.0, 1.0)[0] == 1)
+    index.remove(1)
+    assert(len(index) == 2)
+    assert(index.nearest(9.0, 1.0)[0] == 0)
+    assert(list(index.overlapping([[19, 0], [10, 0]], 5)) == [True, False])
+
+    # drop the fainter of any stars that are too close together (or to existing apertures)
+    keep = separate_sources([[50, 50], [52, 50], [60, 50], [1, 0]], 5, existing=index.positions)
+    assert(list(keep) == [True, False, True, False])
+    return index
@@ -0,0 +1,46 @@
+from ..photometry.differential import *
+
+def test_ensemble_photometry(N=200, nstars=30):
+    '''
+    This tests dividing lots of stars by ensembles of the others,
+    with a few variable stars that should get rejected.
+    '''
+    np.random.seed(42)
+    time = np.linspace(0, 1, N)
+    truth = np.ones((N, nstars))
+    truth[:, [3, 7]] *= 1 + 0.05*np.sin(2*np.pi*time)[:, np.newaxis]
+    model = np.random.uniform(1e4, 1e5, nstars)*truth*(1 - 0.2*time)[:, np.newaxis]
+    flux_err = np.sqrt(model)
+    flux = np.random.normal(model, flux_err)
+    flux[10, 5] = np.nan
+
+    for e in [flux_err, None]:
+        ensemble = EnsemblePhotometry(flux, flux_err=e)
+        assert(ensemble.flux.shape == (N, nstars))
+        assert(list(np.where(ensemble.variable)[0]) == [3, 7])
+        assert(np.isnan(ensemble.flux[10, 5]))
+
+        # the trend should be gone, and the errors should match the scatter
+        residuals = ensemble.flux/truth - 1
+        constant = ~np.isin(np.arange(nstars), [3, 7])
+        assert(np.nanmax(np.abs(np.nanmedian(residuals[:, constant], axis=0))) < 1e-3)
+        pull = np.nanstd(residuals/ensemble.flux_err, axis=0)
+        assert(np.all((pull > 0.7) & (pull < 1.3)))
+    return ensemble
+
+def test_differential_lightcurves(N=50):
+    '''
+    This tests making differential light curves out of a dictionary
+    of LightCurves, with only some of the stars as comparisons.
+    '''
+    np.random.seed(42)
+    time = np.arange(N)
+    trend = 1 + 0.1*np.sin(time)
+    lightcurves = {k:LightCurve(time=time, flux=np.random.normal(f*trend, 1.0))
+                   for k, f in zip('abcd', [1e3, 2e3, 3e3, 4e3])}
+    differential = differential_lightcurves(lightcurves, targets=['a', 'b'], comparisons=['b', 'c', 'd'])
+    assert(set(differential.keys()) == set(['a', 'b']))
+    for k in differential:
+        assert(np.std(differential[k].flux) < 0.01)
+        assert(np.all(np.isfinite(differential[k].flux_err)))
+    return differential
@@ -0,0 +1,118 @@
+from ..photometry.extraction import *
+from ..photometry.cartoons import create_test_array
+from astropy.stats import sigma_clipped_stats
+
+def test_extract_photometry(radius=3.5):
+    '''
+    This tests measuring lots of apertures in a stack of images at once,
+    against photutils (one image at a time).
+    '''
+    cube = create_test_array(N=4, xsize=60, ysize=50, nstars=10, seed=7)
+    positions = [[20.3, 30.1], [40.0, 10.7], [1.0, 1.0]]
+    flux, sky = extract_photometry(cube, positions, aperture_radius=radius)
+    aperture = photutils.CircularAperture(positions, r=radius)
+    for i, image in enumerate(cube):
+        expected = photutils.aperture_photometry(image, aperture)['aperture_sum']
+        assert(np.allclose(flux[i], expected))
+    assert(np.all(sky == 0))
+
+    flux, sky = extract_photometry(cube, positions, aperture_radius=radius,
+                                   subtract_background=True, background_radii=[6, 10])
+    assert(np.all(sky[:, :2] > 0))
+    return flux, sky
+
+def test_extract_lightcurves(N=5):
+    '''
+    This tests making light curves, with times attached.
+    '''
+    cube = create_test_array(N=N, xsize=60, ysize=50, nstars=10, seed=7)
+    time = 2458000 + np.arange(N)/24.0
+    lightcurves = extract_lightcurves(cube, [[20, 30], [40, 10]], time=time, names=['a', 'b'])
+    assert(set(lightcurves.keys()) == set(['a', 'b']))
+    assert(np.all(lightcurves['a'].time == time))
+
+    # the uncertainties should match the scatter of a steady star
+    np.random.seed(3)
+    cube = np.random.poisson(100, (200, 40, 40)).astype(float)
+    cube[:, 18:22, 18:22] += np.random.poisson(1000, (200, 4, 4))
+    for subtract_background in [False, True]:
+        lightcurves = extract_lightcurves(cube, [[19.5, 19.5]], aperture_radius=4, gain=1.0,
+                                          subtract_background=subtract_background, background_radii=[8, 15])
+        lc = lightcurves['0']
+        assert(np.isclose(np.median(lc.flux_err), np.std(lc.flux), rtol=0.15))
+    return lightcurves
+
+def test_sigma_clipped_background():
+    '''
+    This tests the batched sigma-clipped background against astropy,
+    with padding (and some pixels that really are zero).
+    '''
+    np.random.seed(42)
+    values = np.random.normal(10, 1, (6, 4, 50))
+    values[..., ::7] += 30
+    values[..., 1] = 0.0
+    mask = np.arange(50)[np.newaxis, :] < np.array([[50], [31], [2], [0]])
+    median, std = sigma_clipped_background(values, mask)
+    for i in range(6):
+        for j in range(3):
+            _, expected_median, expected_std = sigma_clipped_stats(values[i, j][mask[j]])
+            assert(np.isclose(median[i, j], expected_median))
+            assert(np.isclose(std[i, j], expected_std))
+    assert(np.all(np.isnan(median[:, 3])))
+    return median, std
+
+def test_tracking_photometry():
+    '''
+    This tests apertures that follow drifting stars,
+    and apertures that move by known amounts.
+    '''
+    cube = create_test_array(N=30, xsize=80, ysize=80, nstars=6, drift=0.3, seed=4)
+    fixed, _ = extract_photometry(cube, [[56, 62]], aperture_radius=4)
+    tracked, _ = extract_photometry(cube, [[56, 62]], aperture_radius=4, track=True)
+    assert(fixed[-1, 0] < 0.5*fixed[0, 0])
+    assert(np.isclose(tracked[-1, 0], tracked[0, 0], rtol=0.05))
+
+    positions = [[20.3, 30.1], [40.0, 10.7]]
+    offsets = np.array([[0.0, 0.0], [1.26, -0.52]])
+    flux, _ = extract_photometry(cube[:2], positions, aperture_radius=3.5, offsets=offsets, subpixels=100)
+    for i in range(2):
+        aperture = photutils.CircularAperture(np.array(positions) + offsets[i], r=3.5)
+        expected = photutils.aperture_photometry(cube[i], aperture)['aperture_sum']
+        assert(np.allclose(flux[i], expected, rtol=1e-3))
+    return tracked
+
+def test_template_cache():
+    '''
+    This tests that the cached templates match photutils,
+    get reused, and get forgotten when the cache is full.
+    '''
+    positions = [[20.3, 30.1], [40.0, 10.7], [-1.5, 3.2]]
+    for method in ['exact', 'center']:
+        aperture = photutils.CircularAperture(positions, r=3.5)
+        expected = masks_to_weights(aperture.to_mask(method=method), (50, 60))
+        assert(np.allclose((aperture_weights(positions, (50, 60), 3.5, method=method) - expected).data, 0))
+        annulus = photutils.CircularAnnulus(positions, 6, 10)
+        expected = masks_to_weights(annulus.to_mask(method=method), (50, 60))
+        assert(np.allclose((annulus_weights(positions, (50, 60), 6, 10, method=method) - expected).data, 0))
+
+    # by default, lots of apertures share templates (rounded to 1/100 of a pixel),
+    # but exact centers can still be asked for
+    positions = [[20.3001, 30.1], [25.3002, 33.1], [30.2, 40.4]]
+    for subpixels, ntemplates in [(100, 2), (None, 3)]:
+        template_cache.clear()
+        weights = aperture_weights(positions, (50, 60), 3.5, subpixels=subpixels)
+        assert(len(template_cache.templates) == ntemplates)
+    expected = masks_to_weights(photutils.CircularAperture(positions, r=3.5).to_mask(method='exact'), (50, 60))
+    assert(np.allclose((weights - expected).data, 0))
+
+    cache = TemplateCache()
+    for radius in [3, 4, 3]:
+        cache.aperture(radius, 0.1, 0.2)
+    assert((cache.hits, cache.misses) == (1, 2))
+
+    # shrinking the cache should forget the least recently used template
+    cache.maxsize = cache.size
+    cache.aperture(2)
+    assert(len(cache.templates) == 2)
+    assert(('aperture', 4.0, 0.1, 0.2, 'exact') not in cache.templates)
+    return cache
@@ -0,0 +1,27 @@
+from ..photometry.growth import *
+from .test_centroid import fake_stars
+
+def test_curve_of_growth():
+    '''
+    This tests measuring the curves of growth for a few stars,
+    and picking the best aperture radius.
+    '''
+    true = np.array([[20.0, 20.0], [8.3, 30.6]])
+    cube = fake_stars(true, N=10, size=60, sigma=1.5, peak=500.0)
+    cog = curve_of_growth(cube, true, rmax=10, background_radii=[12, 18])
+
+    radii = np.arange(1, 10, 0.5)
+    flux = cog.flux(radii)
+    assert(flux.shape == (2, len(radii)))
+
+    # the flux should level off at the total flux of the star
+    total = 2*np.pi*500.0*1.5**2
+    assert(np.all(np.abs(flux[:, -1]/total - 1) < 0.1))
+
+    # the best radius should be a couple of sigma (not tiny, not huge)
+    best = cog.best_radius(radii)
+    assert(np.all((best > 1.5) & (best < 6)))
+    assert(cog.best_radius(radii, each=False) in radii)
+    for method in ['scatter', 'expected']:
+        assert(np.all(cog.noise(radii, method=method) > 0))
+    return cog
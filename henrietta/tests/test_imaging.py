@@ -1,5 +1,7 @@
 from ..imports import *
 from ..imaging import visualize, io, simulations
+from ..imaging.registration import register_images
+from ..photometry.cartoons import create_test_array
 from ..utilities import mkdir
 
 directory = 'examples'
@@ -33,3 +35,18 @@ def test_io():
 def test_rgb():
     r, g, b = cartoon_rgb()
     visualize.display_rgb(r, g, b)
+
+def test_registration():
+    '''
+    This tests measuring the shifts of a drifting stack of images.
+    '''
+    cube = create_test_array(N=10, xsize=100, ysize=80, nstars=60, drift=0.4, seed=5)
+    offsets = register_images(cube, reference=0)
+    assert(offsets.shape == (10, 2))
+    assert(np.allclose(offsets[0], 0))
+
+    # the stars drift in a straight line, by 0.4 pixels per image
+    distance = np.sqrt(np.sum(offsets**2, axis=1))
+    assert(np.allclose(distance, 0.4*np.arange(10), atol=0.15))
+    assert(np.allclose(register_images(cube, threads=1), offsets))
+    return offsets
@@ -0,0 +1,70 @@
+from ..joint import *
+from ..fitting import setup_transit_model
+from ..modeling import simulate_transit_data
+
+def make_datasets(period=1.58, t0=0.3, radius=0.1, a=10.0):
+    '''
+    Simulate one short-cadence and one long-cadence light curve of the same planet.
+    '''
+    short = simulate_transit_data(period=period, t0=t0, radius=radius, a=a, duration=1.0, cadence=2.0/60/24)
+    long = simulate_transit_data(period=period, t0=t0, radius=radius, a=a, duration=1.0, cadence=30.0/60/24)
+    datasets = {}
+    for name, lc, options in [('short', short, {}),
+                              ('long', long, dict(supersample=5, exptime=30.0/60/24))]:
+        model = setup_transit_model(period=period, t0=[0.25, 0.35], radius=[0.05, 0.2],
+                                    a=[3.0, 30.0], b=0.0, baseline=[0.9, 1.1])
+        datasets[name] = dict(model=model, lc=lc, **options)
+    return datasets
+
+def test_joint(nwalkers=10):
+    '''
+    This tests that the joint likelihood adds up the separate ones.
+    '''
+    datasets = make_datasets()
+    joint = JointLikelihood(datasets)
+    assert(joint.free_names == ['t0', 'radius', 'a', 'baseline_short', 'baseline_long'])
+    thetas = np.random.uniform(joint.bounds[:, 0], joint.bounds[:, 1], (nwalkers, joint.ndim))
+    separate = np.sum([joint.likelihoods[k](t) for k, t in joint.split(thetas).items()], axis=0)
+    assert(np.allclose(joint(thetas), separate))
+    assert(np.isclose(joint(thetas[0]), separate[0]))
+    return joint
+
+def test_joint_fit():
+    '''
+    This tests fitting two datasets at once.
+    '''
+    joint = JointLikelihood(make_datasets())
+    best, models = joint_fit(joint)
+    assert(np.isclose(best['radius'], 0.1, rtol=0.1))
+    assert(set(models.keys()) == set(['short', 'long']))
+    return best
+
+def test_joint_mcmc_fit(nsteps=50):
+    '''
+    This tests a short joint MCMC.
+    '''
+    results = joint_mcmc_fit(make_datasets(), nsteps=nsteps, processes=1, baseline_order=0)
+    max_likelihood, sampler = results
+    assert(set(max_likelihood.keys()) == set(['t0', 'radius', 'a']))
+    results.plot_models()
+    return results
+
+def test_joint_gp(nwalkers=10):
+    '''
+    This tests a joint likelihood with correlated noise in each dataset.
+    '''
+    datasets = make_datasets()
+    joint = JointLikelihood(datasets, gp=True)
+    assert('gp_log_sigma_short' in joint.free_names)
+    assert('gp_log_tau_long' in joint.free_names)
+    thetas = np.random.uniform(joint.bounds[:, 0], joint.bounds[:, 1], (nwalkers, joint.ndim))
+    separate = np.sum([joint.likelihoods[k](t) for k, t in joint.split(thetas).items()], axis=0)
+    assert(np.allclose(joint(thetas), separate))
+
+    # (keywords the sampler doesn't know about shouldn't be silently ignored)
+    try:
+        joint_mcmc_fit(datasets, nsteps=2, processes=1, notakeyword=True)
+        assert(False)
+    except TypeError:
+        pass
+    return joint
@@ -0,0 +1,113 @@
+from ..mcmc import *
+from ..fitting import setup_transit_model
+from ..modeling import simulate_transit_data
+
+def test_likelihood(period=1.58, t0=0.3, radius=0.1, a=10.0, nwalkers=10):
+    '''
+    This tests that the likelihood gives the same answers
+    for one walker at a time or for many at once.
+    '''
+    lc = simulate_transit_data(period=period, t0=t0, radius=radius, a=a, duration=1.0)
+    lc.flux[0] = np.nan
+    model = setup_transit_model(period=period, t0=[0.2, 0.4], radius=[0.05, 0.2], a=[3.0, 30.0])
+    for baseline_order in [None, 0]:
+        likelihood = TransitLikelihood(model, lc, baseline_order=baseline_order)
+        thetas = np.random.uniform(likelihood.bounds[:, 0], likelihood.bounds[:, 1], (nwalkers, likelihood.ndim))
+        thetas[0, 1] = 2.0
+        together = likelihood(thetas)
+        assert(together[0] == -np.inf)
+        assert(np.allclose(together, [likelihood(t) for t in thetas]))
+        assert(np.allclose(together[1:], [lnprob(t, model, lc, baseline_order) for t in thetas[1:]]))
+
+    # the t0 limits should come from the good times, in any order
+    shuffled = lc[np.random.permutation(len(lc.time))]
+    shuffled.time[[0, -1]] = np.nan
+    likelihood = TransitLikelihood(model, shuffled)
+    good = np.isfinite(shuffled.time) & np.isfinite(shuffled.flux)
+    assert((likelihood.tmin, likelihood.tmax) == (np.min(shuffled.time[good]), np.max(shuffled.time[good])))
+    assert(np.isfinite(likelihood([t0, radius, a])))
+    return likelihood
+
+def test_pooled(period=1.58, nwalkers=12):
+    '''
+    This tests scoring walkers in a pool of processes.
+    '''
+    lc = simulate_transit_data(period=period, t0=0.3, duration=1.0)
+    model = setup_transit_model(period=period, t0=[0.2, 0.4], radius=[0.05, 0.2], a=[3.0, 30.0])
+    likelihood = TransitLikelihood(model, lc)
+    thetas = np.random.uniform(likelihood.bounds[:, 0], likelihood.bounds[:, 1], (nwalkers, likelihood.ndim))
+    pooled = PooledLikelihood(likelihood, processes=2)
+    try:
+        assert(np.allclose(pooled(thetas), likelihood(thetas)))
+    finally:
+        pooled.close()
+
+    # an existing pool should get one chunk per worker (not per CPU)
+    pool = multiprocessing.Pool(2)
+    try:
+        pooled = PooledLikelihood(likelihood, pool=pool)
+        assert(pooled.processes == 2)
+        assert(np.allclose(pooled(thetas), likelihood(thetas)))
+    finally:
+        pool.terminate()
+
+    # (a pool that doesn't say how big it is needs `processes`)
+    class SerialPool:
+        def map(self, function, chunks):
+            return [function(chunk) for chunk in chunks]
+    try:
+        PooledLikelihood(likelihood, pool=SerialPool())
+        assert(False)
+    except ValueError:
+        pass
+    assert(np.allclose(PooledLikelihood(likelihood, processes=3, pool=SerialPool())(thetas), likelihood(thetas)))
+
+def test_mcmc_fit(period=1.58, t0=0.3, radius=0.1, nsteps=100):
+    '''
+    This tests a short, headless MCMC, with plots made afterward.
+    '''
+    lc = simulate_transit_data(period=period, t0=t0, radius=radius, duration=1.0)
+    model = setup_transit_model(period=period, t0=[0.25, 0.35], radius=[0.05, 0.2], a=[3.0, 30.0], b=0.0)
+    results = mcmc_fit(model, lc, nsteps=nsteps, processes=1)
+    max_likelihood, sampler = results
+    assert(set(max_likelihood.keys()) == set(['t0', 'radius', 'a']))
+    results.plot()
+    return results
+
+def test_initialize(period=1.58, t0=0.3, radius=0.1, a=10.0, nwalkers=20):
+    '''
+    This tests starting the walkers in a ball around the mode.
+    '''
+    lc = simulate_transit_data(period=period, t0=t0, radius=radius, a=a, duration=1.0)
+    model = setup_transit_model(period=period, t0=[0.25, 0.35], radius=[0.05, 0.2], a=[3.0, 30.0], b=0.0)
+    likelihood = TransitLikelihood(model, lc)
+    mode, lnp = find_mode(likelihood)
+    assert(np.allclose(mode, [t0, radius, a], rtol=0.1))
+    covariance = local_covariance(likelihood, mode)
+    assert(np.all(np.diag(covariance) > 0))
+    p0 = initialize_walkers(likelihood, nwalkers)
+    assert(p0.shape == (nwalkers, likelihood.ndim))
+    assert(np.all(np.isfinite(likelihood(p0))))
+    assert(np.all(np.std(p0, axis=0) < 0.1*np.ptp(likelihood.bounds, axis=1)))
+    return p0
+
+def test_predictive_bands(period=1.58, t0=0.3, radius=0.1, nsteps=100, npoints=50):
+    '''
+    This tests calculating posterior-predictive bands (and the best model)
+    after an MCMC.
+    '''
+    lc = simulate_transit_data(period=period, t0=t0, radius=radius, duration=1.0)
+    model = setup_transit_model(period=period, t0=[0.25, 0.35], radius=[0.05, 0.2], a=[3.0, 30.0], b=0.0)
+    for baseline_order in [None, 1]:
+        results = mcmc_fit(model, lc, nsteps=nsteps, processes=1, baseline_order=baseline_order)
+        time, bands = results.predictive_bands(ndraws=50, npoints=npoints)
+        assert(bands.shape == (5, npoints))
+        assert(np.all(np.diff(bands, axis=0) >= 0))
+        assert(np.all(np.abs(bands[2] - 1) < 2*radius**2))
+
+        # the best model at new times should match it at the data times
+        best = results.best_model()
+        assert(np.allclose(results.best_model(time=lc.time), best))
+        assert(np.allclose(results.best_model(time=lc.time[::3]), best[::3]))
+        assert(np.shape(results.best_model(time=time)) == (npoints,))
+    return time, bands
@@ -0,0 +1,31 @@
+from ..multistart import *
+from ..optimizers import batch_guessncheck
+from ..objectives import Objective
+from ..fitting import setup_transit_model
+from ..modeling import simulate_transit_data
+
+def test_multistart(period=1.58, t0=0.3, radius=0.1, a=10.0):
+    '''
+    This tests fitting a transit from lots of starting points at once.
+    '''
+    lc = simulate_transit_data(period=period, t0=t0, radius=radius, a=a, b=0.385)
+    model = setup_transit_model(period=period, t0=[0.0, 1.0], radius=[0.05, 0.2], a=[3.0, 30.0])
+    for processes in [1, 2]:
+        best, optima = multistart_fit(model, lc.time, lc.flux, weights=1/lc.flux_err,
+                                      nstarts=4, nguesses=100, processes=processes)
+        assert(len(optima) == 4)
+        assert(np.abs(best.t0.value - t0) < 0.01)
+    return best, optima
+
+def test_batch_guessncheck(period=1.58, t0=0.3, radius=0.1, a=10.0, N=50):
+    '''
+    This tests checking lots of guesses at once.
+    '''
+    lc = simulate_transit_data(period=period, t0=t0, radius=radius, a=a, b=0.385)
+    model = setup_transit_model(period=period, t0=[0.0, 1.0], radius=[0.05, 0.2], a=[3.0, 30.0])
+    parameters, gof = batch_guessncheck(model, lc.time, lc.flux, weights=1/lc.flux_err, N=N)
+    assert(parameters.shape == (N, len(model.parameters)))
+    assert(np.all(np.diff(gof) >= 0))
+    objective = Objective(model, lc.time, lc.flux, weights=1/lc.flux_err)
+    assert(np.allclose(gof, [objective(p[objective.compiled.free_index]) for p in parameters]))
+    return parameters, gof
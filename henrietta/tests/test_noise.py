@@ -0,0 +1,36 @@
+from ..noise import *
+from ..mcmc import TransitLikelihood, mcmc_fit
+from ..fitting import setup_transit_model
+from ..modeling import simulate_transit_data
+
+def test_exponential_gp(N=300):
+    '''
+    This tests that the linear-time likelihood matches the slow, dense one.
+    '''
+    time = np.random.uniform(0, 5, N)
+    flux_err = np.random.uniform(1e-3, 2e-3, N)
+    residuals = np.random.normal(0, 2e-3, N)
+    gp = ExponentialGP(time, flux_err)
+    for sigma, tau in [(1e-3, 0.1), (1e-2, 10.0), (1e-4, 1e-3)]:
+        assert(np.isclose(gp.lnlikelihood(residuals, sigma, tau), gp.dense_lnlikelihood(residuals, sigma, tau)))
+    return gp
+
+def test_benchmark_gp():
+    '''
+    This tests the Gaussian process benchmark (on small datasets).
+    '''
+    timings = benchmark_gp(sizes=[100, 1000], densemax=100, repeats=1)
+    assert(len(timings) == 2)
+    return timings
+
+def test_gp_mcmc(period=1.58, nsteps=20):
+    '''
+    This tests sampling a transit with correlated noise.
+    '''
+    lc = simulate_transit_data(period=period, t0=0.3, duration=1.0)
+    model = setup_transit_model(period=period, t0=[0.25, 0.35], radius=[0.05, 0.2], a=[3.0, 30.0], b=0.0)
+    likelihood = TransitLikelihood(model, lc, gp=True)
+    assert(likelihood.free_names == ['t0', 'radius', 'a', 'gp_log_sigma', 'gp_log_tau'])
+    results = mcmc_fit(model, lc, nsteps=nsteps, processes=1, gp=True)
+    assert(set(results.max_likelihood.keys()) == set(likelihood.free_names))
+    return results
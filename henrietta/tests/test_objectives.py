@@ -0,0 +1,75 @@
+from ..objectives import *
+from ..fitting import setup_transit_model
+from ..modeling import simulate_transit_data
+
+def test_compiled(period=1.58, t0=0.3, radius=0.1, a=10.0):
+    '''
+    This tests that a compiled transit model matches the astropy one.
+    '''
+    lc = simulate_transit_data(period=period, t0=t0, radius=radius, a=a)
+    model = setup_transit_model(period=period, t0=[0.2, 0.4], radius=[0.05, 0.2], a=[3.0, 30.0])
+    compiled = compile_model(model, lc.time)
+    assert(compiled.free_names == ['t0', 'radius', 'a'])
+    theta = [t0, radius, a]
+    assert(np.allclose(compiled(theta), compiled.update(model, theta)(lc.time)))
+    assert(compiled.batch([theta, theta]).shape == (2, len(lc.time)))
+
+def test_compiled_fit(period=1.58, t0=0.3, radius=0.1, a=10.0):
+    '''
+    This tests fitting a transit with a compiled objective.
+    '''
+    lc = simulate_transit_data(period=period, t0=t0, radius=radius, a=a, b=0.385)
+    model = setup_transit_model(period=period, t0=[0.25, 0.35], radius=[0.05, 0.2], a=[3.0, 30.0])
+    fitted = compiled_fit(model, lc.time, lc.flux, weights=1/lc.flux_err)
+    assert(np.abs(fitted.radius.value - radius) < 0.01)
+    return fitted
+
+def test_benchmark(period=1.58, N=100):
+    '''
+    This compares the speed of the astropy and compiled objectives,
+    for a short light curve (where the overhead matters most).
+    '''
+    lc = simulate_transit_data(period=period, t0=0.3, duration=0.5, cadence=0.01)
+    model = setup_transit_model(period=period, t0=[0.2, 0.4])
+    timing = benchmark_objective(model, lc.time, lc.flux, weights=1/lc.flux_err, N=N)
+    assert(timing['compiled'] < timing['astropy'])
+    return timing
+
+def test_baseline(period=1.58, t0=0.3, radius=0.1, a=10.0, baseline=1.02):
+    '''
+    This tests solving for the baseline exactly, instead of searching for it.
+    '''
+    lc = simulate_transit_data(period=period, t0=t0, radius=radius, a=a, b=0.385, baseline=baseline)
+    model = setup_transit_model(period=period, t0=[0.25, 0.35], radius=[0.05, 0.2], a=[3.0, 30.0], baseline=[0.9, 1.1])
+    for order in [0, 1]:
+        objective = compile_objective(model, lc.time, lc.flux, weights=1/lc.flux_err, baseline_order=order)
+        assert('baseline' not in objective.compiled.free_names)
+        fitted = compiled_fit(model, lc.time, lc.flux, weights=1/lc.flux_err, baseline_order=order)
+        assert(np.abs(fitted.baseline.value - baseline) < 0.001)
+        assert(len(fitted.baseline_coefficients) == order + 1)
+    return fitted
+
+def test_batch(period=1.58, t0=0.3, radius=0.1, a=10.0, N=20):
+    '''
+    This tests that the batched models and goodnesses of fit match
+    calculating them one set of parameters at a time.
+    '''
+    lc = simulate_transit_data(period=period, t0=t0, radius=radius, a=a, b=0.385)
+    model = setup_transit_model(period=period, t0=[0.25, 0.35], radius=[0.05, 0.2], a=[3.0, 30.0], baseline=[0.9, 1.1])
+    thetas = np.transpose([np.random.uniform(0.25, 0.35, N), np.full(N, radius),
+                           np.full(N, a), np.random.uniform(0.9, 1.1, N)])
+    for supersample in [1, 3]:
+        compiled = CompiledModel(model, lc.time, supersample=supersample, exptime=0.02)
+        assert(np.allclose(compiled.batch(thetas), [compiled(theta) for theta in thetas]))
+    for order in [None, 1]:
+        objective = compile_objective(model, lc.time, lc.flux, weights=1/lc.flux_err, baseline_order=order)
+        free = thetas[:, :objective.compiled.ndim] # (no baseline, if it's solved for)
+        assert(np.allclose(objective.batch(free), [objective(theta) for theta in free]))
+
+    # (models that aren't batman get calculated for every row at once)
+    from astropy.modeling.models import Gaussian1D
+    gaussian = Gaussian1D(amplitude=1.0, mean=0.0, stddev=1.0)
+    compiled = CompiledModel(gaussian, np.linspace(-3, 3, 50))
+    thetas = np.random.uniform(0.5, 2.0, (N, 3))
+    assert(np.allclose(compiled.batch(thetas), [compiled(theta) for theta in thetas]))
+    return objective
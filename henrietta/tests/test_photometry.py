@@ -9,5 +9,88 @@ def test_photometry():
     test = photometry(ax,im[0],[[54,91],[44,38]],ap_size=3,r_in=8,r_out=12,back_photo=True)
     return test
 
+def test_cube_photometry():
+    '''
+    This tests measuring a whole stack of images at once,
+    against photutils (one image at a time).
+    '''
+    import photutils
+    cube = create_test_array(N=3, xsize=100, ysize=100, nstars=10, single=False,seed=7)
+    pos = [[54,91],[44,38],[3,50]]
+    flux, back = cube_photometry(cube,pos,ap_size=3,r_in=8,r_out=12,back_photo=True)
+    assert(flux.shape == (3, 3))
+
+    # (the background is the average in the part of the annulus
+    # that's on the image, times the area of the aperture)
+    aperture = photutils.CircularAperture(pos, r=3)
+    annulus = photutils.CircularAnnulus(pos, r_in=8, r_out=12)
+    area = photutils.aperture_photometry(np.ones(cube[0].shape), annulus)['aperture_sum']
+    for i in range(len(cube)):
+        expected_flux = photutils.aperture_photometry(cube[i], aperture)['aperture_sum']
+        expected_back = photutils.aperture_photometry(cube[i], annulus)['aperture_sum']/area*np.pi*3**2
+        assert(np.allclose(flux[i], expected_flux))
+        assert(np.allclose(back[i], expected_back))
+    return flux, back
+
+def test_interactive_aperture():
+    '''
+    This tests that an aperture can use photometry that was measured
+    for it (like a Loupe does, for all its apertures at once),
+    or measure its own.
+    '''
+    from types import SimpleNamespace
+    from henrietta.photometry.apertures import InteractiveAperture
+    im = create_test_array(N=1, xsize=100, ysize=100, nstars=10, single=False, seed=7)[0]
+    loupe = SimpleNamespace(image=im, aperture_radius=3, background_radii=[8, 12], subtract_background=True)
+    a = InteractiveAperture(name='a', pos=(54, 91), loupe=loupe, aperture_radius=3)
+    a.update(plot=False)
+    flux, sky = extract_photometry(im[np.newaxis], [[54, 91]], aperture_radius=3,
+                                   subtract_background=True, background_radii=[8, 12])
+    assert(np.isclose(a.table['flux'][0], flux[0, 0]))
+    assert(np.isclose(a.table['sky'][0], sky[0, 0]))
+    a.update(flux=1.0, sky=2.0, plot=False)
+    assert(a.table['flux'][0] == 1.0)
+    return a
+
+def test_aperture_group(N=50):
+    '''
+    This tests drawing lots of apertures together (like a Loupe
+    does for stars it finds), and taking some of them away again.
+    '''
+    from types import SimpleNamespace
+    from henrietta.photometry.apertures import InteractiveAperture, ApertureGroup
+    im = create_test_array(N=1, xsize=100, ysize=100, nstars=10, single=False, seed=7)[0]
+    loupe = SimpleNamespace(image=im, aperture_radius=3, background_radii=[8, 12], subtract_background=False)
+    positions = np.random.uniform(10, 90, (N, 2))
+    apertures = [InteractiveAperture(name='{}'.format(i), pos=p, loupe=loupe, aperture_radius=3)
+                 for i, p in enumerate(positions)]
+    fig, ax = plt.subplots()
+    ax.imshow(im)
+    group = ApertureGroup(apertures, ax)
+    assert(len(ax.collections) == 3)
+    assert(len(ax.texts) == N)
+    assert(np.allclose(group.plotted['circle'].get_offsets(), positions))
+
+    # changing the radii should change all the circles
+    loupe.aperture_radius, loupe.subtract_background = 4, True
+    for a in apertures:
+        a.update(plot=True)
+    assert(group.plotted['background_outer_circle'].get_visible())
+    assert(group.radii == (4, 8, 12, True))
+
+    # erasing an aperture should take it out of the group
+    apertures[0].erase()
+    assert(len(group.plotted['circle'].get_offsets()) == N - 1)
+    assert(len(ax.texts) == N - 1)
+    for a in apertures[1:]:
+        a.erase()
+    assert(len(ax.collections) == 0)
+    assert(len(ax.lines) == 0)
+    plt.close(fig)
+    return group
+
 if __name__ == '__main__':
     test_photometry()
+    test_cube_photometry()
+    test_interactive_aperture()
+    test_aperture_group()
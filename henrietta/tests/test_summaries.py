@@ -0,0 +1,27 @@
+from ..summaries import *
+
+def test_summarize(nsteps=1000, nwalkers=20, rho=0.8):
+    '''
+    This tests summarizing a fake chain (with a known mean,
+    covariance, and autocorrelation time) a chunk at a time.
+    '''
+    chain = np.zeros((nsteps, nwalkers, 2))
+    for i in range(1, nsteps):
+        chain[i] = rho*chain[i-1] + np.random.normal(0, 1, (nwalkers, 2))
+    chain[:, :, 1] = 100 + 10*chain[:, :, 1]
+    lnprob = -0.5*chain[:, :, 0]**2
+
+    summary = summarize_chain(chain, lnprob=lnprob, names=['x', 'y'], discard=100, chunksize=75)
+    flat = chain[100:].reshape(-1, 2)
+
+    for j, k in enumerate(['x', 'y']):
+        assert(np.allclose(summary['quantiles'][k], np.percentile(flat[:, j], [16., 50., 84.]), atol=0.01*np.std(flat[:, j])))
+        assert(np.isclose(summary['mean'][k], np.mean(flat[:, j])))
+    assert(np.allclose(summary['covariance'], np.cov(flat.T, bias=True)))
+    assert(summary['map_lnprob'] == np.max(lnprob[100:]))
+    assert(summary['nsamples'] == len(flat))
+
+    # the autocorrelation time should be about (1 + rho)/(1 - rho) = 9
+    assert(np.all([3 < summary['tau'][k] < 20 for k in 'xy']))
+    assert(np.all([summary['ess'][k] < len(flat) for k in 'xy']))
+    return summary